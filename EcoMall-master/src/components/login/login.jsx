@@ -3,7 +3,7 @@ import React, { useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import styles from './Login.module.css';
 import { FaUser, FaLock, FaArrowRight } from 'react-icons/fa';
-import { postJson } from '../../services/api';
+import { postJson, setAuthTokens } from '../../services/api';
 import { useAuth } from '../../context/AuthContext.jsx';
 
 const Login = () => {
@@ -23,6 +23,7 @@ const Login = () => {
       setSubmitting(true);
       const res = await postJson('/EcoMall/login/', { email, password });
       if (res?.user) {
+        setAuthTokens(res);
         setUser(res.user);
       }
       setSuccess(res?.message || 'Login successful');
@@ -2,7 +2,7 @@ import React, { useState } from 'react';
 import { useNavigate, Link } from 'react-router-dom';
 import styles from './Register.module.css';
 import { FaUser, FaEnvelope, FaLock, FaPhone, FaArrowRight } from 'react-icons/fa';
-import { postJson } from '../../services/api';
+import { postJson, setAuthTokens } from '../../services/api';
 import { useAuth } from '../../context/AuthContext.jsx';
 
 const Register = () => {
@@ -55,6 +55,7 @@ const Register = () => {
       setSubmitting(true);
       const res = await postJson('/EcoMall/register/', payload);
       if (res?.user) {
+        setAuthTokens(res);
         setUser(res.user);
       }
       setSuccess(res?.message || 'Registered successfully');
@@ -1,4 +1,5 @@
 import React, { createContext, useContext, useEffect, useMemo, useState } from 'react';
+import { AUTH_EXPIRED_EVENT, clearAuthTokens, getAuthTokens } from '../services/api';
 
 const AuthContext = createContext(null);
 
@@ -6,7 +7,8 @@ export function AuthProvider({ children }) {
   const [user, setUser] = useState(() => {
     try {
       const raw = localStorage.getItem('auth_user');
-      return raw ? JSON.parse(raw) : null;
+      // A user saved without tokens (older session) has to sign in again
+      return raw && getAuthTokens() ? JSON.parse(raw) : null;
     } catch {
       return null;
     }
@@ -14,9 +16,19 @@ export function AuthProvider({ children }) {
 
   useEffect(() => {
     if (user) localStorage.setItem('auth_user', JSON.stringify(user));
-    else localStorage.removeItem('auth_user');
+    else {
+      localStorage.removeItem('auth_user');
+      clearAuthTokens();
+    }
   }, [user]);
 
+  // The refresh token was rejected too: the session is over
+  useEffect(() => {
+    const onExpired = () => setUser(null);
+    window.addEventListener(AUTH_EXPIRED_EVENT, onExpired);
+    return () => window.removeEventListener(AUTH_EXPIRED_EVENT, onExpired);
+  }, []);
+
   const value = useMemo(() => ({ user, setUser, logout: () => setUser(null) }), [user]);
 
   return <AuthContext.Provider value={value}>{children}</AuthContext.Provider>;
@@ -1,8 +1,8 @@
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useCartWishlist } from '../context/CartWishlistContext.jsx';
 import { useAuth } from '../context/AuthContext.jsx';
-import { postJson } from '../services/api';
+import { getJson, postJson } from '../services/api';
 import { FaMinus, FaPlus, FaMapMarkerAlt, FaTrash, FaHeart, FaEdit, FaTimes } from 'react-icons/fa';
 
 export default function Cart() {
@@ -63,6 +63,8 @@ export default function Cart() {
 
   // Place order state
   const [placing, setPlacing] = useState(false);
+  // Idempotency key of the checkout being placed, with the body it was sent with
+  const checkoutRef = useRef(null);
 
   const loadRazorpayScript = () => new Promise((resolve) => {
     if (window.Razorpay) return resolve(true);
@@ -92,11 +94,26 @@ export default function Cart() {
         quantity: p.quantity || 1,
         price: extractUnitPrice(p),
       }));
-      const createRes = await postJson('/EcoMall/create-order/', {
+      const orderBody = {
         user_id: user.user_id,
         items: itemsPayload,
         total_amount: Number(total.toFixed(2)),
+      };
+      // One key per checkout, kept across retries so the server hands back the
+      // order it already created; a changed cart is a new checkout (the server
+      // rejects a key reused with a different body)
+      const signature = JSON.stringify(orderBody);
+      if (checkoutRef.current?.signature !== signature) {
+        checkoutRef.current = { key: crypto.randomUUID(), signature };
+      }
+      let createRes = await postJson('/EcoMall/create-order/', orderBody, {
+        'Idempotency-Key': checkoutRef.current.key,
       });
+      // The Razorpay order is created in the background; poll until it exists
+      for (let i = 0; i < 30 && createRes?.payment_id && createRes.status === 'pending'; i++) {
+        await new Promise((r) => setTimeout(r, 500));
+        createRes = await getJson(`/EcoMall/payments/${createRes.payment_id}/`);
+      }
       if (!createRes || !createRes.razorpay_order_id) {
         throw new Error('Failed to create Razorpay order.');
       }
@@ -121,7 +138,8 @@ export default function Cart() {
               razorpay_order_id: response.razorpay_order_id,
               razorpay_payment_id: response.razorpay_payment_id,
               razorpay_signature: response.razorpay_signature,
-            });
+            }, { 'Idempotency-Key': `verify-${response.razorpay_payment_id}` });
+            checkoutRef.current = null; // paid: the next checkout gets a new key
             // Clear cart locally
             for (const p of cart) {
               // best-effort; ignore failures
@@ -1,5 +1,6 @@
 import React from 'react';
 import { useParams, useLocation, Link } from 'react-router-dom';
+import { authFetch } from '../services/api';
 
 export default function Invoice() {
   const { orderId } = useParams();
@@ -26,7 +27,7 @@ export default function Invoice() {
     const id = orderId || data.order_id;
     if (!id) return;
     try {
-      const res = await fetch(`/EcoMall/invoice/${id}/pdf/`, {
+      const res = await authFetch(`/EcoMall/invoice/${id}/pdf/`, {
         method: 'GET',
         headers: { 'Accept': 'application/pdf' }
       });
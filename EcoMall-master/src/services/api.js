@@ -2,12 +2,89 @@
 // With Vite proxy configured in vite.config.js, we can use a relative base URL
 export const API_BASE_URL = '';
 
-export async function postJson(path, data) {
-  const url = `${API_BASE_URL}${path}`;
-  const res = await fetch(url, {
+// Signed access / refresh tokens issued by login and register. Every request
+// sends the access token as a Bearer header; on a 401 the refresh token is
+// traded for a new pair once and the request is retried.
+const TOKENS_KEY = 'auth_tokens';
+export const AUTH_EXPIRED_EVENT = 'ecomall:auth-expired';
+
+export function getAuthTokens() {
+  try {
+    return JSON.parse(localStorage.getItem(TOKENS_KEY)) || null;
+  } catch {
+    return null;
+  }
+}
+
+export function setAuthTokens(tokens) {
+  if (tokens?.access && tokens?.refresh) {
+    localStorage.setItem(TOKENS_KEY, JSON.stringify({ access: tokens.access, refresh: tokens.refresh }));
+  } else {
+    localStorage.removeItem(TOKENS_KEY);
+  }
+}
+
+export function clearAuthTokens() {
+  localStorage.removeItem(TOKENS_KEY);
+}
+
+export function authHeaders() {
+  const access = getAuthTokens()?.access;
+  return access ? { Authorization: `Bearer ${access}` } : {};
+}
+
+// Shared by concurrent requests that hit a 401 together, so the refresh
+// token is spent only once
+let refreshing = null;
+
+async function refreshAuthTokens() {
+  const refresh = getAuthTokens()?.refresh;
+  if (!refresh) return false;
+  if (!refreshing) {
+    refreshing = (async () => {
+      try {
+        const res = await fetch(`${API_BASE_URL}/EcoMall/token/refresh/`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ refresh }),
+        });
+        if (!res.ok) {
+          clearAuthTokens();
+          // The session is over: AuthContext logs the user out
+          window.dispatchEvent(new Event(AUTH_EXPIRED_EVENT));
+          return false;
+        }
+        setAuthTokens(await res.json());
+        return true;
+      } catch {
+        return false;
+      } finally {
+        refreshing = null;
+      }
+    })();
+  }
+  return refreshing;
+}
+
+// fetch() with the Bearer header, refreshing the tokens once on a 401
+export async function authFetch(path, options = {}) {
+  const send = () => fetch(`${API_BASE_URL}${path}`, {
+    ...options,
+    headers: { ...authHeaders(), ...(options.headers || {}) },
+  });
+  const res = await send();
+  if (res.status === 401 && getAuthTokens() && await refreshAuthTokens()) {
+    return send();
+  }
+  return res;
+}
+
+export async function postJson(path, data, headers = {}) {
+  const res = await authFetch(path, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
+      ...headers,
     },
     body: JSON.stringify(data),
   });
@@ -30,8 +107,7 @@ export async function postJson(path, data) {
 }
 
 export async function getJson(path) {
-  const url = `${API_BASE_URL}${path}`;
-  const res = await fetch(url, {
+  const res = await authFetch(path, {
     method: 'GET',
     headers: {
       'Accept': 'application/json',
@@ -56,8 +132,7 @@ export async function getJson(path) {
 }
 
 export async function deleteJson(path) {
-  const url = `${API_BASE_URL}${path}`;
-  const res = await fetch(url, { method: 'DELETE' });
+  const res = await authFetch(path, { method: 'DELETE' });
   if (res.status === 204) {
     return { ok: true };
   }
@@ -78,8 +153,7 @@ export async function deleteJson(path) {
 }
 
 export async function patchJson(path, data) {
-  const url = `${API_BASE_URL}${path}`;
-  const res = await fetch(url, {
+  const res = await authFetch(path, {
     method: 'PATCH',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify(data)
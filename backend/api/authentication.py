@@ -0,0 +1,114 @@
+"""Signed, stateless API tokens.
+
+``login_user`` issues a short-lived access token and a longer-lived refresh
+token. Both are ``django.core.signing`` strings (compact payload, timestamp,
+HMAC), so verifying one is a signature check in memory - no session table,
+no user lookup. Send the access token as ``Authorization: Bearer <token>``;
+trade the refresh token for a new pair at ``token/refresh/``.
+"""
+from django.conf import settings
+from django.core import signing
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+
+ACCESS_TOKEN_TTL = getattr(settings, 'API_ACCESS_TOKEN_TTL', 15 * 60)
+REFRESH_TOKEN_TTL = getattr(settings, 'API_REFRESH_TOKEN_TTL', 14 * 24 * 3600)
+TOKEN_SECRET = getattr(settings, 'API_TOKEN_SECRET', None)  # defaults to SECRET_KEY
+# Set False only while clients that send a bare user_id (no token) are still deployed
+TOKEN_REQUIRED = getattr(settings, 'API_TOKEN_REQUIRED', True)
+
+_SALT = 'api.authentication'
+ACCESS, REFRESH = 'a', 'r'
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _sign(user_id, kind):
+    return signing.dumps([user_id, kind], key=TOKEN_SECRET, salt=_SALT, compress=True)
+
+
+def verify_token(token, kind=ACCESS):
+    """Return the user_id in a valid, unexpired token of ``kind``; raise InvalidToken otherwise."""
+    max_age = ACCESS_TOKEN_TTL if kind == ACCESS else REFRESH_TOKEN_TTL
+    try:
+        user_id, token_kind = signing.loads(token, key=TOKEN_SECRET, salt=_SALT, max_age=max_age)
+    except signing.SignatureExpired:
+        raise InvalidToken('Token expired')
+    except (signing.BadSignature, TypeError, ValueError):
+        raise InvalidToken('Invalid token')
+    if token_kind != kind:
+        raise InvalidToken('Invalid token')
+    return user_id
+
+
+def issue_tokens(user_id):
+    return {
+        'access': _sign(user_id, ACCESS),
+        'refresh': _sign(user_id, REFRESH),
+        'token_type': 'Bearer',
+        'expires_in': ACCESS_TOKEN_TTL,
+    }
+
+
+def refresh_tokens(refresh_token):
+    """New access / refresh pair for a valid refresh token (raises InvalidToken)."""
+    return issue_tokens(verify_token(refresh_token, REFRESH))
+
+
+class TokenUser:
+    """``request.user`` for token-authenticated requests; carries only the id."""
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+    is_staff = False
+    is_superuser = False
+
+    def __init__(self, user_id):
+        self.user_id = self.pk = self.id = user_id
+
+    def __str__(self):
+        return f'user {self.user_id}'
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """DRF authentication for ``Authorization: Bearer <access token>``.
+
+    No header: the request stays anonymous (the view decides). A bad or
+    expired token: 401.
+    """
+    keyword = b'bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword:
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid Authorization header')
+        try:
+            token = auth[1].decode()
+            return TokenUser(verify_token(token)), token
+        except (UnicodeError, InvalidToken) as e:
+            raise exceptions.AuthenticationFailed(str(e))
+
+    def authenticate_header(self, request):
+        return 'Bearer'
+
+
+def request_user_id(request, claimed):
+    """The acting user for a request: the token's user when authenticated,
+    otherwise the ``claimed`` user_id from the body / query string (unless
+    API_TOKEN_REQUIRED). Raises PermissionDenied (403) when a claimed id
+    disagrees with the token, NotAuthenticated (401) when a token is
+    required and missing.
+    """
+    user = getattr(request, 'user', None)
+    if isinstance(user, TokenUser):
+        if claimed not in (None, '') and str(claimed) != str(user.user_id):
+            raise exceptions.PermissionDenied('user_id does not match the authenticated user')
+        return user.user_id
+    if TOKEN_REQUIRED:
+        raise exceptions.NotAuthenticated()
+    return claimed
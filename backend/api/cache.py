@@ -0,0 +1,253 @@
+"""Response caches for hot, rarely-changing read endpoints.
+
+Most entries are stored through Django's cache framework, so every worker
+shares them once a shared backend (Redis, Memcached) is configured in
+``CACHES``. The hottest ones (item detail) live in a per-process LRU in front
+of the database. Invalidation is driven by the model signals in ``api.signals``.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from .facets import subcategory_facets_uncached
+from .models import Item, MainCategory
+from .pricing import cart_summary
+from .serializers import ItemDetailSerializer, MainCategoryNestedSerializer
+
+
+class LRUCache:
+    """Small thread-safe in-process LRU with optional TTL and hit/miss counters."""
+
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+# -------------------- HEADER MENU TREE --------------------
+MENU_TREE_STATE_KEY = 'menu_tree:state'
+MENU_TREE_TIMEOUT = getattr(settings, 'MENU_TREE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def _new_menu_tree_state():
+    return {'version': uuid.uuid4().hex, 'last_modified': int(time.time())}
+
+
+def _menu_tree_state():
+    state = cache.get(MENU_TREE_STATE_KEY)
+    if state is None:
+        # add() so that concurrent first requests agree on a single version
+        cache.add(MENU_TREE_STATE_KEY, _new_menu_tree_state(), None)
+        state = cache.get(MENU_TREE_STATE_KEY) or _new_menu_tree_state()
+    return state
+
+
+def invalidate_menu_tree():
+    """Start a new menu tree version; the next request rebuilds it."""
+    cache.set(MENU_TREE_STATE_KEY, _new_menu_tree_state(), None)
+
+
+def _build_menu_tree(state):
+    mains = MainCategory.objects.prefetch_related(
+        'categories__sub_categories'
+    ).all().order_by('main_category_name')
+    body = JSONRenderer().render(MainCategoryNestedSerializer(mains, many=True).data)
+    return {
+        'body': body,
+        'etag': quote_etag(hashlib.sha1(body).hexdigest()),
+        'last_modified': state['last_modified'],
+    }
+
+
+def get_menu_tree():
+    """Return the pre-rendered menu tree as ``{'body', 'etag', 'last_modified'}``.
+
+    The entry is keyed by the current version, so a build racing with an
+    invalidation can only ever store data under a version nobody reads again.
+    """
+    state = _menu_tree_state()
+    key = f"menu_tree:{state['version']}"
+    entry = cache.get(key)
+    if entry is None:
+        entry = _build_menu_tree(state)
+        cache.set(key, entry, MENU_TREE_TIMEOUT)
+    return entry
+
+
+# -------------------- SUBCATEGORY FACETS --------------------
+FACETS_TIMEOUT = getattr(settings, 'FACETS_CACHE_TIMEOUT', 60 * 15)
+
+
+def _facets_key(sub_category_id):
+    return f'facets:subcategory:{sub_category_id}'
+
+
+def get_subcategory_facets(sub_category_id):
+    """Facet counts for a whole subcategory, computed once per change."""
+    key = _facets_key(sub_category_id)
+    facets = cache.get(key)
+    if facets is None:
+        facets = subcategory_facets_uncached(sub_category_id)
+        cache.set(key, facets, FACETS_TIMEOUT)
+    return facets
+
+
+def invalidate_subcategory_facets(*sub_category_ids):
+    cache.delete_many([_facets_key(pk) for pk in sub_category_ids if pk is not None])
+
+
+# -------------------- ITEM DETAIL --------------------
+# Per-process; other workers pick up a change once their entry's TTL expires
+item_detail_cache = LRUCache(
+    max_entries=getattr(settings, 'ITEM_DETAIL_CACHE_SIZE', 5000),
+    ttl=getattr(settings, 'ITEM_DETAIL_CACHE_TTL', 300),
+)
+
+
+def item_etag(item_id, updated_at):
+    return quote_etag(f'{item_id}-{int(updated_at.timestamp() * 1_000_000)}')
+
+
+def get_item_detail(item_id):
+    """Return ``{'body', 'etag', 'last_modified'}`` for an item, or None if it does not exist."""
+    entry = item_detail_cache.get(item_id)
+    if entry is None:
+        item = Item.objects.filter(item_id=item_id).first()
+        if item is None:
+            return None
+        entry = {
+            'body': JSONRenderer().render(ItemDetailSerializer(item).data),
+            'etag': item_etag(item.item_id, item.updated_at),
+            'last_modified': int(item.updated_at.timestamp()),
+        }
+        item_detail_cache.set(item_id, entry)
+    return entry
+
+
+def invalidate_item_detail(item_id):
+    item_detail_cache.delete(item_id)
+
+
+# -------------------- PER-USER VERSIONS --------------------
+# Per-user entries are keyed by a version, as the menu tree is: a reader
+# takes the version before it queries, and invalidation starts a new one, so
+# data read before a change can only be stored where nobody looks any more.
+
+def _user_version(prefix, user_id, timeout):
+    key = f'{prefix}:{user_id}:version'
+    version = cache.get(key)
+    if version is None:
+        # add() so that concurrent first readers agree on a single version
+        cache.add(key, uuid.uuid4().hex, timeout)
+        version = cache.get(key) or uuid.uuid4().hex
+    return version
+
+
+def _new_user_versions(prefix, user_ids, timeout):
+    cache.set_many({f'{prefix}:{user_id}:version': uuid.uuid4().hex for user_id in user_ids}, timeout)
+
+
+# -------------------- CART SUMMARY --------------------
+CART_SUMMARY_TIMEOUT = getattr(settings, 'CART_SUMMARY_CACHE_TIMEOUT', 60 * 5)
+
+
+def get_cart_summary(user_id):
+    key = f"cart_summary:{user_id}:{_user_version('cart_summary', user_id, CART_SUMMARY_TIMEOUT)}"
+    summary = cache.get(key)
+    if summary is None:
+        summary = cart_summary(user_id)
+        cache.set(key, summary, CART_SUMMARY_TIMEOUT)
+    return summary
+
+
+def invalidate_cart_summary(*user_ids):
+    _new_user_versions('cart_summary', user_ids, CART_SUMMARY_TIMEOUT)
+
+
+# -------------------- CART / WISHLIST MEMBERSHIP --------------------
+# Item ids in a user's cart / wishlist, for the in_cart / in_wishlist flags on
+# listings. Filled as a side effect of the full cart/wishlist reads; until
+# then the listing computes the flags with EXISTS subqueries instead.
+MEMBERSHIP_TIMEOUT = getattr(settings, 'MEMBERSHIP_CACHE_TIMEOUT', 60 * 30)
+MEMBERSHIP_KINDS = ('cart', 'wishlist')
+
+
+def membership_version(kind, user_id):
+    """Current version of a user's set; take it before reading the rows to store."""
+    return _user_version(f'membership:{kind}', user_id, MEMBERSHIP_TIMEOUT)
+
+
+def _membership_key(kind, user_id, version):
+    return f'membership:{kind}:{user_id}:{version}'
+
+
+def get_membership(kind, user_id):
+    """Cached frozenset of item ids, or None when not cached."""
+    return cache.get(_membership_key(kind, user_id, membership_version(kind, user_id)))
+
+
+def set_membership(kind, user_id, item_ids, version):
+    """Store the set read after ``membership_version`` returned ``version``."""
+    cache.set(_membership_key(kind, user_id, version), frozenset(item_ids), MEMBERSHIP_TIMEOUT)
+
+
+def invalidate_membership(kind, *user_ids):
+    _new_user_versions(f'membership:{kind}', user_ids, MEMBERSHIP_TIMEOUT)
+
+
+def invalidate_cart(*user_ids):
+    """Everything derived from a user's cart lines."""
+    invalidate_cart_summary(*user_ids)
+    invalidate_membership('cart', *user_ids)
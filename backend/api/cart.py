@@ -0,0 +1,198 @@
+"""Cart write operations shared by the cart views."""
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from . import cache as api_cache
+from .models import Cart, Item, User
+
+
+CART_BATCH_MAX_OPERATIONS = 100
+CART_OPERATIONS = ('add', 'set', 'remove')
+
+
+def _upsert_lines(user_id, quantities):
+    """One INSERT ... ON DUPLICATE KEY UPDATE (ON CONFLICT elsewhere) adding
+    ``{item_id: quantity}`` to a user's cart; returns the driver's rowcount."""
+    qn = connection.ops.quote_name
+    table = qn(Cart._meta.db_table)
+    user_col, item_col, qty_col, added_col = (
+        qn(Cart._meta.get_field(name).column) for name in ('user', 'item', 'quantity', 'added_at')
+    )
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(quantities))
+    insert = f'INSERT INTO {table} ({user_col}, {item_col}, {qty_col}, {added_col}) VALUES {values}'
+    if connection.vendor == 'mysql':
+        sql = f'{insert} ON DUPLICATE KEY UPDATE {qty_col} = {qty_col} + VALUES({qty_col})'
+    else:
+        sql = f'{insert} ON CONFLICT ({user_col}, {item_col}) DO UPDATE SET {qty_col} = {table}.{qty_col} + excluded.{qty_col}'
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    params = []
+    for item_id, quantity in quantities.items():
+        params += [user_id, item_id, quantity, now]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        affected = cursor.rowcount
+    # Raw SQL sends no signals; drop the cached summary / membership ourselves
+    transaction.on_commit(lambda: api_cache.invalidate_cart(user_id))
+    return affected
+
+
+def add_to_cart(user_id, item_id, quantity=1):
+    """Insert a cart line or add ``quantity`` to the existing one, atomically.
+
+    One INSERT ... ON DUPLICATE KEY UPDATE (ON CONFLICT elsewhere) against the
+    unique (user_id, item_id) constraint: concurrent adds of the same item
+    neither create duplicate lines nor lose increments, and no row lock is
+    held beyond the statement itself. Returns ``(line, created)``.
+    """
+    affected = _upsert_lines(user_id, {item_id: quantity})
+    line = Cart.objects.select_related('item').get(user_id=user_id, item_id=item_id)
+    if connection.vendor == 'mysql':
+        created = affected == 1  # MySQL reports 2 affected rows for the UPDATE branch
+    else:
+        created = line.quantity == quantity  # an existing line already had quantity >= 1
+    return line, created
+
+
+def merge_into_cart(user_id, quantities):
+    """Add ``{item_id: quantity}`` to a user's cart in one multi-row upsert.
+
+    Lines the user already has are incremented, the rest are inserted.
+    Item ids that no longer exist are dropped first (one IN query) so a
+    stale line cannot fail the whole statement. Returns the merged
+    ``{item_id: quantity}``.
+    """
+    quantities = {item_id: qty for item_id, qty in quantities.items() if qty > 0}
+    if not quantities:
+        return {}
+    known = set(Item.objects.filter(item_id__in=quantities).values_list('item_id', flat=True))
+    quantities = {item_id: qty for item_id, qty in quantities.items() if item_id in known}
+    if quantities:
+        _upsert_lines(user_id, quantities)
+    return quantities
+
+
+class CartOperationError(ValueError):
+    """Raised when a batch is rejected; ``results`` holds the per-operation outcome."""
+
+    def __init__(self, results):
+        super().__init__('Invalid cart operations')
+        self.results = results
+
+
+def _parse_operations(operations):
+    """Validate shape and types; returns (parsed ops, per-op errors)."""
+    parsed, errors = [], []
+    for index, raw in enumerate(operations):
+        error = None
+        op = item_id = quantity = None
+        if not isinstance(raw, dict):
+            error = 'operation must be an object'
+        else:
+            op = raw.get('op')
+            try:
+                item_id = int(raw.get('item_id'))
+            except (TypeError, ValueError):
+                error = 'item_id must be an integer'
+            if op not in CART_OPERATIONS:
+                error = 'op must be one of: ' + ', '.join(CART_OPERATIONS)
+            elif op != 'remove' and error is None:
+                try:
+                    quantity = int(raw.get('quantity', 1 if op == 'add' else None))
+                except (TypeError, ValueError):
+                    error = 'quantity must be an integer'
+                else:
+                    if op == 'add' and quantity < 1:
+                        error = 'quantity must be at least 1'
+                    elif op == 'set' and quantity < 0:
+                        error = 'quantity must not be negative'
+        parsed.append((index, op, item_id, quantity))
+        errors.append(error)
+    return parsed, errors
+
+
+def apply_cart_operations(user_id, operations):
+    """Apply add / set / remove operations to a user's cart in one transaction.
+
+    ``add`` increments (or creates) a line, ``set`` replaces the quantity
+    (0 removes the line), ``remove`` deletes it. The whole batch is
+    validated first; if any operation is invalid nothing is written and
+    CartOperationError is raised; an unknown ``user_id`` raises IntegrityError.
+    Returns one result dict per operation.
+    """
+    parsed = validate_cart_operations(operations)
+    try:
+        return _apply_parsed_operations(user_id, parsed)
+    except IntegrityError:
+        # Either a concurrent request inserted one of our new lines after we
+        # locked the cart - it exists now, so a second pass updates it - or
+        # the user does not exist, which no retry fixes.
+        if not User.objects.filter(user_id=user_id).exists():
+            raise
+        return _apply_parsed_operations(user_id, parsed)
+
+
+def validate_cart_operations(operations):
+    """Parse a batch and check its items exist (one IN query).
+
+    Returns ``[(index, op, item_id, quantity), ...]``; raises
+    CartOperationError with per-operation results if anything is invalid.
+    """
+    parsed, errors = _parse_operations(operations)
+    checked = [i for i, (_, op, _, _) in enumerate(parsed) if op != 'remove' and errors[i] is None]
+    if checked:
+        item_ids = {parsed[i][2] for i in checked}
+        known = set(Item.objects.filter(item_id__in=item_ids).values_list('item_id', flat=True))
+        for i in checked:
+            if parsed[i][2] not in known:
+                errors[i] = 'item not found'
+    if any(errors):
+        raise CartOperationError([
+            {'index': index, 'op': op, 'item_id': item_id, 'status': 'error' if error else 'ok', 'error': error}
+            for (index, op, item_id, _), error in zip(parsed, errors)
+        ])
+    return parsed
+
+
+def _apply_parsed_operations(user_id, parsed):
+    with transaction.atomic():
+        lines = {}
+        for line in Cart.objects.select_for_update().filter(user_id=user_id).order_by('cart_id'):
+            lines.setdefault(line.item_id, line)
+        original = {item_id: line.quantity for item_id, line in lines.items()}
+        quantities = dict(original)  # item_id -> quantity after the batch (absent = no line)
+
+        results = []
+        for index, op, item_id, quantity in parsed:
+            before = quantities.get(item_id)
+            if op == 'add':
+                quantities[item_id] = (before or 0) + quantity
+            elif op == 'set' and quantity > 0:
+                quantities[item_id] = quantity
+            else:
+                quantities.pop(item_id, None)
+            results.append({
+                'index': index, 'op': op, 'item_id': item_id, 'status': 'ok',
+                'quantity': quantities.get(item_id, 0),
+                'created': before is None and item_id in quantities,
+            })
+
+        to_create = [
+            Cart(user_id=user_id, item_id=item_id, quantity=qty)
+            for item_id, qty in quantities.items() if item_id not in lines
+        ]
+        to_update = []
+        for item_id, line in lines.items():
+            if item_id in quantities and quantities[item_id] != original[item_id]:
+                line.quantity = quantities[item_id]
+                to_update.append(line)
+        to_delete = [item_id for item_id in lines if item_id not in quantities]
+
+        if to_create:
+            Cart.objects.bulk_create(to_create)
+        if to_update:
+            Cart.objects.bulk_update(to_update, ['quantity'])
+        if to_delete:
+            Cart.objects.filter(user_id=user_id, item_id__in=to_delete).delete()
+        # Bulk writes send no signals; drop the cached summary / membership ourselves
+        transaction.on_commit(lambda: api_cache.invalidate_cart(user_id))
+    return results
@@ -0,0 +1,123 @@
+"""Streaming full-catalog export (NDJSON / CSV) for feed partners.
+
+Rows are read in keyset chunks - ``WHERE (updated_at, item_id) > last``
+for deltas, ``item_id > last`` for a full dump - so memory stays flat
+however large the catalog is. (``QuerySet.iterator()`` alone does not
+guarantee that on MySQL, where the driver buffers the whole result set.)
+"""
+import csv
+import json
+import zlib
+
+from django.db.models import Q
+
+from .models import Item
+from .serializers import format_datetime
+
+
+EXPORT_COLUMNS = (
+    'item_id', 'item_name', 'description',
+    'actual_price', 'selling_price', 'discount_percentage', 'stock_quantity', 'image',
+    'category_id', 'category__category_name', 'sub_category_id', 'sub_category__sub_category_name',
+    'is_new', 'is_trending', 'best_sales', 'created_at', 'updated_at',
+)
+# Output field names, in EXPORT_COLUMNS order
+EXPORT_FIELDS = tuple(
+    {'category__category_name': 'category_name', 'sub_category__sub_category_name': 'sub_category_name'}.get(c, c)
+    for c in EXPORT_COLUMNS
+)
+DEFAULT_CHUNK_SIZE = 1000
+_UPDATED_AT = EXPORT_COLUMNS.index('updated_at')
+_ITEM_ID = EXPORT_COLUMNS.index('item_id')
+
+
+def iter_catalog_rows(updated_since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield ``values_list(*EXPORT_COLUMNS)`` tuples, ordered by item_id, or by
+    (updated_at, item_id) when ``updated_since`` is given."""
+    base = Item.objects.all()
+    if updated_since is None:
+        ordering = ('item_id',)
+        after = None
+        while True:
+            qs = base if after is None else base.filter(item_id__gt=after)
+            chunk = list(qs.order_by(*ordering).values_list(*EXPORT_COLUMNS)[:chunk_size])
+            yield from chunk
+            if len(chunk) < chunk_size:
+                return
+            after = chunk[-1][_ITEM_ID]
+    else:
+        base = base.filter(updated_at__gte=updated_since)
+        ordering = ('updated_at', 'item_id')
+        after = None
+        while True:
+            qs = base
+            if after is not None:
+                ts, pk = after
+                qs = qs.filter(updated_at__gte=ts).filter(Q(updated_at__gt=ts) | Q(item_id__gt=pk))
+            chunk = list(qs.order_by(*ordering).values_list(*EXPORT_COLUMNS)[:chunk_size])
+            yield from chunk
+            if len(chunk) < chunk_size:
+                return
+            after = (chunk[-1][_UPDATED_AT], chunk[-1][_ITEM_ID])
+
+
+def _plain(value):
+    if hasattr(value, 'isoformat'):
+        return format_datetime(value)
+    if value is None or isinstance(value, (int, str)):
+        return value
+    return str(value)  # Decimal
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, map(_plain, row))), ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the caller."""
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(['' if v is None else _plain(v) for v in row])
+
+
+def encoded(lines, batch_bytes=64 * 1024):
+    """UTF-8 encode text lines, coalesced into ~64 KB chunks."""
+    buf, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buf.append(data)
+        size += len(data)
+        if size >= batch_bytes:
+            yield b''.join(buf)
+            buf, size = [], 0
+    if buf:
+        yield b''.join(buf)
+
+
+def gzipped(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+FORMATS = {
+    # name -> (line generator, content type, file extension)
+    'ndjson': (ndjson_lines, 'application/x-ndjson', 'ndjson'),
+    'csv': (csv_lines, 'text/csv', 'csv'),
+}
+
+
+def export_stream(fmt, updated_since=None, gzip=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    lines, _, _ = FORMATS[fmt]
+    stream = encoded(lines(iter_catalog_rows(updated_since, chunk_size)))
+    return gzipped(stream) if gzip else stream
@@ -0,0 +1,91 @@
+"""Server-side filters and facet counts for item listings."""
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+from .models import Item
+
+
+# Upper bounds of the price buckets; the last bucket is open-ended
+PRICE_BUCKETS = getattr(settings, 'FACET_PRICE_BUCKETS', (250, 500, 1000, 2500))
+
+FLAG_FILTERS = {
+    # query param -> condition; flags follow the shelf views (1 = set)
+    'in_stock': Q(stock_quantity__gt=0),
+    'discounted': Q(discount_percentage__gt=0),
+    'new': Q(is_new=1),
+    'trending': Q(is_trending=1),
+}
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+class InvalidFilter(ValueError):
+    pass
+
+
+def _decimal_param(params, name):
+    raw = params.get(name)
+    if raw in (None, ''):
+        return None
+    try:
+        value = Decimal(raw)
+    except (InvalidOperation, TypeError):
+        raise InvalidFilter(f"{name} must be a number")
+    if not value.is_finite():
+        raise InvalidFilter(f"{name} must be a number")
+    return value
+
+
+def item_filters(params):
+    """Build a Q from ``min_price``, ``max_price``, ``min_discount`` and the
+    boolean flags in FLAG_FILTERS. Raises InvalidFilter on bad input."""
+    q = Q()
+    min_price = _decimal_param(params, 'min_price')
+    max_price = _decimal_param(params, 'max_price')
+    min_discount = _decimal_param(params, 'min_discount')
+    if min_price is not None:
+        q &= Q(selling_price__gte=min_price)
+    if max_price is not None:
+        q &= Q(selling_price__lte=max_price)
+    if min_discount is not None:
+        q &= Q(discount_percentage__gte=min_discount)
+    for name, condition in FLAG_FILTERS.items():
+        if (params.get(name) or '').lower() in TRUE_VALUES:
+            q &= condition
+    return q
+
+
+def _price_buckets():
+    lower = 0
+    for upper in PRICE_BUCKETS:
+        yield lower, upper
+        lower = upper
+    yield lower, None
+
+
+def compute_facets(queryset):
+    """Facet counts for ``queryset`` in a single aggregate query."""
+    aggregates = {'total': Count('pk')}
+    for name, condition in FLAG_FILTERS.items():
+        aggregates[name] = Count('pk', filter=condition)
+    buckets = list(_price_buckets())
+    for i, (lower, upper) in enumerate(buckets):
+        condition = Q(selling_price__gte=lower)
+        if upper is not None:
+            condition &= Q(selling_price__lt=upper)
+        aggregates[f'price_{i}'] = Count('pk', filter=condition)
+
+    counts = queryset.aggregate(**aggregates)
+    facets = {'total': counts['total']}
+    for name in FLAG_FILTERS:
+        facets[name] = counts[name]
+    facets['price'] = [
+        {'min': lower, 'max': upper, 'count': counts[f'price_{i}']}
+        for i, (lower, upper) in enumerate(buckets)
+    ]
+    return facets
+
+
+def subcategory_facets_uncached(sub_category_id):
+    return compute_facets(Item.objects.filter(sub_category_id=sub_category_id))
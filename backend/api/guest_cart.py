@@ -0,0 +1,156 @@
+"""Guest (anonymous) carts, kept out of the database until they matter.
+
+A guest cart is keyed by an opaque token handed to the browser and lives in
+a ``GuestCartStore`` - by default an in-process dict; set ``GUEST_CART_STORE``
+to the dotted path of another implementation to share carts between
+workers. Nothing is written to the ``Cart`` table until the shopper logs in
+or checks out, when ``flush_guest_cart`` merges the whole cart into their
+rows with one multi-row upsert.
+"""
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .cart import merge_into_cart
+
+
+GUEST_CART_TTL = getattr(settings, 'GUEST_CART_TTL', 7 * 24 * 3600)
+GUEST_CART_MAX_CARTS = getattr(settings, 'GUEST_CART_MAX_CARTS', 50000)
+GUEST_CART_MAX_LINES = getattr(settings, 'GUEST_CART_MAX_LINES', 100)
+GUEST_CART_MAX_QUANTITY = getattr(settings, 'GUEST_CART_MAX_QUANTITY', 999)
+GUEST_CART_HEADER = 'HTTP_X_GUEST_CART'
+
+_TOKEN_RE = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+class GuestCartFull(ValueError):
+    pass
+
+
+def new_token():
+    return secrets.token_urlsafe(24)
+
+
+def valid_token(token):
+    return isinstance(token, str) and bool(_TOKEN_RE.match(token))
+
+
+class GuestCartStore:
+    """Interface for guest cart storage; lines are ``{item_id: quantity}``.
+
+    Implementations must make ``apply`` and ``pop`` atomic per token.
+    """
+
+    def get(self, token):
+        """Current lines (empty if the token is unknown or expired)."""
+        raise NotImplementedError
+
+    def apply(self, token, operations):
+        """Apply ``(op, item_id, quantity)`` tuples - add / set / remove, as
+        in the cart batch API - and return the resulting lines."""
+        raise NotImplementedError
+
+    def pop(self, token):
+        """Remove the cart and return its lines."""
+        raise NotImplementedError
+
+
+class InMemoryGuestCartStore(GuestCartStore):
+    """Per-process store: least recently used carts are dropped beyond
+    ``max_carts``, and carts idle longer than ``ttl`` seconds expire."""
+
+    def __init__(self, max_carts=GUEST_CART_MAX_CARTS, ttl=GUEST_CART_TTL, max_lines=GUEST_CART_MAX_LINES):
+        self.max_carts = max_carts
+        self.ttl = ttl
+        self.max_lines = max_lines
+        self._carts = OrderedDict()  # token -> (expires_at, {item_id: quantity})
+        self._lock = threading.Lock()
+
+    def _lines(self, token):
+        entry = self._carts.get(token)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._carts[token]
+            return None
+        return entry[1]
+
+    def get(self, token):
+        with self._lock:
+            return dict(self._lines(token) or {})
+
+    def apply(self, token, operations):
+        with self._lock:
+            lines = dict(self._lines(token) or {})
+            for op, item_id, quantity in operations:
+                if op == 'add':
+                    lines[item_id] = min(lines.get(item_id, 0) + quantity, GUEST_CART_MAX_QUANTITY)
+                elif op == 'set' and quantity > 0:
+                    lines[item_id] = min(quantity, GUEST_CART_MAX_QUANTITY)
+                else:
+                    lines.pop(item_id, None)
+            if len(lines) > self.max_lines:
+                raise GuestCartFull(f'A guest cart holds at most {self.max_lines} items')
+            self._carts[token] = (time.monotonic() + self.ttl, lines)
+            self._carts.move_to_end(token)
+            while len(self._carts) > self.max_carts:
+                self._carts.popitem(last=False)
+            return dict(lines)
+
+    def pop(self, token):
+        with self._lock:
+            lines = self._lines(token) or {}
+            self._carts.pop(token, None)
+            return dict(lines)
+
+    def __len__(self):
+        return len(self._carts)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_guest_cart_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                path = getattr(settings, 'GUEST_CART_STORE', None)
+                _store = import_string(path)() if path else InMemoryGuestCartStore()
+    return _store
+
+
+def token_from_request(request):
+    """Guest cart token from the ``X-Guest-Cart`` header, body or query string."""
+    token = request.META.get(GUEST_CART_HEADER)
+    if not token and hasattr(request, 'data'):
+        token = request.data.get('guest_cart_token')
+    if not token:
+        token = request.GET.get('guest_cart_token')
+    return token if valid_token(token) else None
+
+
+def flush_guest_cart(token, user_id):
+    """Move a guest cart into ``user_id``'s Cart rows in one bulk upsert.
+
+    Quantities add to lines the user already has. If the write fails the
+    lines are put back in the store, so nothing is lost. Returns the
+    merged ``{item_id: quantity}``.
+    """
+    store = get_guest_cart_store()
+    lines = store.pop(token)
+    if not lines:
+        return {}
+    try:
+        with transaction.atomic():
+            return merge_into_cart(user_id, lines)
+    except Exception:
+        store.apply(token, [('add', item_id, qty) for item_id, qty in lines.items()])
+        raise
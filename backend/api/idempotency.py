@@ -0,0 +1,225 @@
+"""``Idempotency-Key`` support for the order and payment endpoints.
+
+The first request with a given key runs the view and stores its response
+(anything below 500) in ``idempotency_keys`` for ``IDEMPOTENCY_TTL``
+seconds, with a per-worker LRU in front. A retry with the same key gets
+the stored response back - no database writes and no provider calls -
+marked with ``Idempotent-Replayed: true``.
+
+A duplicate that arrives while the first request is still running waits
+for it (up to ``IDEMPOTENCY_WAIT`` seconds, then 409) instead of running
+twice. Reusing a key with a different request body is a 422. 5xx
+responses and exceptions release the key, so the retry runs for real.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db import utils as db_utils
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_TTL = getattr(settings, 'IDEMPOTENCY_TTL', 24 * 60 * 60)          # seconds a response is kept
+IDEMPOTENCY_CACHE_SIZE = getattr(settings, 'IDEMPOTENCY_CACHE_SIZE', 10000)    # LRU entries per worker
+IDEMPOTENCY_WAIT = getattr(settings, 'IDEMPOTENCY_WAIT', 10)                   # seconds a duplicate waits
+IDEMPOTENCY_LOCK_TIMEOUT = getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60)   # an unfinished claim older than this is abandoned
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+class StoredResponse:
+    __slots__ = ('fingerprint', 'status_code', 'body', 'expires')
+
+    def __init__(self, fingerprint, status_code, body, expires):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.body = body
+        self.expires = expires   # time.time() timestamp
+
+
+class ResponseCache:
+    """Thread-safe LRU of StoredResponse, honouring their expiry."""
+
+    def __init__(self, max_entries=IDEMPOTENCY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+responses = ResponseCache()
+_inflight = {}                      # (scope, key) -> Event, for requests running in this worker
+_inflight_lock = threading.Lock()
+
+
+def request_fingerprint(request):
+    user = getattr(request, 'user', None)
+    user_id = getattr(user, 'pk', None) if user is not None and user.is_authenticated else None
+    payload = json.dumps([request.method, request.path, user_id, request.data], sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _key_reused():
+    return Response({"error": f"{HEADER} was already used for a different request"},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+def _replay(entry, fingerprint):
+    if entry.fingerprint != fingerprint:
+        return _key_reused()
+    response = Response(json.loads(entry.body), status=entry.status_code)
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def _claim(scope, key, fingerprint):
+    """``(True, record)`` if this request now owns the key, else ``(False, existing record or None)``."""
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                scope=scope, key=key, fingerprint=fingerprint,
+                expires_at=timezone.now() + timedelta(seconds=IDEMPOTENCY_TTL),
+            )
+        return True, record
+    except IntegrityError:
+        return False, IdempotencyKey.objects.filter(scope=scope, key=key).first()
+
+
+def _stored(record):
+    return StoredResponse(record.fingerprint, record.status_code, record.response_body, record.expires_at.timestamp())
+
+
+def _acquire(scope, key, fingerprint):
+    """Own the key and return its record, or return the Response to send instead."""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    delay = 0.05
+    while True:
+        entry = responses.get((scope, key))
+        if entry is not None:
+            return _replay(entry, fingerprint)
+        # Look before inserting, so that replays stay read-only
+        record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+        if record is None:
+            claimed, record = _claim(scope, key, fingerprint)
+            if claimed:
+                return record
+            if record is None:
+                continue   # released between our insert and read
+        now = timezone.now()
+        abandoned = record.status_code is None and record.created_at < now - timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT)
+        if record.expires_at <= now or abandoned:
+            IdempotencyKey.objects.filter(id=record.id).delete()
+            continue
+        if record.status_code is not None:
+            entry = _stored(record)
+            responses.set((scope, key), entry)
+            return _replay(entry, fingerprint)
+        if record.fingerprint != fingerprint:
+            return _key_reused()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            response = Response({"error": f"A request with this {HEADER} is still in progress"},
+                                status=status.HTTP_409_CONFLICT)
+            response['Retry-After'] = '1'
+            return response
+        # Same worker: wake up as soon as it finishes; otherwise poll the table
+        event = _inflight.get((scope, key))
+        if event is not None:
+            event.wait(min(remaining, 0.5))
+        else:
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.5)
+
+
+def _finish(record, response):
+    if response.status_code >= 500 or response.data is None:
+        IdempotencyKey.objects.filter(id=record.id).delete()
+        return
+    body = json.dumps(response.data, cls=DjangoJSONEncoder)
+    IdempotencyKey.objects.filter(id=record.id).update(status_code=response.status_code, response_body=body)
+    responses.set((record.scope, record.key),
+                  StoredResponse(record.fingerprint, response.status_code, body, record.expires_at.timestamp()))
+
+
+def idempotent(scope):
+    """Decorator for DRF function views; requests without the header run as before."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if key is None:
+                return view(request, *args, **kwargs)
+            key = key.strip()
+            if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                return Response({"error": f"{HEADER} must be 1-{IDEMPOTENCY_KEY_MAX_LENGTH} characters"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            try:
+                acquired = _acquire(scope, key, request_fingerprint(request))
+            except db_utils.OperationalError as e:
+                return Response({"error": "Database unavailable", "detail": str(e)},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            if isinstance(acquired, Response):
+                return acquired
+
+            event = threading.Event()
+            with _inflight_lock:
+                _inflight[(scope, key)] = event
+            try:
+                response = view(request, *args, **kwargs)
+                _finish(acquired, response)
+                return response
+            except BaseException:
+                IdempotencyKey.objects.filter(id=acquired.id).delete()
+                raise
+            finally:
+                with _inflight_lock:
+                    _inflight.pop((scope, key), None)
+                event.set()
+        return wrapper
+    return decorator
+
+
+def purge_expired(batch_size=1000):
+    """Delete expired keys in batches; returns how many were removed."""
+    removed = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return removed
+        removed += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,167 @@
+"""Resized / re-encoded image variants, generated on first request.
+
+``Item.image`` and the category ``image`` columns hold paths relative to
+``IMAGE_SOURCE_ROOT``. A variant is stored in a content-addressed cache:
+its file name is a hash of the source bytes and the variant spec, so
+identical sources share one file and a changed source gets a new one. The
+cache is capped at ``IMAGE_CACHE_MAX_BYTES`` and evicts least recently used
+files (hits refresh the file's mtime).
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from urllib.parse import quote
+
+from django.conf import settings
+
+from .cache import LRUCache
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional: pip install Pillow
+    Image = None
+
+
+IMAGE_SOURCE_ROOT = os.fspath(getattr(settings, 'IMAGE_SOURCE_ROOT', settings.BASE_DIR / 'media'))
+IMAGE_CACHE_DIR = os.fspath(getattr(settings, 'IMAGE_CACHE_DIR', settings.BASE_DIR / 'var' / 'image-cache'))
+IMAGE_CACHE_MAX_BYTES = getattr(settings, 'IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+IMAGE_URL_PREFIX = getattr(settings, 'IMAGE_URL_PREFIX', '/EcoMall/images/')
+
+# name -> (max width, max height, format, quality)
+IMAGE_VARIANTS = getattr(settings, 'IMAGE_VARIANTS', {
+    'thumb': (200, 200, 'WEBP', 80),
+    'card': (400, 400, 'WEBP', 80),
+    'detail': (1000, 1000, 'WEBP', 85),
+})
+CONTENT_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg', 'PNG': 'image/png'}
+
+
+class ImageNotFound(Exception):
+    pass
+
+
+def derivative_url(path, variant):
+    """URL of ``variant`` for a stored image path; remote/empty paths are returned as-is."""
+    if not path or variant not in IMAGE_VARIANTS or '://' in path:
+        return path
+    return IMAGE_URL_PREFIX + variant + '/' + quote(path.lstrip('/'))
+
+
+def resolve_source(path):
+    """Absolute source path, refusing anything outside IMAGE_SOURCE_ROOT."""
+    root = os.path.realpath(IMAGE_SOURCE_ROOT)
+    full = os.path.realpath(os.path.join(root, path.lstrip('/')))
+    if os.path.commonpath([root, full]) != root or not os.path.isfile(full):
+        raise ImageNotFound(path)
+    return full
+
+
+class DerivativeCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._source_hashes = LRUCache(max_entries=10000)   # (path, mtime_ns, size) -> sha256
+        self._total = None         # bytes on disk, counted lazily
+
+    def _hash_source(self, full):
+        st = os.stat(full)
+        key = (full, st.st_mtime_ns, st.st_size)
+        digest = self._source_hashes.get(key)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(full, 'rb') as fh:
+                for chunk in iter(lambda: fh.read(1 << 16), b''):
+                    h.update(chunk)
+            digest = h.hexdigest()
+            self._source_hashes.set(key, digest)
+        return digest
+
+    def _file_for(self, digest, fmt):
+        return os.path.join(self.directory, digest[:2], f'{digest}.{fmt.lower()}')
+
+    def get(self, path, variant):
+        """Return ``(file path, digest, content type)`` for a variant, generating it if needed."""
+        if Image is None:
+            raise ImageNotFound('Pillow is not installed')
+        width, height, fmt, quality = IMAGE_VARIANTS[variant]
+        full = resolve_source(path)
+        spec = f'{self._hash_source(full)}:{width}x{height}:{fmt}:{quality}'
+        digest = hashlib.sha256(spec.encode()).hexdigest()
+        target = self._file_for(digest, fmt)
+        try:
+            os.utime(target)  # LRU: a hit makes it the most recent
+        except FileNotFoundError:
+            self._render(full, target, width, height, fmt, quality)
+        return target, digest, CONTENT_TYPES.get(fmt, 'application/octet-stream')
+
+    def _render(self, full, target, width, height, fmt, quality):
+        try:
+            with Image.open(full) as source:
+                img = ImageOps.exif_transpose(source)   # a loaded copy
+                img.thumbnail((width, height))
+        except (OSError, Image.DecompressionBombError):
+            # Not an image, a truncated / corrupt one, or one too large to
+            # decode safely: nothing to serve. Errors writing the derivative
+            # below are ours and still propagate.
+            raise ImageNotFound(full)
+        self._write(img, target, fmt, quality)
+        self._added(os.path.getsize(target))
+
+    def _write(self, img, target, fmt, quality):
+        if fmt == 'JPEG' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            img = img.convert('RGBA')
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                img.save(fh, format=fmt, quality=quality)
+            os.replace(tmp, target)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _scan(self):
+        files = []
+        for dirpath, _, names in os.walk(self.directory):
+            for name in names:
+                if name.startswith('.tmp-'):
+                    continue
+                p = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, p))
+        return files
+
+    def _added(self, size):
+        with self._lock:
+            if self._total is None:
+                self._total = sum(s for _, s, _ in self._scan())
+            else:
+                self._total += size
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Oldest mtime first, down to 90% of the limit so we do not evict on every write
+        files = sorted(self._scan())
+        total = sum(s for _, s, _ in files)
+        goal = self.max_bytes * 0.9
+        for _, size, p in files:
+            if total <= goal:
+                break
+            try:
+                os.remove(p)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._total = total
+
+
+derivative_cache = DerivativeCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
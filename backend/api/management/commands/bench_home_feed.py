@@ -0,0 +1,59 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+
+SHELF_URLS = [
+    '/EcoMall/items/best-sale/',
+    '/EcoMall/items/new-arrivals/',
+    '/EcoMall/items/trending/',
+]
+HOME_FEED_URL = '/EcoMall/items/home-feed/'
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the three shelf endpoints against items/home-feed/: "
+        "HTTP round-trips, SQL queries and p50/p95 latency per page load."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+
+    def handle(self, *args, **options):
+        if 'testserver' not in settings.ALLOWED_HOSTS:
+            settings.ALLOWED_HOSTS.append('testserver')
+        client = Client()
+
+        def three_calls():
+            for url in SHELF_URLS:
+                client.get(url)
+
+        def home_feed():
+            client.get(HOME_FEED_URL)
+
+        for label, page_load, round_trips in (
+            ('3 shelf endpoints', three_calls, len(SHELF_URLS)),
+            ('home-feed', home_feed, 1),
+        ):
+            for _ in range(options['warmup']):
+                page_load()
+            timings = []
+            with CaptureQueriesContext(connection) as ctx:
+                for _ in range(options['iterations']):
+                    start = time.perf_counter()
+                    page_load()
+                    timings.append((time.perf_counter() - start) * 1000)
+            queries = len(ctx.captured_queries) / options['iterations']
+            timings.sort()
+            p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+            self.stdout.write(
+                f"{label:<18} round-trips={round_trips} queries/load={queries:.1f} "
+                f"p50={statistics.median(timings):.2f}ms p95={p95:.2f}ms"
+            )
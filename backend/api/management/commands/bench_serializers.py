@@ -0,0 +1,102 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from api.models import Cart, Item, Wishlist
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import (
+    CART_COLUMNS, ITEM_MINIMAL_COLUMNS, WISHLIST_COLUMNS,
+    CartSerializer, ItemMinimalSerializer, WishlistSerializer,
+    cart_rows, item_minimal_rows, wishlist_rows,
+)
+
+
+class FakeValuesList:
+    """Stands in for a queryset: the fast builders only call values_list()."""
+
+    def __init__(self, rows, columns):
+        self.rows = rows
+        self.columns = columns
+
+    def values_list(self, *columns):
+        assert columns == self.columns
+        return self.rows
+
+
+def make_items(n):
+    now = timezone.now()
+    items = []
+    for i in range(1, n + 1):
+        item = Item(
+            item_id=i, category_id=1 + i % 7, sub_category_id=1 + i % 31,
+            item_name=f'Eco product {i} – bämboo', selling_price=Decimal(i % 5000) + Decimal('0.99'),
+            actual_price=Decimal('9999.00'), image=f'/images/items/{i}.jpg',
+        )
+        item.created_at = item.updated_at = now
+        items.append(item)
+    return items
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark the values()-based list builders + FastJSONRenderer "
+        "against the DRF serializers + JSONRenderer (rows built in memory, no DB), "
+        "and check both produce identical bytes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"orjson: {'yes' if orjson else 'no (install orjson for the fast encoder)'}")
+        for n in options['rows']:
+            items = make_items(n)
+            added_at = timezone.now() - timedelta(days=1)
+            carts, wishlists = [], []
+            for item in items:
+                cart = Cart(cart_id=item.item_id, user_id=1, item=item, quantity=2)
+                cart.added_at = added_at
+                carts.append(cart)
+                wish = Wishlist(wishlist_id=item.item_id, user_id=1, item=item)
+                wish.added_at = added_at
+                wishlists.append(wish)
+
+            item_tuples = [
+                (i.item_id, i.item_name, i.selling_price, i.category_id, i.sub_category_id, i.image) for i in items
+            ]
+            cart_tuples = [
+                (c.cart_id, c.user_id, c.item_id, c.quantity, c.added_at, c.item.item_name, c.item.image, c.item.selling_price)
+                for c in carts
+            ]
+            wish_tuples = [
+                (w.wishlist_id, w.user_id, w.item_id, w.added_at, w.item.item_name, w.item.image, w.item.selling_price)
+                for w in wishlists
+            ]
+
+            cases = (
+                ('ItemMinimal', lambda: ItemMinimalSerializer(items, many=True).data,
+                 lambda: item_minimal_rows(FakeValuesList(item_tuples, ITEM_MINIMAL_COLUMNS))),
+                ('Cart', lambda: CartSerializer(carts, many=True).data,
+                 lambda: cart_rows(FakeValuesList(cart_tuples, CART_COLUMNS))),
+                ('Wishlist', lambda: WishlistSerializer(wishlists, many=True).data,
+                 lambda: wishlist_rows(FakeValuesList(wish_tuples, WISHLIST_COLUMNS))),
+            )
+            for label, slow, fast in cases:
+                slow_bytes, slow_secs = self._run(slow, JSONRenderer())
+                fast_bytes, fast_secs = self._run(fast, FastJSONRenderer())
+                if slow_bytes != fast_bytes:
+                    raise CommandError(f"{label}: fast path output differs from the serializer output at {n} rows")
+                self.stdout.write(
+                    f"{label:<12} rows={n:<7} serializer={n / slow_secs:>10,.0f} items/s  "
+                    f"fast={n / fast_secs:>10,.0f} items/s  speedup={slow_secs / fast_secs:5.1f}x"
+                )
+
+    @staticmethod
+    def _run(build, renderer):
+        start = time.perf_counter()
+        body = renderer.render(build())
+        return body, time.perf_counter() - start
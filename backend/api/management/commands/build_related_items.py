@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.recommendations import RELATED_ITEMS_MATRIX_PATH, RELATED_ITEMS_TOP_K, build_related_items
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the \"frequently bought together\" lists from order history. By default only orders "
+        "placed since the last run are read, leaving the last RELATED_ITEMS_SETTLE_AFTER seconds for "
+        "the next one (they may not have committed yet); --full rebuilds everything."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recount all orders and rewrite every list")
+        parser.add_argument('--top-k', type=int, default=RELATED_ITEMS_TOP_K, help="Related items kept per item")
+        parser.add_argument('--min-count', type=int, default=1, help="Minimum orders a pair must share")
+        parser.add_argument('--path', default=None, help=f"Count matrix file (default: {RELATED_ITEMS_MATRIX_PATH})")
+
+    def handle(self, *args, **options):
+        if options['top_k'] < 1 or options['min_count'] < 1:
+            raise CommandError("--top-k and --min-count must be positive")
+        start = time.perf_counter()
+        try:
+            stats = build_related_items(
+                full=options['full'], top_k=options['top_k'], min_count=options['min_count'], path=options['path'],
+            )
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {stats['order_lines']:,} order lines from {stats['orders']:,} orders; refreshed "
+            f"{stats['items_refreshed']:,} items ({stats['rows_written']:,} rows, {stats['pairs']:,} pairs known, "
+            f"orders placed before {stats['watermark']:%Y-%m-%d %H:%M:%S}) in {time.perf_counter() - start:.1f}s"
+        ))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.search import SEARCH_INDEX_PATH, build_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product search index from the database and write its on-disk snapshot."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help=f"Snapshot file (default: {SEARCH_INDEX_PATH})")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        index = build_index()
+        path = index.save(options['path'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {len(index)} items ({len(index.postings)} terms) into {path} "
+            f"in {time.perf_counter() - start:.1f}s"
+        ))
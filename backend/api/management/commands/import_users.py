@@ -0,0 +1,138 @@
+import json
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.user_import import (
+    DEFAULT_CHUNK_SIZE, FORMATS, RejectWriter, clean_record, detect_format, hash_passwords, init_worker,
+    insert_users, read_records, split_conflicts,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import users from a CSV (with a header row) or NDJSON file with columns first_name, last_name, "
+        "email, mobile_number, password. Plaintext passwords are hashed in a process pool; existing hashes "
+        "are kept. Rows clashing on email / mobile_number are skipped (and listed with --reject-file). "
+        "Progress is checkpointed after every chunk; re-running the same command resumes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Default: from the file extension")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Records per transaction")
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows per INSERT statement")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Password hashing processes")
+        parser.add_argument('--hasher', default='default', help="Django password hasher name, e.g. pbkdf2_sha256")
+        parser.add_argument('--checkpoint', help="Checkpoint file (default: <path>.checkpoint.json)")
+        parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint")
+        parser.add_argument('--reject-file', help="Write skipped records and the reason to this CSV")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f"{path} does not exist")
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError("--chunk-size and --workers must be positive")
+        fmt = options['format'] or detect_format(path)
+        checkpoint_path = options['checkpoint'] or path + '.checkpoint.json'
+
+        state = {'source': os.path.abspath(path), 'offset': 0, 'records': 0, 'inserted': 0, 'skipped': 0,
+                 'complete': False}
+        if not options['restart'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as fh:
+                saved = json.load(fh)
+            if saved.get('source') != state['source'] or saved.get('offset', 0) > os.path.getsize(path):
+                raise CommandError(f"{checkpoint_path} belongs to another file; pass --restart to start over")
+            if saved.get('complete'):
+                self.stderr.write(f"Import already complete ({saved['inserted']:,} inserted); pass --restart to run again")
+                return
+            state.update(saved)
+            self.stderr.write(f"Resuming at record {state['records']:,} (byte {state['offset']:,})")
+
+        self.checkpoint_path = checkpoint_path
+        self.rejects = RejectWriter.open(options['reject_file'], append=state['records'] > 0)
+        self.start = time.perf_counter()
+        self.start_records = state['records']
+        records = read_records(path, fmt, state['offset'])
+        try:
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as pool:
+                self.run(pool, records, state, options)
+        finally:
+            self.rejects.close()
+        state['complete'] = True
+        self.save_checkpoint(state)
+        elapsed = time.perf_counter() - self.start
+        self.stderr.write(
+            f"Done: {state['records']:,} records, {state['inserted']:,} inserted, {state['skipped']:,} skipped "
+            f"in {elapsed:.1f}s"
+        )
+
+    def run(self, pool, records, state, options):
+        # Hash chunk N+1 in the pool while chunk N is being inserted
+        pending = deque()
+        while True:
+            chunk = list(islice(records, options['chunk_size']))
+            if chunk:
+                pending.append(self.prepare(pool, chunk, options))
+            if len(pending) > 1 or (pending and not chunk):
+                self.finish(pending.popleft(), state, options)
+            if not chunk and not pending:
+                return
+
+    def prepare(self, pool, chunk, options):
+        # Rejects are reported in finish(), with the checkpoint: this chunk
+        # is prepared again if the run stops before it is inserted
+        rows, offsets, rejects = [], {}, []
+        for record, offset in chunk:
+            row, reason = clean_record(record)
+            if row is None:
+                rejects.append((offset, record, reason))
+            else:
+                rows.append(row)
+                offsets[id(row)] = offset
+        rows, conflicts = split_conflicts(rows)
+        rejects.extend((offsets[id(row)], row, reason) for row, reason in conflicts)
+
+        per_worker = max(1, math.ceil(len(rows) / options['workers']))
+        futures = [
+            pool.submit(hash_passwords, [row['password'] for row in rows[i:i + per_worker]], options['hasher'])
+            for i in range(0, len(rows), per_worker)
+        ]
+        return {'rows': rows, 'offsets': offsets, 'futures': futures, 'rejects': rejects,
+                'records': len(chunk), 'end': chunk[-1][1]}
+
+    def finish(self, job, state, options):
+        rows = job['rows']
+        hashed = [password for future in job['futures'] for password in future.result()]
+        for row, password in zip(rows, hashed):
+            row['password'] = password
+        inserted, conflicts = insert_users(rows, options['batch_size']) if rows else (0, [])
+        rejects = job['rejects'] + [(job['offsets'][id(row)], row, reason) for row, reason in conflicts]
+        for offset, record, reason in sorted(rejects, key=lambda reject: reject[0]):
+            self.rejects.write(offset, record, reason)
+
+        state['offset'] = job['end']
+        state['records'] += job['records']
+        state['inserted'] += inserted
+        state['skipped'] += len(rejects)
+        self.rejects.flush()   # reported before the checkpoint moves past them
+        self.save_checkpoint(state)
+
+        elapsed = time.perf_counter() - self.start
+        rate = (state['records'] - self.start_records) / elapsed if elapsed else 0
+        self.stderr.write(
+            f"{state['records']:,} records | {state['inserted']:,} inserted | {state['skipped']:,} skipped "
+            f"| {rate:,.0f} records/s"
+        )
+
+    def save_checkpoint(self, state):
+        tmp = self.checkpoint_path + '.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump(state, fh)
+        os.replace(tmp, self.checkpoint_path)
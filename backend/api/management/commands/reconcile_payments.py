@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.provider import razorpay_client
+from api.reconcile import (
+    RECONCILE_CHUNK_SIZE, RECONCILE_EXPIRE_AFTER, RECONCILE_RATE, RECONCILE_STALE_AFTER, TARGETS, reconcile,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Settle payments left in created/pending (e.g. the tab was closed before verify-payment) by asking "
+        "Razorpay about their orders. Provider calls are rate limited and slow down on 429s; --dry-run "
+        "only reports what would change."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="Concurrent provider calls")
+        parser.add_argument('--rate', type=float, default=RECONCILE_RATE, help="Provider calls per second")
+        parser.add_argument('--chunk-size', type=int, default=RECONCILE_CHUNK_SIZE, help="Payments per chunk")
+        parser.add_argument('--older-than', type=int, default=RECONCILE_STALE_AFTER // 60,
+                            help="Only payments created more than this many minutes ago")
+        parser.add_argument('--expire-after', type=int, default=RECONCILE_EXPIRE_AFTER // 60,
+                            help="Fail payments with no attempt after this many minutes (releases their stock)")
+        parser.add_argument('--limit', type=int, default=None, help="Stop after this many payments")
+        parser.add_argument('--dry-run', action='store_true', help="Query the provider but write nothing")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['chunk_size'] < 1 or options['rate'] <= 0:
+            raise CommandError("--workers, --chunk-size and --rate must be positive")
+        start = time.perf_counter()
+
+        def progress(stats):
+            elapsed = time.perf_counter() - start
+            self.stderr.write(f"{stats['checked']:,} checked ({stats['checked'] / elapsed:,.0f}/s)")
+
+        stats = reconcile(
+            razorpay_client, workers=options['workers'], rate=options['rate'], chunk_size=options['chunk_size'],
+            stale_after=options['older_than'] * 60,
+            expire_after=options['expire_after'] * 60, dry_run=options['dry_run'], limit=options['limit'],
+            progress=progress,
+        )
+        moved = ', '.join(f"{stats[target]:,} {target}" for target in TARGETS)
+        verb = "would move" if options['dry_run'] else "moved"
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {stats['checked']:,} payments in {time.perf_counter() - start:.1f}s: {verb} {moved}; "
+            f"{stats['unchanged']:,} unchanged, {stats['lost']:,} changed meanwhile, {stats['errors']:,} errors, "
+            f"{stats['throttled']:,} rate-limit pauses"
+        ))
+        if stats['aborted']:
+            raise CommandError(f"Stopped early: {stats['aborted']}")
@@ -0,0 +1,34 @@
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from api.outbox import OutboxWorker
+from api.provider import razorpay_client
+
+
+class Command(BaseCommand):
+    help = (
+        "Create provider (Razorpay) orders for pending payments from the payment outbox. "
+        "Runs until interrupted; --drain exits once nothing is due."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="Concurrent provider calls")
+        parser.add_argument('--batch-size', type=int, default=None, help="Entries claimed per round (default: 2 x workers)")
+        parser.add_argument('--poll-interval', type=float, default=0.5, help="Seconds to sleep when nothing is due")
+        parser.add_argument('--drain', action='store_true', help="Exit when no entry is due")
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbox') as executor:
+            worker = OutboxWorker(
+                razorpay_client, executor,
+                batch_size=options['batch_size'] or 2 * workers, poll_interval=options['poll_interval'],
+            )
+            signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+            try:
+                worker.run(drain=options['drain'])
+            except KeyboardInterrupt:
+                worker.stop()
+        self.stderr.write("Outbox worker stopped")
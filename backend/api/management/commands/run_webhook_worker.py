@@ -0,0 +1,26 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from api.webhooks import WEBHOOK_BATCH_SIZE, WebhookWorker
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply logged Razorpay webhook events to payments and orders in batches. "
+        "Runs until interrupted; --drain exits once nothing is left."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=WEBHOOK_BATCH_SIZE, help="Deliveries claimed per batch")
+        parser.add_argument('--poll-interval', type=float, default=0.5, help="Seconds to sleep when nothing is left")
+        parser.add_argument('--drain', action='store_true', help="Exit when no delivery is waiting")
+
+    def handle(self, *args, **options):
+        worker = WebhookWorker(batch_size=max(1, options['batch_size']), poll_interval=options['poll_interval'])
+        signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+        try:
+            worker.run(drain=options['drain'])
+        except KeyboardInterrupt:
+            worker.stop()
+        self.stderr.write("Webhook worker stopped")
@@ -0,0 +1,198 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('order_id', models.AutoField(primary_key=True, serialize=False)),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order_status', models.CharField(default='pending', max_length=10)),
+                ('booked_reference', models.CharField(blank=True, max_length=50, null=True)),
+                ('ordered_date', models.DateTimeField(auto_now_add=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('discount_code_id', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'orders',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('order_item_id', models.AutoField(primary_key=True, serialize=False)),
+                ('quantity', models.IntegerField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+            options={
+                'db_table': 'order_items',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('provider', models.CharField(default='razorpay', max_length=50)),
+                ('provider_order_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('provider_payment_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('currency', models.CharField(default='INR', max_length=10)),
+                ('status', models.CharField(choices=[('created', 'Created'), ('authorized', 'Authorized'), ('captured', 'Captured'), ('failed', 'Failed'), ('refunded', 'Refunded')], max_length=20)),
+                ('method', models.CharField(blank=True, max_length=50, null=True)),
+                ('upi_vpa', models.CharField(blank=True, max_length=100, null=True)),
+                ('card_last4', models.CharField(blank=True, max_length=4, null=True)),
+                ('card_network', models.CharField(blank=True, max_length=50, null=True)),
+                ('bank', models.CharField(blank=True, max_length=100, null=True)),
+                ('captured', models.BooleanField(default=False)),
+                ('error_code', models.CharField(blank=True, max_length=50, null=True)),
+                ('error_description', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'payments',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='RazorpayWebhookLog',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('event_type', models.CharField(max_length=100)),
+                ('payload_text', models.TextField()),
+                ('headers', models.TextField(blank=True, null=True)),
+                ('signature', models.CharField(blank=True, max_length=255, null=True)),
+                ('verified', models.BooleanField(default=False)),
+                ('processed', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'razorpay_webhook_logs',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='MainCategory',
+            fields=[
+                ('main_category_id', models.AutoField(primary_key=True, serialize=False)),
+                ('main_category_name', models.CharField(max_length=100)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('image', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Main Category',
+                'verbose_name_plural': 'Main Categories',
+                'db_table': 'main_categories',
+            },
+        ),
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('user_id', models.AutoField(primary_key=True, serialize=False)),
+                ('first_name', models.CharField(max_length=50)),
+                ('last_name', models.CharField(max_length=50)),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('mobile_number', models.CharField(max_length=15, unique=True)),
+                ('password', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'users',
+            },
+        ),
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('category_id', models.AutoField(primary_key=True, serialize=False)),
+                ('category_name', models.CharField(max_length=150)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('image', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('main_category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='categories', to='api.maincategory')),
+            ],
+            options={
+                'verbose_name': 'Category',
+                'verbose_name_plural': 'Categories',
+                'db_table': 'categories',
+            },
+        ),
+        migrations.CreateModel(
+            name='SubCategory',
+            fields=[
+                ('sub_category_id', models.AutoField(primary_key=True, serialize=False)),
+                ('sub_category_name', models.CharField(max_length=150)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('image', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sub_categories', to='api.category')),
+            ],
+            options={
+                'db_table': 'sub_categories',
+            },
+        ),
+        migrations.CreateModel(
+            name='Item',
+            fields=[
+                ('item_id', models.AutoField(primary_key=True, serialize=False)),
+                ('item_name', models.CharField(max_length=150)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('actual_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('selling_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('stock_quantity', models.IntegerField(default=0)),
+                ('image', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_new', models.IntegerField(default=0)),
+                ('is_trending', models.IntegerField(default=0)),
+                ('discount_percentage', models.DecimalField(decimal_places=2, default=0.0, max_digits=5)),
+                ('best_sales', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='api.category')),
+                ('sub_category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='items', to='api.subcategory')),
+            ],
+            options={
+                'db_table': 'items',
+            },
+        ),
+        migrations.CreateModel(
+            name='Cart',
+            fields=[
+                ('cart_id', models.AutoField(primary_key=True, serialize=False)),
+                ('quantity', models.IntegerField(default=1)),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+                ('item', models.ForeignKey(db_column='item_id', on_delete=django.db.models.deletion.CASCADE, related_name='in_carts', to='api.item')),
+                ('user', models.ForeignKey(db_column='user_id', on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to='api.user')),
+            ],
+            options={
+                'db_table': 'cart',
+            },
+        ),
+        migrations.CreateModel(
+            name='Wishlist',
+            fields=[
+                ('wishlist_id', models.AutoField(primary_key=True, serialize=False)),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+                ('item', models.ForeignKey(db_column='item_id', on_delete=django.db.models.deletion.CASCADE, related_name='wishlisted_in', to='api.item')),
+                ('user', models.ForeignKey(db_column='user_id', on_delete=django.db.models.deletion.CASCADE, related_name='wishlist_items', to='api.user')),
+            ],
+            options={
+                'db_table': 'wishlist',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:34
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_lines(apps, schema_editor):
+    """Fold duplicate (user, item) lines into the oldest one before the constraint is added."""
+    Cart = apps.get_model('api', 'Cart')
+    duplicates = (
+        Cart.objects.values('user_id', 'item_id')
+        .annotate(lines=Count('cart_id'), total=Sum('quantity'), keep=Min('cart_id'))
+        .filter(lines__gt=1)
+    )
+    for dup in duplicates:
+        Cart.objects.filter(cart_id=dup['keep']).update(quantity=dup['total'])
+        Cart.objects.filter(user_id=dup['user_id'], item_id=dup['item_id']).exclude(cart_id=dup['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_item_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'item'), name='cart_user_item_uniq'),
+        ),
+    ]
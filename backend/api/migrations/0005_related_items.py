@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_cart_user_item_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedItem',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('co_orders', models.PositiveIntegerField()),
+                ('item', models.ForeignKey(db_column='item_id', on_delete=django.db.models.deletion.CASCADE, related_name='related_items', to='api.item')),
+                ('related_item', models.ForeignKey(db_column='related_item_id', on_delete=django.db.models.deletion.CASCADE, related_name='related_to', to='api.item')),
+            ],
+            options={
+                'db_table': 'item_related',
+                'constraints': [models.UniqueConstraint(fields=('item', 'rank'), name='item_related_item_rank_uniq')],
+            },
+        ),
+    ]
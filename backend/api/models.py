@@ -107,6 +107,15 @@ class Item(models.Model):
 
     class Meta:
         db_table = 'items'
+        indexes = [
+            # Home shelves / keyset listings: filter on the flag, walk in sort order
+            models.Index(fields=['best_sales', 'item_name'], name='items_best_sales_idx'),
+            models.Index(fields=['is_new', 'created_at'], name='items_is_new_idx'),
+            models.Index(fields=['is_trending', 'item_name'], name='items_is_trending_idx'),
+            models.Index(fields=['sub_category', 'item_name'], name='items_subcat_name_idx'),
+            # Catalog export deltas (updated_since)
+            models.Index(fields=['updated_at'], name='items_updated_at_idx'),
+        ]
 
     # Optional: Properties to handle inverted logic
     @property
@@ -138,6 +147,10 @@ class Cart(models.Model):
 
     class Meta:
         db_table = 'cart'
+        constraints = [
+            # One line per (user, item); cart.add_to_cart upserts against it
+            models.UniqueConstraint(fields=['user', 'item'], name='cart_user_item_uniq'),
+        ]
 
 
 class Wishlist(models.Model):
@@ -150,6 +163,23 @@ class Wishlist(models.Model):
         db_table = 'wishlist'
 
 
+class RelatedItem(models.Model):
+    """Precomputed "frequently bought together" list (built by manage.py build_related_items)."""
+    id = models.BigAutoField(primary_key=True)
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, db_column='item_id', related_name='related_items')
+    related_item = models.ForeignKey(Item, on_delete=models.CASCADE, db_column='related_item_id', related_name='related_to')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    co_orders = models.PositiveIntegerField()
+
+    class Meta:
+        db_table = 'item_related'
+        constraints = [
+            # Also the lookup index for items/<id>/related/
+            models.UniqueConstraint(fields=['item', 'rank'], name='item_related_item_rank_uniq'),
+        ]
+
+
 # ---- Orders (mapped to existing tables) ----
 class Order(models.Model):
     order_id = models.AutoField(primary_key=True)
@@ -221,3 +251,70 @@ class RazorpayWebhookLog(models.Model):
     class Meta:
         db_table = 'razorpay_webhook_logs'
         managed = False  # Table already exists in DB
+
+
+class PaymentOutbox(models.Model):
+    """Provider calls to make for a payment, written in the same transaction
+    as the payment and carried out by ``manage.py run_outbox_worker``."""
+    KIND_CREATE_ORDER = 'order.create'
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    # payments is not managed by Django, so no database-level constraint
+    payment = models.ForeignKey(Payment, on_delete=models.DO_NOTHING, db_column='payment_id', db_constraint=False,
+                                related_name='outbox_entries')
+    kind = models.CharField(max_length=50, default=KIND_CREATE_ORDER)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'payment_outbox'
+        indexes = [
+            # Worker claim: due entries in due order
+            models.Index(fields=['status', 'next_attempt_at'], name='payment_outbox_due_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """First response to a request sent with an ``Idempotency-Key`` header;
+    ``status_code`` is null while that request is still running."""
+    id = models.BigAutoField(primary_key=True)
+    scope = models.CharField(max_length=50)          # endpoint
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)    # sha256 of method, path, user and body
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'idempotency_keys'
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='idempotency_scope_key_uniq'),
+        ]
+        indexes = [
+            # purge_idempotency_keys
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+
+class RazorpayWebhookEvent(models.Model):
+    """Event ids already applied by the webhook worker (deliveries are at-least-once)."""
+    id = models.BigAutoField(primary_key=True)
+    event_id = models.CharField(max_length=100, unique=True)
+    event_type = models.CharField(max_length=100)
+    log_id = models.IntegerField()   # razorpay_webhook_logs row it was applied from
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'razorpay_webhook_events'
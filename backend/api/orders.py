@@ -0,0 +1,140 @@
+"""Order placement.
+
+``place_order`` prices the lines from the database (client-sent prices and
+totals are ignored), writes the order and its lines, and takes the stock,
+all in one transaction: one locking ``SELECT ... WHERE item_id IN (...)
+ORDER BY item_id FOR UPDATE`` that also reads the prices, one INSERT for
+the order, one bulk INSERT for the lines and one UPDATE for the stock.
+Locking in item_id order means two checkouts sharing items always queue
+up instead of deadlocking.
+
+The stock stays reserved while the payment is open. ``adjust_stock`` gives
+it back when the order fails (``payments`` calls it as the order moves to
+``failed``) and takes it again if a late capture confirms the order after all.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from . import cache as api_cache
+from .models import Cart, Item, Order, OrderItem
+from .pricing import money, order_charges, unit_price_expression
+
+
+ORDER_MAX_LINES = 100
+
+
+class OrderError(ValueError):
+    """The order request is invalid; nothing was written."""
+
+
+class OutOfStock(OrderError):
+    """Not enough stock; ``items`` lists ``{item_id, requested, available}``."""
+
+    def __init__(self, items):
+        super().__init__('Not enough stock')
+        self.items = items
+
+
+def parse_lines(lines):
+    """``{item_id: quantity}`` from ``[{item_id, quantity}, ...]``; repeated items are summed."""
+    if not isinstance(lines, list) or not lines:
+        raise OrderError('items must be a non-empty list')
+    if len(lines) > ORDER_MAX_LINES:
+        raise OrderError(f'At most {ORDER_MAX_LINES} items per order')
+    quantities = {}
+    for line in lines:
+        if not isinstance(line, dict):
+            raise OrderError('each item must be an object')
+        try:
+            item_id = int(line.get('item_id'))
+            quantity = int(line.get('quantity') or 1)
+        except (TypeError, ValueError):
+            raise OrderError('item_id and quantity must be integers')
+        if quantity < 1:
+            raise OrderError('quantity must be at least 1')
+        quantities[item_id] = quantities.get(item_id, 0) + quantity
+    return quantities
+
+
+def place_order(user_id, lines):
+    """Create a pending order for ``lines`` and reserve its stock.
+
+    Returns ``(order, charges)`` where ``charges`` is ``pricing.order_charges``
+    for the server-computed subtotal; ``order.total_price`` is its total.
+    Raises OrderError / OutOfStock, in which case nothing is written.
+    """
+    quantities = parse_lines(lines)
+    with transaction.atomic():
+        rows = list(
+            Item.objects.select_for_update()
+            .filter(item_id__in=quantities)
+            .order_by('item_id')
+            .annotate(unit_price=unit_price_expression())
+            .values('item_id', 'unit_price', 'stock_quantity', 'sub_category_id')
+        )
+        found = {row['item_id'] for row in rows}
+        missing = sorted(set(quantities) - found)
+        if missing:
+            raise OrderError('Unknown item_id: ' + ', '.join(map(str, missing)))
+        short = [
+            {'item_id': row['item_id'], 'requested': quantities[row['item_id']], 'available': row['stock_quantity']}
+            for row in rows if row['stock_quantity'] < quantities[row['item_id']]
+        ]
+        if short:
+            raise OutOfStock(short)
+
+        prices = {row['item_id']: money(row['unit_price']) for row in rows}
+        charges = order_charges(sum(prices[i] * q for i, q in quantities.items()), has_lines=True)
+        order = Order.objects.create(user_id=user_id, total_price=charges['total'], order_status='pending')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, item_id=item_id, quantity=quantity, price=prices[item_id])
+            for item_id, quantity in quantities.items()
+        ])
+        Item.objects.filter(item_id__in=quantities).update(
+            stock_quantity=F('stock_quantity') - Case(
+                *[When(item_id=item_id, then=Value(quantity)) for item_id, quantity in quantities.items()],
+                output_field=IntegerField(),
+            ),
+            updated_at=timezone.now(),
+        )
+        item_ids = list(quantities)
+        sub_category_ids = {row['sub_category_id'] for row in rows}
+        # update() sends no signals; refresh what shows stock ourselves
+        transaction.on_commit(lambda: _stock_changed(item_ids, sub_category_ids))
+    return order, charges
+
+
+def adjust_stock(order_ids, release=True):
+    """Put the quantities of ``order_ids`` back into stock (or, with
+    ``release=False``, take them again). Call inside the transaction that
+    changes the orders' status, so that it happens exactly once."""
+    quantities = dict(
+        OrderItem.objects.filter(order_id__in=order_ids).values('item_id')
+        .annotate(quantity=Sum('quantity')).values_list('item_id', 'quantity')
+    )
+    if not quantities:
+        return
+    # Same lock order as place_order
+    sub_category_ids = set(
+        Item.objects.select_for_update().filter(item_id__in=quantities).order_by('item_id')
+        .values_list('sub_category_id', flat=True)
+    )
+    change = Case(
+        *[When(item_id=item_id, then=Value(quantity)) for item_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    Item.objects.filter(item_id__in=quantities).update(
+        stock_quantity=F('stock_quantity') + change if release else F('stock_quantity') - change,
+        updated_at=timezone.now(),
+    )
+    item_ids = list(quantities)
+    transaction.on_commit(lambda: _stock_changed(item_ids, sub_category_ids))
+
+
+def _stock_changed(item_ids, sub_category_ids):
+    for item_id in item_ids:
+        api_cache.invalidate_item_detail(item_id)
+    api_cache.invalidate_subcategory_facets(*sub_category_ids)
+    user_ids = Cart.objects.filter(item_id__in=item_ids).values_list('user_id', flat=True).distinct()
+    api_cache.invalidate_cart_summary(*user_ids)
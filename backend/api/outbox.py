@@ -0,0 +1,180 @@
+"""Transactional outbox for provider calls.
+
+Request handlers never call Razorpay. ``create_pending_payment`` writes the
+``Payment`` row (status ``created``, no provider order yet) together with a
+``PaymentOutbox`` entry in the caller's transaction, and the request returns
+at once. Workers (``manage.py run_outbox_worker``) claim due entries, create
+the provider order and store its id on the payment; the browser polls
+``payments/<id>/`` until ``razorpay_order_id`` is there.
+
+Failed calls are retried with exponential backoff and jitter. A retry first
+looks the order up by its receipt, so a call that succeeded at Razorpay but
+timed out here does not create a second provider order.
+"""
+import logging
+import random
+import threading
+from datetime import timedelta
+
+import razorpay
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Payment, PaymentOutbox
+from .payments import transition
+from .provider import CircuitOpen
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+OUTBOX_BACKOFF_BASE = getattr(settings, 'OUTBOX_BACKOFF_BASE', 2.0)    # seconds
+OUTBOX_BACKOFF_MAX = getattr(settings, 'OUTBOX_BACKOFF_MAX', 300.0)
+OUTBOX_LEASE = getattr(settings, 'OUTBOX_LEASE', 60)                   # seconds a claim is held
+
+
+def receipt_for(payment_id):
+    return f'payment-{payment_id}'
+
+
+def create_pending_payment(order, amount, currency='INR'):
+    """Payment row plus its "create provider order" outbox entry, atomically."""
+    with transaction.atomic():
+        payment = Payment.objects.create(order=order, amount=amount, status='created', currency=currency)
+        PaymentOutbox.objects.create(payment=payment, next_attempt_at=timezone.now())
+    return payment
+
+
+def payment_state(payment):
+    """Polling view of a payment: ``pending`` until the provider order exists."""
+    if payment.provider_order_id:
+        state = 'ready'
+    elif payment.status == 'failed':
+        state = 'failed'
+    else:
+        state = 'pending'
+    return {
+        'payment_id': payment.id,
+        'order_id': payment.order_id,
+        'status': state,
+        'razorpay_order_id': payment.provider_order_id,
+        'amount': float(payment.amount),
+        'currency': payment.currency,
+    }
+
+
+def backoff(attempts):
+    delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.5, 1.5)
+
+
+def claim_batch(limit, lease=OUTBOX_LEASE):
+    """Claim up to ``limit`` due entries (pending, or processing with an expired
+    lease) and return them. ``SKIP LOCKED`` lets several workers claim in
+    parallel without blocking on, or double-claiming, the same rows."""
+    now = timezone.now()
+    due = Q(status='pending', next_attempt_at__lte=now) | Q(status='processing', locked_until__lt=now)
+    with transaction.atomic():
+        ids = list(
+            PaymentOutbox.objects.select_for_update(skip_locked=True)
+            .filter(due).order_by('next_attempt_at').values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        PaymentOutbox.objects.filter(id__in=ids).update(
+            status='processing', locked_until=now + timedelta(seconds=lease), attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+    return list(PaymentOutbox.objects.filter(id__in=ids).select_related('payment'))
+
+
+def _create_provider_order(client, payment, retry):
+    receipt = receipt_for(payment.id)
+    if retry:
+        # An earlier attempt may have created it before we lost the response
+        for order in client.orders_by_receipt(receipt):
+            if order.get('receipt') == receipt:
+                return order['id']
+    order = client.create_order({
+        'amount': int(payment.amount * 100),   # paise
+        'currency': payment.currency,
+        'receipt': receipt,
+        'payment_capture': 1,
+        'notes': {'order_id': str(payment.order_id)},
+    })
+    return order['id']
+
+
+def process_entry(entry, client):
+    """Carry out one claimed entry; returns its new status."""
+    payment = entry.payment
+    now = timezone.now()
+    try:
+        provider_order_id = payment.provider_order_id or _create_provider_order(client, payment, entry.attempts > 1)
+    except CircuitOpen as e:
+        # Nothing was sent: hand the attempt back and wait for the breaker
+        PaymentOutbox.objects.filter(id=entry.id).update(
+            status='pending', locked_until=None, attempts=F('attempts') - 1, last_error=str(e),
+            next_attempt_at=now + timedelta(seconds=max(e.retry_after, 1)), updated_at=now,
+        )
+        return 'pending'
+    except Exception as e:
+        permanent = isinstance(e, razorpay.errors.BadRequestError)
+        if permanent or entry.attempts >= OUTBOX_MAX_ATTEMPTS:
+            logger.error('Outbox %s: giving up on payment %s: %s', entry.id, payment.id, e)
+            with transaction.atomic():
+                PaymentOutbox.objects.filter(id=entry.id).update(
+                    status='failed', locked_until=None, last_error=str(e), updated_at=now,
+                )
+                # Through the state machine: the order fails too and gives its stock back
+                transition('failed', value=payment.id, error_code='PROVIDER_ORDER_FAILED', error_description=str(e))
+            return 'failed'
+        logger.warning('Outbox %s: attempt %s failed: %s', entry.id, entry.attempts, e)
+        PaymentOutbox.objects.filter(id=entry.id).update(
+            status='pending', locked_until=None, last_error=str(e),
+            next_attempt_at=now + timedelta(seconds=backoff(entry.attempts)), updated_at=now,
+        )
+        return 'pending'
+
+    with transaction.atomic():
+        Payment.objects.filter(id=payment.id, provider_order_id__isnull=True).update(
+            provider_order_id=provider_order_id, updated_at=now,
+        )
+        PaymentOutbox.objects.filter(id=entry.id).update(
+            status='done', locked_until=None, last_error=None, updated_at=now,
+        )
+    return 'done'
+
+
+class OutboxWorker:
+    """Claims due entries and runs them on a thread pool until stopped."""
+
+    def __init__(self, client, executor, batch_size=20, poll_interval=0.5):
+        self.client = client
+        self.executor = executor
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+
+    def _run(self, entry):
+        try:
+            return process_entry(entry, self.client)
+        finally:
+            close_old_connections()
+
+    def run_once(self):
+        """Process one batch; returns the resulting statuses."""
+        entries = claim_batch(self.batch_size)
+        return list(self.executor.map(self._run, entries))
+
+    def run(self, drain=False):
+        """Loop until ``stop()`` - or, with ``drain``, until nothing is due."""
+        while not self.stopping.is_set():
+            if not self.run_once():
+                if drain:
+                    return
+                self.stopping.wait(self.poll_interval)
+
+    def stop(self):
+        self.stopping.set()
@@ -0,0 +1,150 @@
+"""Payment status transitions.
+
+``PAYMENT_SOURCES`` is the state machine: the statuses each status may be
+reached from. Updates are conditional on it, so a late or repeated
+provider event can never move a payment backwards (a captured payment
+does not become ``failed`` because a stale ``payment.failed`` arrived).
+The order follows its payment per ``ORDER_STATUS``; an order that fails
+gives its reserved stock back (and takes it again if a late capture
+confirms it after all).
+
+``transition`` moves one payment (the request handlers); ``bulk_transition``
+moves many (webhook worker, reconciliation). Both write only the columns
+that change, and a payment that is no longer in a source status is left
+alone and reported, never overwritten.
+"""
+import logging
+from typing import NamedTuple, Optional
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .models import Order, Payment
+from .orders import adjust_stock
+
+logger = logging.getLogger(__name__)
+
+
+# target status: statuses it may be reached from
+PAYMENT_SOURCES = {
+    'pending': ('created',),
+    'authorized': ('created', 'pending'),
+    # a failed attempt can still be followed by a successful one on the same order
+    'captured': ('created', 'pending', 'authorized', 'failed'),
+    'failed': ('created', 'pending', 'authorized'),
+    'refunded': ('captured',),
+}
+
+# payment status: (order status, order statuses it may replace)
+ORDER_STATUS = {
+    'captured': ('confirmed', ('pending', 'failed')),
+    'failed': ('failed', ('pending',)),
+}
+
+
+def _move_orders(orders, target):
+    """Order side of a transition: set the status of ``orders`` (a queryset)
+    where allowed, releasing or re-taking the stock of those that change."""
+    if target not in ORDER_STATUS:
+        return
+    order_status, replaces = ORDER_STATUS[target]
+    moving = dict(
+        orders.select_for_update().filter(order_status__in=replaces).values_list('order_id', 'order_status')
+    )
+    if not moving:
+        return
+    Order.objects.filter(order_id__in=moving, order_status__in=replaces).update(order_status=order_status)
+    if order_status == 'failed':
+        adjust_stock(list(moving), release=True)
+    else:
+        retaken = [order_id for order_id, previous in moving.items() if previous == 'failed']
+        if retaken:
+            adjust_stock(retaken, release=False)
+
+
+def provider_payment_columns(entity, target):
+    """Our payment columns from a Razorpay payment entity (missing values left out)."""
+    card = entity.get('card') or {}
+    columns = {
+        'provider_payment_id': entity.get('id'),
+        'method': entity.get('method'),
+        'bank': entity.get('bank'),
+        'upi_vpa': entity.get('vpa'),
+        'card_last4': card.get('last4'),
+        'card_network': card.get('network'),
+    }
+    if target == 'failed':
+        columns['error_code'] = entity.get('error_code')
+        columns['error_description'] = entity.get('error_description')
+    return {column: value for column, value in columns.items() if value is not None}
+
+
+class TransitionResult(NamedTuple):
+    moved: int                   # payments moved by this call
+    status: Optional[str]        # status now (latest matching payment); None if there is none
+    order_id: Optional[int]
+
+
+def _assignments(target, now):
+    assignments = {'status': target, 'updated_at': now}
+    if target == 'captured':
+        # Clear what an earlier failed attempt left behind
+        assignments.update(captured=True, error_code=None, error_description=None)
+    return assignments
+
+
+def transition(target, key='id', value=None, **columns):
+    """Move the payment(s) where ``<key> = value`` to ``target`` if their status
+    allows it: one conditional UPDATE of the changed columns (plus
+    ``columns``), then the order status (and its stock), in one short
+    transaction.
+
+    ``result.moved == 0`` means the payment was not in a source status - it
+    already is ``target`` (a repeat), or moved elsewhere first (a lost
+    race); ``result.status`` says which.
+    """
+    payments = Payment.objects.filter(**{key: value})
+    with transaction.atomic():
+        moved = payments.filter(status__in=PAYMENT_SOURCES[target]).update(
+            **_assignments(target, timezone.now()), **columns,
+        )
+        if moved:
+            _move_orders(Order.objects.filter(order_id__in=payments.values('order_id')), target)
+        current = payments.order_by('-id').values_list('status', 'order_id').first()
+    status, order_id = current or (None, None)
+    if not moved and status not in (None, target):
+        logger.info('Payment %s=%s not moved to %s: already %s', key, value, target, status)
+    return TransitionResult(moved, status, order_id)
+
+
+def bulk_transition(target, changes, key='provider_order_id'):
+    """Move the payments in ``changes`` - ``{<key> value: {column: value}}`` -
+    to ``target``, where ``PAYMENT_SOURCES`` allows it, in one transaction:
+    one locking SELECT, one UPDATE for the payments, then their orders.
+    Returns the key values that moved; the others were in a status that
+    does not lead to ``target``.
+    """
+    if not changes:
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            Payment.objects.select_for_update()
+            .filter(**{f'{key}__in': list(changes)}, status__in=PAYMENT_SOURCES[target])
+            .order_by('id').values_list('id', key, 'order_id')
+        )
+        if not rows:
+            return []
+        assignments = _assignments(target, now)
+        columns = sorted({column for _, value, _ in rows for column in changes[value]})
+        for column in columns:
+            field = Payment._meta.get_field(column)
+            assignments[column] = Case(
+                *[When(id=payment_id, then=Value(changes[value][column], output_field=field))
+                  for payment_id, value, _ in rows if column in changes[value]],
+                default=F(column), output_field=field,
+            )
+        Payment.objects.filter(id__in=[row[0] for row in rows], status__in=PAYMENT_SOURCES[target]).update(**assignments)
+        _move_orders(Order.objects.filter(order_id__in={row[2] for row in rows}), target)
+    return [row[1] for row in rows]
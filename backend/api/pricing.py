@@ -0,0 +1,116 @@
+"""Server-side cart pricing.
+
+Unit price is ``selling_price`` when set, otherwise ``actual_price`` less
+``discount_percentage``. Charges mirror the checkout page
+(EcoMall-master/src/pages/Cart.jsx) so the numbers shown to the shopper and
+the amount charged come from one place.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Cart
+from .serializers import format_price
+
+
+CENTS = Decimal('0.01')
+# (subtotal up to, GST rate); above the last bound the final rate applies
+GST_SLABS = ((Decimal('500'), Decimal('0.25')), (Decimal('1000'), Decimal('0.20')), (Decimal('2500'), Decimal('0.18')))
+GST_TOP_RATE = Decimal('0.16')
+PLATFORM_FEE = Decimal('7.00')
+DELIVERY_FEE = Decimal('40.00')
+FREE_DELIVERY_ABOVE = Decimal('499')
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def money(value):
+    return Decimal(value).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def unit_price_expression(prefix=''):
+    """SQL expression for an item's effective unit price."""
+    actual = F(f'{prefix}actual_price')
+    discounted = ExpressionWrapper(
+        actual * (Value(Decimal('100')) - F(f'{prefix}discount_percentage')) / Value(Decimal('100')),
+        output_field=MONEY,
+    )
+    return Coalesce(F(f'{prefix}selling_price'), discounted, output_field=MONEY)
+
+
+def gst_rate(subtotal):
+    for bound, rate in GST_SLABS:
+        if subtotal <= bound:
+            return rate
+    return GST_TOP_RATE
+
+
+def order_charges(subtotal, has_lines=True):
+    """GST, platform and delivery fees on top of a goods subtotal."""
+    subtotal = money(subtotal)
+    rate = gst_rate(subtotal)
+    gst_amount = money(subtotal * rate)
+    platform_fee = PLATFORM_FEE if has_lines else Decimal('0.00')
+    delivery_fee = Decimal('0.00') if subtotal > FREE_DELIVERY_ABOVE else DELIVERY_FEE
+    return {
+        'subtotal': subtotal,
+        'gst_rate': rate,
+        'gst_amount': gst_amount,
+        'platform_fee': platform_fee,
+        'delivery_fee': delivery_fee,
+        'total': money(subtotal + gst_amount + platform_fee + delivery_fee),
+    }
+
+
+def cart_summary(user_id):
+    """Priced cart lines and totals for a user, from one annotated query."""
+    rows = (
+        Cart.objects.filter(user_id=user_id)
+        .annotate(
+            unit_price=unit_price_expression('item__'),
+            out_of_stock=Case(When(item__stock_quantity__lt=F('quantity'), then=Value(True)), default=Value(False)),
+        )
+        .order_by('cart_id')
+        .values(
+            'cart_id', 'item_id', 'quantity', 'item__item_name', 'item__image', 'item__actual_price',
+            'item__discount_percentage', 'item__stock_quantity', 'unit_price', 'out_of_stock',
+        )
+    )
+    lines = []
+    subtotal = savings = Decimal('0.00')
+    for row in rows:
+        # Line totals from the rounded unit price, so lines add up to what is shown
+        unit_price = money(row['unit_price'])
+        line_total = unit_price * row['quantity']
+        line_savings = max(row['item__actual_price'] * row['quantity'] - line_total, Decimal('0.00'))
+        subtotal += line_total
+        savings += line_savings
+        lines.append({
+            'cart_id': row['cart_id'],
+            'item_id': row['item_id'],
+            'item_name': row['item__item_name'],
+            'image': row['item__image'],
+            'quantity': row['quantity'],
+            'actual_price': format_price(row['item__actual_price']),
+            'unit_price': format_price(unit_price),
+            'discount_percentage': format_price(row['item__discount_percentage']),
+            'line_total': format_price(line_total),
+            'savings': format_price(line_savings),
+            'stock_quantity': row['item__stock_quantity'],
+            'out_of_stock': bool(row['out_of_stock']),
+        })
+
+    charges = order_charges(subtotal, has_lines=bool(lines))
+    return {
+        'lines': lines,
+        'item_count': sum(line['quantity'] for line in lines),
+        'subtotal': format_price(charges['subtotal']),
+        'savings': format_price(savings),
+        'gst_rate': str(charges['gst_rate']),
+        'gst_amount': format_price(charges['gst_amount']),
+        'platform_fee': format_price(charges['platform_fee']),
+        'delivery_fee': format_price(charges['delivery_fee']),
+        'total': format_price(charges['total']),
+        'has_out_of_stock': any(line['out_of_stock'] for line in lines),
+    }
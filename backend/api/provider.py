@@ -0,0 +1,246 @@
+"""Payment provider (Razorpay) client shared by the views and the background workers.
+
+``ProviderClient`` wraps the Razorpay SDK with what the SDK leaves out:
+
+* a keep-alive connection pool sized for our worker threads;
+* connect / read timeouts on every call;
+* bounded retries with jittered exponential backoff - only for idempotent
+  calls (fetches); creating an order is never retried here (the outbox
+  retries it safely, by receipt);
+* a circuit breaker: after ``threshold`` consecutive failures calls fail
+  fast with CircuitOpen for ``reset_timeout`` seconds, then one trial call
+  decides whether to close it again;
+* per-operation latency histograms, readable with ``stats()``;
+* 429 responses raised as RateLimited (the SDK drops the status code),
+  honouring ``Retry-After`` when an idempotent call is retried.
+"""
+import random
+import threading
+import time
+from bisect import bisect_left
+
+import razorpay
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+RAZORPAY_BASE_URL = getattr(settings, 'RAZORPAY_BASE_URL', None)  # e.g. a local fake in tests
+RAZORPAY_TIMEOUT = getattr(settings, 'RAZORPAY_TIMEOUT', (3.05, 10))   # (connect, read) seconds
+RAZORPAY_POOL_SIZE = getattr(settings, 'RAZORPAY_POOL_SIZE', 20)
+RAZORPAY_MAX_RETRIES = getattr(settings, 'RAZORPAY_MAX_RETRIES', 2)
+RAZORPAY_BREAKER_THRESHOLD = getattr(settings, 'RAZORPAY_BREAKER_THRESHOLD', 5)
+RAZORPAY_BREAKER_RESET = getattr(settings, 'RAZORPAY_BREAKER_RESET', 30)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Failures that say something about the provider's health (a 4xx does not)
+TRANSIENT_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    razorpay.errors.ServerError,
+    razorpay.errors.GatewayError,
+)
+
+
+class CircuitOpen(Exception):
+    """The breaker is open; the call was not attempted."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Payment provider unavailable; retry in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+class RateLimited(requests.exceptions.RequestException):
+    """The provider answered 429 Too Many Requests."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Payment provider rate limit hit; retry in {retry_after:g}s')
+        self.retry_after = retry_after
+
+
+def _raise_rate_limited(response, *args, **kwargs):
+    # Session response hook: runs before the SDK turns the response into a generic error
+    if response.status_code == 429:
+        try:
+            retry_after = max(float(response.headers.get('Retry-After', 1)), 0)
+        except ValueError:
+            retry_after = 1.0
+        raise RateLimited(retry_after)
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, threshold=RAZORPAY_BREAKER_THRESHOLD, reset_timeout=RAZORPAY_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self.opened_count = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go through now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._trial_running:
+                raise CircuitOpen(max(remaining, 0))
+            self._state = self.HALF_OPEN
+            self._trial_running = True  # only one trial call at a time
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._state == self.HALF_OPEN or self._failures >= self.threshold:
+                if self._state != self.OPEN:
+                    self.opened_count += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self):
+        state = self.state
+        with self._lock:
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'threshold': self.threshold,
+                'reset_timeout': self.reset_timeout,
+                'times_opened': self.opened_count,
+            }
+
+
+class LatencyHistogram:
+    """Cumulative-bucket latency histogram (seconds), Prometheus style."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)   # last slot: +Inf
+        self._sum = 0.0
+        self._errors = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, error=False):
+        with self._lock:
+            self._counts[bisect_left(self.buckets, seconds)] += 1
+            self._sum += seconds
+            if error:
+                self._errors += 1
+
+    def stats(self):
+        with self._lock:
+            counts, total, errors = list(self._counts), self._sum, self._errors
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            running += count
+            cumulative['+Inf' if bound == float('inf') else str(bound)] = running
+        return {'count': running, 'sum': round(total, 6), 'errors': errors, 'buckets': cumulative}
+
+
+class ProviderClient:
+    def __init__(self, key_id, key_secret, base_url=None, timeout=RAZORPAY_TIMEOUT, pool_size=RAZORPAY_POOL_SIZE,
+                 max_retries=RAZORPAY_MAX_RETRIES, breaker=None, backoff_base=0.2, backoff_max=2.0):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.hooks['response'].append(_raise_rate_limited)
+        options = {'base_url': base_url} if base_url else {}
+        self.sdk = razorpay.Client(session=session, auth=(key_id, key_secret), **options)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._histograms = {}
+        self._histograms_lock = threading.Lock()
+
+    def _histogram(self, operation):
+        with self._histograms_lock:
+            return self._histograms.setdefault(operation, LatencyHistogram())
+
+    def _call(self, operation, fn, *args, idempotent):
+        histogram = self._histogram(operation)
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        for attempt in range(attempts):
+            self.breaker.before_call()
+            start = time.perf_counter()
+            try:
+                result = fn(*args, timeout=self.timeout)
+            except RateLimited as e:
+                # The provider is up, just busy: no breaker failure
+                histogram.observe(time.perf_counter() - start, error=True)
+                self.breaker.record_success()
+                if attempt + 1 >= attempts:
+                    raise
+                time.sleep(min(e.retry_after, self.backoff_max))
+                continue
+            except TRANSIENT_ERRORS:
+                histogram.observe(time.perf_counter() - start, error=True)
+                self.breaker.record_failure()
+                if attempt + 1 >= attempts:
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                time.sleep(random.uniform(0, delay))   # full jitter
+                continue
+            except Exception:
+                # A 4xx is our problem, not the provider's: the call itself worked
+                histogram.observe(time.perf_counter() - start, error=True)
+                self.breaker.record_success()
+                raise
+            histogram.observe(time.perf_counter() - start)
+            self.breaker.record_success()
+            return result
+
+    # -- operations --
+    def create_order(self, data):
+        return self._call('order.create', self.sdk.order.create, data, idempotent=False)
+
+    def orders_by_receipt(self, receipt):
+        return self._call('order.list', self.sdk.order.all, {'receipt': receipt}, idempotent=True).get('items') or []
+
+    def fetch_order(self, order_id):
+        return self._call('order.fetch', self.sdk.order.fetch, order_id, idempotent=True)
+
+    def order_payments(self, order_id):
+        return self._call('order.payments', self.sdk.order.payments, order_id, idempotent=True).get('items') or []
+
+    def fetch_payment(self, payment_id):
+        return self._call('payment.fetch', self.sdk.payment.fetch, payment_id, idempotent=True)
+
+    def verify_payment_signature(self, params):
+        """Local HMAC check, no HTTP call; raises razorpay.errors.SignatureVerificationError."""
+        return self.sdk.utility.verify_payment_signature(params)
+
+    def stats(self):
+        with self._histograms_lock:
+            histograms = dict(self._histograms)
+        return {
+            'breaker': self.breaker.stats(),
+            'latency': {operation: h.stats() for operation, h in sorted(histograms.items())},
+        }
+
+
+def build_razorpay_client(base_url=RAZORPAY_BASE_URL, **options):
+    return ProviderClient(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET, base_url=base_url, **options)
+
+
+razorpay_client = build_razorpay_client()
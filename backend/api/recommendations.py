@@ -0,0 +1,217 @@
+"""Offline "frequently bought together" lists.
+
+``build_related_items`` turns ``order_items`` into an order x item incidence
+matrix ``B`` and takes ``C = B.T @ B``: ``C[i, j]`` is the number of orders
+containing both items, ``C[i, i]`` the number of orders containing ``i``.
+Pairs are scored by cosine similarity ``C[i, j] / sqrt(C[i, i] * C[j, j])``
+and the top K per item are written to the ``item_related`` table, which is
+all ``items/<id>/related/`` reads.
+
+The count matrix and a watermark are kept in a ``.npz`` file; an
+incremental run reads only the orders created since the watermark, adds
+their counts, and rewrites the lists of the items whose scores could have
+changed. The watermark is a ``created_at`` time, not an order id, and
+stays ``RELATED_ITEMS_SETTLE_AFTER`` behind the clock: ids are handed out
+at INSERT but become visible at COMMIT, so a lower id can appear after a
+higher one was read. An order still uncommitted that long after it was
+created is missed by incremental runs (``--full`` picks it up).
+"""
+import os
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+import numpy as np
+from scipy import sparse
+
+from .models import Item, OrderItem, RelatedItem
+
+
+RELATED_ITEMS_MATRIX_PATH = os.fspath(getattr(
+    settings, 'RELATED_ITEMS_MATRIX_PATH', settings.BASE_DIR / 'var' / 'related_items.npz'
+))
+RELATED_ITEMS_TOP_K = getattr(settings, 'RELATED_ITEMS_TOP_K', 20)
+RELATED_ITEMS_SETTLE_AFTER = getattr(settings, 'RELATED_ITEMS_SETTLE_AFTER', 10 * 60)   # seconds
+READ_CHUNK_SIZE = 50000
+WRITE_CHUNK_SIZE = 1000
+
+
+class CooccurrenceState:
+    """Symmetric co-occurrence counts of the orders created before ``watermark``
+    (all of them so far when it is None)."""
+
+    def __init__(self, counts, watermark=None):
+        self.counts = counts
+        self.watermark = watermark
+
+    @classmethod
+    def empty(cls):
+        return cls(sparse.csr_matrix((0, 0), dtype=np.int64))
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or RELATED_ITEMS_MATRIX_PATH
+        if not os.path.exists(path):
+            return cls.empty()
+        with np.load(path) as data:
+            counts = sparse.csr_matrix(
+                (data['data'], data['indices'], data['indptr']), shape=tuple(data['shape'])
+            )
+            return cls(counts, parse_datetime(str(data['watermark'])) if data['watermark'] else None)
+
+    def save(self, path=None):
+        path = path or RELATED_ITEMS_MATRIX_PATH
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-', suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                np.savez_compressed(
+                    fh, data=self.counts.data, indices=self.counts.indices, indptr=self.counts.indptr,
+                    shape=np.array(self.counts.shape),
+                    watermark=np.array(self.watermark.isoformat() if self.watermark else ''),
+                )
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return path
+
+
+def read_order_lines(since=None, until=None, chunk_size=READ_CHUNK_SIZE):
+    """``(order ids, item ids)`` arrays for orders created in ``[since, until)``,
+    read in keyset chunks on order_item_id. Without ``since``, orders with no
+    ``created_at`` are included too."""
+    qs = OrderItem.objects.all()
+    if since is not None:
+        qs = qs.filter(order__created_at__gte=since)
+    if until is not None:
+        settled = Q(order__created_at__lt=until)
+        qs = qs.filter(settled if since is not None else settled | Q(order__created_at__isnull=True))
+    orders, items = [], []
+    after = 0
+    while True:
+        chunk = list(
+            qs.filter(order_item_id__gt=after).order_by('order_item_id')
+            .values_list('order_item_id', 'order_id', 'item_id')[:chunk_size]
+        )
+        if not chunk:
+            break
+        block = np.array(chunk, dtype=np.int64)
+        orders.append(block[:, 1])
+        items.append(block[:, 2])
+        after = int(block[-1, 0])
+        if len(chunk) < chunk_size:
+            break
+    if not orders:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(orders), np.concatenate(items)
+
+
+def cooccurrence(order_ids, item_ids, n_items):
+    """``B.T @ B`` for the order x item incidence matrix (an item counted once per order)."""
+    _, rows = np.unique(order_ids, return_inverse=True)
+    incidence = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int64), (rows, item_ids)), shape=(int(rows.max()) + 1 if len(rows) else 0, n_items)
+    )
+    incidence.sum_duplicates()
+    incidence.data[:] = 1
+    return (incidence.T @ incidence).tocsr()
+
+
+def _resized(matrix, n):
+    if matrix.shape == (n, n):
+        return matrix
+    matrix = matrix.tocoo()
+    return sparse.csr_matrix((matrix.data, (matrix.row, matrix.col)), shape=(n, n))
+
+
+def top_related(counts, item_ids, top_k, min_count=1):
+    """``{item_id: [(related_id, score, co_orders), ...]}`` for ``item_ids``, best first."""
+    totals = counts.diagonal().astype(np.float64)
+    inv_norm = np.zeros_like(totals)
+    np.divide(1.0, np.sqrt(totals), out=inv_norm, where=totals > 0)
+    result = {}
+    for i in item_ids:
+        start, end = counts.indptr[i], counts.indptr[i + 1]
+        cols = counts.indices[start:end]
+        co = counts.data[start:end]
+        keep = (cols != i) & (co >= min_count)
+        cols, co = cols[keep], co[keep]
+        if not len(cols):
+            result[int(i)] = []
+            continue
+        scores = co * inv_norm[i] * inv_norm[cols]
+        if len(cols) > top_k:
+            part = np.argpartition(-scores, top_k - 1)[:top_k]
+            cols, co, scores = cols[part], co[part], scores[part]
+        order = np.lexsort((cols, -co, -scores))  # score, then co-orders, then id
+        result[int(i)] = [(int(cols[j]), float(scores[j]), int(co[j])) for j in order]
+    return result
+
+
+def write_related(related, replace_all=False):
+    """Replace the stored lists of the items in ``related`` - or every list,
+    with ``replace_all`` - in one transaction."""
+    known = set(Item.objects.values_list('item_id', flat=True))
+    item_ids = list(related)
+    with transaction.atomic():
+        if replace_all:
+            RelatedItem.objects.all().delete()
+        else:
+            for start in range(0, len(item_ids), WRITE_CHUNK_SIZE):
+                RelatedItem.objects.filter(item_id__in=item_ids[start:start + WRITE_CHUNK_SIZE]).delete()
+        rows = []
+        for item_id, entries in related.items():
+            if item_id not in known:
+                continue
+            entries = [entry for entry in entries if entry[0] in known]
+            rows.extend(
+                RelatedItem(item_id=item_id, related_item_id=rel, rank=rank, score=score, co_orders=co)
+                for rank, (rel, score, co) in enumerate(entries, 1)
+            )
+        RelatedItem.objects.bulk_create(rows, batch_size=WRITE_CHUNK_SIZE)
+    return len(rows)
+
+
+def build_related_items(full=False, top_k=RELATED_ITEMS_TOP_K, min_count=1, path=None):
+    """Fold new orders into the co-occurrence matrix and refresh the affected
+    lists (everything with ``full=True``). Returns a stats dict."""
+    state = CooccurrenceState.empty() if full else CooccurrenceState.load(path)
+    # Orders created before this have committed (or rolled back) by now
+    until = timezone.now() - timedelta(seconds=RELATED_ITEMS_SETTLE_AFTER)
+    if state.watermark is not None:
+        until = max(until, state.watermark)
+    order_ids, item_ids = read_order_lines(state.watermark, until)
+
+    n_items = max(state.counts.shape[0], int(item_ids.max()) + 1 if len(item_ids) else 0)
+    counts = _resized(state.counts, n_items)
+    if len(item_ids):
+        delta = cooccurrence(order_ids, item_ids, n_items)
+        counts = (counts + delta).tocsr()
+        touched = np.unique(item_ids)
+        # Cosine scores of a neighbour change when either side's total does
+        affected = np.unique(np.concatenate([touched, counts[touched].indices]))
+    else:
+        affected = np.empty(0, dtype=np.int64)
+    if full:
+        affected = np.flatnonzero(counts.diagonal())
+
+    # Save the counts first: a failed table write is repaired by --full,
+    # whereas re-reading the same orders would count them twice.
+    state = CooccurrenceState(counts, until)
+    state.save(path)
+    written = write_related(top_related(counts, affected, top_k, min_count), replace_all=full)
+    return {
+        'order_lines': len(item_ids),
+        'orders': len(np.unique(order_ids)),
+        'items_refreshed': len(affected),
+        'rows_written': written,
+        'watermark': state.watermark,
+        'pairs': (counts.nnz - np.count_nonzero(counts.diagonal())) // 2,
+    }
@@ -0,0 +1,175 @@
+"""Reconciliation of payments nobody confirmed.
+
+When the browser is closed before ``verify_payment`` runs (and no webhook
+arrives), a payment stays ``created`` / ``pending``. ``reconcile`` walks
+those older than ``RECONCILE_STALE_AFTER`` in keyset chunks on id, asks
+the provider for each order's payment attempts on a bounded thread pool,
+and applies what it learns through ``payments.bulk_transition`` - one
+UPDATE per target status and chunk for the payments, one for their
+orders. A payment with no attempt at all after ``RECONCILE_EXPIRE_AFTER``
+is expired: it moves to ``failed``, which releases its order's stock.
+
+Provider calls go through a shared token bucket (``RECONCILE_RATE`` calls
+per second). A 429 pauses every worker for the ``Retry-After`` and halves
+the rate for the rest of the run; an open circuit breaker ends the run
+after the current chunk.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Payment
+from .payments import bulk_transition, provider_payment_columns
+from .provider import CircuitOpen, RateLimited
+
+
+RECONCILE_STALE_AFTER = getattr(settings, 'RECONCILE_STALE_AFTER', 30 * 60)   # seconds
+RECONCILE_EXPIRE_AFTER = getattr(settings, 'RECONCILE_EXPIRE_AFTER', 24 * 60 * 60)  # seconds
+RECONCILE_RATE = getattr(settings, 'RECONCILE_RATE', 20.0)                     # provider calls per second
+RECONCILE_CHUNK_SIZE = 200
+RECONCILE_RATE_LIMIT_RETRIES = 5
+STALE_STATUSES = ('created', 'pending')
+# Applied in this order, so that a refund lands after its capture
+TARGETS = ('failed', 'authorized', 'captured', 'refunded')
+
+
+class RateLimiter:
+    """Token bucket shared by the worker threads."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = burst or max(1.0, self.rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.throttled = 0
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def throttle(self, retry_after):
+        """The provider said 429: everyone waits, and we slow down."""
+        with self._lock:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self.rate = max(self.rate / 2, 0.5)
+            self._tokens = 0
+
+
+def stale_payments(cutoff, after_id=0, limit=RECONCILE_CHUNK_SIZE):
+    return list(
+        Payment.objects.filter(
+            status__in=STALE_STATUSES, provider_order_id__isnull=False, created_at__lt=cutoff, id__gt=after_id,
+        ).order_by('id').values('id', 'provider_order_id', 'created_at')[:limit]
+    )
+
+
+def outcome(attempts, expired=False):
+    """``[(target status, columns), ...]`` from an order's payment attempts;
+    empty when there is nothing to conclude yet (no attempt, or one in
+    flight) - unless ``expired`` and there was no attempt at all."""
+    by_status = {}
+    for attempt in sorted(attempts, key=lambda a: a.get('created_at') or 0):
+        by_status[attempt.get('status')] = attempt   # latest attempt of each status
+    for status in ('refunded', 'captured', 'authorized'):
+        if status in by_status:
+            entity = by_status[status]
+            if status == 'refunded':
+                # Via captured: the state machine only refunds captured payments
+                return [('captured', provider_payment_columns(entity, 'captured')), ('refunded', {})]
+            return [(status, provider_payment_columns(entity, status))]
+    if attempts and set(by_status) == {'failed'}:
+        return [('failed', provider_payment_columns(by_status['failed'], 'failed'))]
+    if expired and not attempts:
+        return [('failed', {'error_code': 'EXPIRED', 'error_description': 'No payment attempt before expiry'})]
+    return []
+
+
+class Reconciler:
+    def __init__(self, client, executor, rate=RECONCILE_RATE, chunk_size=RECONCILE_CHUNK_SIZE,
+                 stale_after=RECONCILE_STALE_AFTER, expire_after=RECONCILE_EXPIRE_AFTER, dry_run=False):
+        self.client = client
+        self.executor = executor
+        self.limiter = RateLimiter(rate)
+        self.chunk_size = chunk_size
+        self.stale_after = stale_after
+        self.expire_after = expire_after
+        self.dry_run = dry_run
+        self.stats = {'checked': 0, 'unchanged': 0, 'errors': 0, 'lost': 0, 'throttled': 0, 'aborted': None}
+        self.stats.update({target: 0 for target in TARGETS})
+
+    def _attempts(self, provider_order_id):
+        for _ in range(RECONCILE_RATE_LIMIT_RETRIES):
+            self.limiter.acquire()
+            try:
+                return self.client.order_payments(provider_order_id)
+            except RateLimited as e:
+                self.limiter.throttle(e.retry_after)
+        raise RateLimited(0)
+
+    def _query(self, row):
+        try:
+            return row, self._attempts(row['provider_order_id']), None
+        except Exception as e:   # reported per payment; CircuitOpen also ends the run
+            return row, None, e
+
+    def run_chunk(self, rows):
+        changes = {target: {} for target in TARGETS}
+        expire_before = timezone.now() - timedelta(seconds=self.expire_after)
+        for row, attempts, error in self.executor.map(self._query, rows):
+            if error is not None:
+                self.stats['errors'] += 1
+                if isinstance(error, CircuitOpen):
+                    self.stats['aborted'] = str(error)
+                continue
+            planned = outcome(attempts, expired=row['created_at'] < expire_before)
+            if not planned:
+                self.stats['unchanged'] += 1
+            for target, columns in planned:
+                changes[target][row['provider_order_id']] = columns
+        for target in TARGETS:
+            if self.dry_run:
+                self.stats[target] += len(changes[target])
+                continue
+            moved = bulk_transition(target, changes[target])
+            self.stats[target] += len(moved)
+            # Changed since we read it (a webhook or the browser got there first)
+            self.stats['lost'] += len(changes[target]) - len(moved)
+        self.stats['checked'] += len(rows)
+        self.stats['throttled'] = self.limiter.throttled
+
+    def run(self, limit=None, progress=None):
+        """Reconcile every stale payment (at most ``limit``); returns the stats."""
+        cutoff = timezone.now() - timedelta(seconds=self.stale_after)
+        after = 0
+        while not self.stats['aborted']:
+            size = self.chunk_size if limit is None else min(self.chunk_size, limit - self.stats['checked'])
+            rows = stale_payments(cutoff, after, size) if size > 0 else []
+            if not rows:
+                break
+            self.run_chunk(rows)
+            after = rows[-1]['id']
+            if progress:
+                progress(self.stats)
+        return self.stats
+
+
+def reconcile(client, workers=8, **options):
+    limit = options.pop('limit', None)
+    progress = options.pop('progress', None)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reconcile') as executor:
+        return Reconciler(client, executor, **options).run(limit=limit, progress=progress)
@@ -0,0 +1,355 @@
+"""In-process full-text product search.
+
+An inverted index over item names, descriptions and category / subcategory
+names, ranked with BM25. Query tokens also match indexed terms by prefix
+(search-as-you-type) and within one edit (typos), at a reduced weight.
+
+The index is kept current by the Item signals in ``api.signals`` and can be
+written to a compact snapshot (zlib-compressed JSON) so a fresh worker starts
+warm instead of re-reading the whole ``items`` table.
+"""
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+import zlib
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Item
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+SEARCH_INDEX_PATH = getattr(settings, 'SEARCH_INDEX_PATH', settings.BASE_DIR / 'var' / 'search_index.snapshot')
+
+# Field weights: a hit in the item name counts more than one in the description
+FIELD_WEIGHTS = {
+    'item_name': 3,
+    'category_name': 2,
+    'sub_category_name': 2,
+    'description': 1,
+}
+DOCUMENT_COLUMNS = (
+    'item_id', 'item_name', 'description',
+    'category__category_name', 'sub_category__sub_category_name', 'updated_at',
+)
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Match-type weights relative to an exact term hit
+PREFIX_WEIGHT = 0.7
+FUZZY_WEIGHT = 0.5
+MIN_PREFIX_LEN = 2
+MIN_FUZZY_LEN = 4
+MAX_PREFIX_EXPANSIONS = 50
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _deletes(term):
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _within_one_edit(a, b):
+    """Optimal-string-alignment distance <= 1 (insert, delete, substitute, transpose)."""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diff = [i for i in range(la) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return (len(diff) == 2 and diff[1] == diff[0] + 1
+                and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]])
+    if la > lb:
+        a, b = b, a
+    # b is a with one extra character
+    for i in range(len(a)):
+        if a[i] != b[i]:
+            return a[i:] == b[i + 1:]
+    return True
+
+
+def document_terms(row):
+    """Weighted term frequencies for one ``values(*DOCUMENT_COLUMNS)`` row."""
+    fields = {
+        'item_name': row['item_name'],
+        'description': row['description'],
+        'category_name': row['category__category_name'],
+        'sub_category_name': row['sub_category__sub_category_name'],
+    }
+    terms = defaultdict(int)
+    for field, text in fields.items():
+        weight = FIELD_WEIGHTS[field]
+        for token in tokenize(text):
+            terms[token] += weight
+    return dict(terms)
+
+
+class SearchIndex:
+    """Thread-safe BM25 inverted index keyed by ``item_id``."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.postings = defaultdict(dict)     # term -> {item_id: weighted tf}
+        self.doc_terms = {}                   # item_id -> {term: weighted tf}
+        self.doc_len = {}                     # item_id -> weighted length
+        self.total_len = 0
+        self.watermark = None                 # newest Item.updated_at indexed
+        self._vocab = []                      # sorted terms, for prefix lookups
+        self._vocab_dirty = False
+        self._deletes = defaultdict(set)      # one-char deletion -> terms, for typos
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    # ---- writes ----
+    def _add(self, item_id, terms):
+        self._remove(item_id)
+        if not terms:
+            return
+        self.doc_terms[item_id] = terms
+        length = sum(terms.values())
+        self.doc_len[item_id] = length
+        self.total_len += length
+        for term, tf in terms.items():
+            if term not in self.postings:
+                self._term_added(term)
+            self.postings[term][item_id] = tf
+
+    def _remove(self, item_id):
+        terms = self.doc_terms.pop(item_id, None)
+        if terms is None:
+            return
+        self.total_len -= self.doc_len.pop(item_id)
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is None:
+                continue
+            docs.pop(item_id, None)
+            if not docs:
+                del self.postings[term]
+                self._term_removed(term)
+
+    def _term_added(self, term):
+        self._vocab_dirty = True
+        if len(term) >= MIN_FUZZY_LEN:
+            for d in _deletes(term):
+                self._deletes[d].add(term)
+
+    def _term_removed(self, term):
+        self._vocab_dirty = True
+        if len(term) >= MIN_FUZZY_LEN:
+            for d in _deletes(term):
+                terms = self._deletes.get(d)
+                if terms is not None:
+                    terms.discard(term)
+                    if not terms:
+                        del self._deletes[d]
+
+    def _advance_watermark(self, updated_at):
+        if updated_at is not None and (self.watermark is None or updated_at > self.watermark):
+            self.watermark = updated_at
+
+    def index_rows(self, rows):
+        """Add or replace documents from ``values(*DOCUMENT_COLUMNS)`` rows."""
+        with self._lock:
+            for row in rows:
+                self._add(row['item_id'], document_terms(row))
+                self._advance_watermark(row['updated_at'])
+
+    def remove(self, item_ids):
+        with self._lock:
+            for item_id in item_ids:
+                self._remove(item_id)
+
+    # ---- reads ----
+    def _refresh_vocab(self):
+        if self._vocab_dirty:
+            self._vocab = sorted(self.postings)
+            self._vocab_dirty = False
+
+    def _expand(self, token):
+        """Indexed terms matching ``token`` mapped to their match weight."""
+        matches = {}
+        if token in self.postings:
+            matches[token] = 1.0
+        if len(token) >= MIN_PREFIX_LEN:
+            i = bisect_left(self._vocab, token)
+            found = 0
+            while i < len(self._vocab) and self._vocab[i].startswith(token) and found < MAX_PREFIX_EXPANSIONS:
+                matches.setdefault(self._vocab[i], PREFIX_WEIGHT)
+                i += 1
+                found += 1
+        if len(token) >= MIN_FUZZY_LEN:
+            # Terms one char longer share ``token`` as a deletion; same-length
+            # substitutions/transpositions share a deletion; shorter terms are
+            # one of the token's deletions.
+            candidates = set(self._deletes.get(token, ()))
+            for d in _deletes(token):
+                candidates.update(self._deletes.get(d, ()))
+                if d in self.postings:
+                    candidates.add(d)
+            for term in candidates:
+                if term not in matches and _within_one_edit(token, term):
+                    matches[term] = FUZZY_WEIGHT
+        return matches
+
+    @staticmethod
+    def _idf(n_docs, doc_freq):
+        return math.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def search(self, query, limit=20):
+        """Return ``[(item_id, score), ...]`` best first."""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        with self._lock:
+            n_docs = len(self.doc_terms)
+            if not n_docs:
+                return []
+            self._refresh_vocab()
+            avg_len = self.total_len / n_docs
+            scores = defaultdict(float)
+            for token in tokens:
+                # Best expansion per document, so "chair" + "chairs" do not double count
+                best = {}
+                # An expansion is never rarer than the word typed: otherwise a
+                # rare completion ("chairside") outranks the exact hit ("chair")
+                exact = self.postings.get(token)
+                max_idf = self._idf(n_docs, len(exact)) if exact else math.inf
+                for term, weight in self._expand(token).items():
+                    docs = self.postings[term]
+                    idf = min(self._idf(n_docs, len(docs)), max_idf)
+                    for item_id, tf in docs.items():
+                        norm = K1 * (1 - B + B * self.doc_len[item_id] / avg_len)
+                        score = weight * idf * tf * (K1 + 1) / (tf + norm)
+                        if score > best.get(item_id, 0.0):
+                            best[item_id] = score
+                for item_id, score in best.items():
+                    scores[item_id] += score
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))
+        return ranked[:limit]
+
+    # ---- snapshot ----
+    def to_bytes(self):
+        with self._lock:
+            payload = {
+                'format': SNAPSHOT_FORMAT,
+                'watermark': self.watermark.isoformat() if self.watermark else None,
+                'docs': {str(item_id): terms for item_id, terms in self.doc_terms.items()},
+            }
+            raw = json.dumps(payload, separators=(',', ':')).encode()
+        return zlib.compress(raw, 6)
+
+    @classmethod
+    def from_bytes(cls, data):
+        payload = json.loads(zlib.decompress(data))
+        if not isinstance(payload, dict) or payload.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError('Unsupported search snapshot format')
+        index = cls()
+        try:
+            for item_id, terms in payload['docs'].items():
+                index._add(int(item_id), terms)
+            if payload['watermark']:
+                index.watermark = parse_datetime(payload['watermark'])
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f'Malformed search snapshot: {e!r}') from e
+        return index
+
+    def save(self, path=None):
+        """Atomically write the snapshot file."""
+        path = os.fspath(path or SEARCH_INDEX_PATH)
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.search-')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(self.to_bytes())
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return path
+
+
+def document_rows(queryset=None):
+    queryset = Item.objects.all() if queryset is None else queryset
+    return queryset.values(*DOCUMENT_COLUMNS).iterator(chunk_size=2000)
+
+
+def build_index():
+    index = SearchIndex()
+    index.index_rows(document_rows())
+    if index.watermark is None:
+        index.watermark = timezone.now()
+    return index
+
+
+def load_index(path=None):
+    """Load the snapshot and catch up with items changed since it was written."""
+    with open(path or SEARCH_INDEX_PATH, 'rb') as fh:
+        index = SearchIndex.from_bytes(fh.read())
+    if index.watermark is not None:
+        index.index_rows(document_rows(Item.objects.filter(updated_at__gt=index.watermark)))
+    return index
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index():
+    """Process-wide index: warm from the snapshot if present, else built from the DB."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    _index = load_index()
+                except FileNotFoundError:
+                    _index = build_index()
+                except (OSError, ValueError, zlib.error) as e:
+                    # A corrupt snapshot must not take search down; the next save replaces it
+                    logger.warning('Search snapshot unreadable, rebuilding from the database: %s', e)
+                    _index = build_index()
+    return _index
+
+
+def loaded_search_index():
+    """The process-wide index if it has been loaded, without loading it."""
+    return _index
+
+
+def reindex_items(queryset):
+    index = loaded_search_index()
+    if index is not None:
+        index.index_rows(document_rows(queryset))
+
+
+def remove_items(item_ids):
+    index = loaded_search_index()
+    if index is not None:
+        index.remove(item_ids)
@@ -1,3 +1,5 @@
+from decimal import Decimal
+from django.utils import timezone
 from rest_framework import serializers
 from .models import User
 from .models import Item, Cart, Wishlist, MainCategory, Category, SubCategory
@@ -26,6 +28,57 @@ class ItemMinimalSerializer(serializers.ModelSerializer):
         ]
 
 
+# Columns needed to build an ItemMinimalSerializer-shaped dict from .values()
+ITEM_MINIMAL_COLUMNS = ('item_id', 'item_name', 'selling_price', 'category_id', 'sub_category_id', 'image')
+_CENTS = Decimal('0.01')
+
+
+def format_price(value):
+    """Render a price the way a ``DecimalField(decimal_places=2)`` does."""
+    return None if value is None else '{:f}'.format(value.quantize(_CENTS))
+
+
+def format_datetime(value):
+    """Render a datetime the way DRF's DateTimeField does (current timezone, 'Z' for UTC)."""
+    if value is None:
+        return None
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def item_minimal_from_values(row):
+    """Shape a ``values(*ITEM_MINIMAL_COLUMNS)`` row like ItemMinimalSerializer,
+    without instantiating models or serializer fields."""
+    return {
+        'item_id': row['item_id'],
+        'item_name': row['item_name'],
+        'selling_price': format_price(row['selling_price']),
+        'category': row['category_id'],
+        'sub_category': row['sub_category_id'],
+        'image': row['image'],
+    }
+
+
+def item_minimal_rows(queryset):
+    """ItemMinimalSerializer(queryset, many=True).data, built from values_list() tuples."""
+    return [
+        {
+            'item_id': item_id,
+            'item_name': item_name,
+            'selling_price': format_price(selling_price),
+            'category': category_id,
+            'sub_category': sub_category_id,
+            'image': image,
+        }
+        for item_id, item_name, selling_price, category_id, sub_category_id, image
+        in queryset.values_list(*ITEM_MINIMAL_COLUMNS)
+    ]
+
+
 class ItemDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Item
@@ -53,6 +106,45 @@ class WishlistSerializer(serializers.ModelSerializer):
         fields = ['wishlist_id', 'user', 'item', 'added_at', 'item_name', 'image', 'selling_price']
 
 
+CART_COLUMNS = ('cart_id', 'user_id', 'item_id', 'quantity', 'added_at', 'item__item_name', 'item__image', 'item__selling_price')
+WISHLIST_COLUMNS = ('wishlist_id', 'user_id', 'item_id', 'added_at', 'item__item_name', 'item__image', 'item__selling_price')
+
+
+def cart_rows(queryset):
+    """CartSerializer(queryset, many=True).data, built from values_list() tuples."""
+    return [
+        {
+            'cart_id': cart_id,
+            'user': user_id,
+            'item': item_id,
+            'quantity': quantity,
+            'added_at': format_datetime(added_at),
+            'item_name': item_name,
+            'image': image,
+            'selling_price': format_price(selling_price),
+        }
+        for cart_id, user_id, item_id, quantity, added_at, item_name, image, selling_price
+        in queryset.values_list(*CART_COLUMNS)
+    ]
+
+
+def wishlist_rows(queryset):
+    """WishlistSerializer(queryset, many=True).data, built from values_list() tuples."""
+    return [
+        {
+            'wishlist_id': wishlist_id,
+            'user': user_id,
+            'item': item_id,
+            'added_at': format_datetime(added_at),
+            'item_name': item_name,
+            'image': image,
+            'selling_price': format_price(selling_price),
+        }
+        for wishlist_id, user_id, item_id, added_at, item_name, image, selling_price
+        in queryset.values_list(*WISHLIST_COLUMNS)
+    ]
+
+
 # -------- Header Menu Serializers (Nested) --------
 class SubCategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,92 @@
+"""Model signal receivers that keep the caches in ``api.cache`` and the
+search index in ``api.search`` fresh.
+
+Note: ``QuerySet.update()`` and bulk operations do not send these signals;
+code paths using them must invalidate explicitly.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cache as api_cache
+from . import search
+from .models import Cart, Category, Item, MainCategory, SubCategory, Wishlist
+
+
+@receiver([post_save, post_delete], sender=MainCategory)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SubCategory)
+def invalidate_menu_tree(sender, **kwargs):
+    # Wait for the commit, otherwise a concurrent request could rebuild the
+    # new version from rows that are not visible yet.
+    transaction.on_commit(api_cache.invalidate_menu_tree)
+
+
+@receiver(post_save, sender=Item)
+def reindex_item(sender, instance, **kwargs):
+    item_id = instance.pk
+    transaction.on_commit(lambda: search.reindex_items(Item.objects.filter(pk=item_id)))
+
+
+@receiver(post_delete, sender=Item)
+def unindex_item(sender, instance, **kwargs):
+    item_id = instance.pk
+    transaction.on_commit(lambda: search.remove_items([item_id]))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SubCategory)
+def reindex_category_items(sender, instance, created, **kwargs):
+    # Category names are part of each item's searchable text
+    if created:
+        return
+    lookup = 'category_id' if sender is Category else 'sub_category_id'
+    pk = instance.pk
+    transaction.on_commit(lambda: search.reindex_items(Item.objects.filter(**{lookup: pk})))
+
+
+@receiver(pre_save, sender=Item)
+def remember_item_subcategory(sender, instance, raw=False, **kwargs):
+    # An item moved to another subcategory changes the facets of both
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._previous_sub_category_id = (
+        Item.objects.filter(pk=instance.pk).values_list('sub_category_id', flat=True).first()
+    )
+
+
+@receiver([post_save, post_delete], sender=Item)
+def invalidate_item_facets(sender, instance, **kwargs):
+    ids = {instance.sub_category_id, getattr(instance, '_previous_sub_category_id', None)}
+    transaction.on_commit(lambda: api_cache.invalidate_subcategory_facets(*ids))
+
+
+@receiver([post_save, post_delete], sender=Item)
+def invalidate_item_detail(sender, instance, **kwargs):
+    item_id = instance.pk
+    transaction.on_commit(lambda: api_cache.invalidate_item_detail(item_id))
+
+
+@receiver([post_save, post_delete], sender=Cart)
+def invalidate_cart_caches(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: api_cache.invalidate_cart(user_id))
+
+
+@receiver([post_save, post_delete], sender=Wishlist)
+def invalidate_wishlist_membership(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: api_cache.invalidate_membership('wishlist', user_id))
+
+
+@receiver(post_save, sender=Item)
+def invalidate_cart_summaries_for_item(sender, instance, created, **kwargs):
+    # Price and stock feed every summary that has this item in the cart
+    if created:
+        return
+    item_id = instance.pk
+
+    def invalidate():
+        user_ids = Cart.objects.filter(item_id=item_id).values_list('user_id', flat=True).distinct()
+        api_cache.invalidate_cart_summary(*user_ids)
+    transaction.on_commit(invalidate)
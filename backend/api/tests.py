@@ -1,3 +1,1776 @@
-from django.test import TestCase
+import base64
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import numpy as np
+import razorpay
+import requests
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+try:
+    from PIL import Image
+except ImportError:  # optional: pip install Pillow
+    Image = None
+
+from .cache import get_cart_summary, item_detail_cache, get_membership, invalidate_cart_summary, invalidate_membership
+from .authentication import ACCESS_TOKEN_TTL, REFRESH, issue_tokens, verify_token
+from .cart import add_to_cart
+from .guest_cart import GUEST_CART_HEADER, GUEST_CART_MAX_QUANTITY, InMemoryGuestCartStore, valid_token
+from .idempotency import responses as idempotent_responses
+from .images import DerivativeCache
+from .models import (
+    Cart, Category, IdempotencyKey, Item, MainCategory, Order, OrderItem, Payment, PaymentOutbox,
+    RazorpayWebhookEvent, RazorpayWebhookLog, RelatedItem, SubCategory, User, Wishlist,
+)
+from .orders import OutOfStock, place_order
+from .payments import transition
+from .outbox import OutboxWorker, create_pending_payment
+from .provider import CircuitBreaker, CircuitOpen, build_razorpay_client
+from .user_import import insert_users, split_conflicts
+from .recommendations import build_related_items, cooccurrence, top_related
+from .search import SearchIndex, build_index, get_search_index
+from .renderers import FastJSONRenderer
+from .serializers import (
+    CartSerializer, ItemMinimalSerializer, WishlistSerializer, cart_rows, item_minimal_rows, wishlist_rows,
+)
+from .reconcile import reconcile
+from .pricing import cart_summary, order_charges
+from .views import HOME_FEED_DEFAULT_LIMIT, HOME_FEED_MAX_LIMIT
+from .webhooks import WebhookWorker, replay
+
+
+def concurrent_writes_supported():
+    """Whether concurrent read-then-write transactions serialize correctly here."""
+    if connection.vendor == 'sqlite':
+        # No row locks: only IMMEDIATE transactions on a file database serialize
+        return (
+            not connection.is_in_memory_db()
+            and connection.settings_dict['OPTIONS'].get('transaction_mode') == 'IMMEDIATE'
+        )
+    return True
+
+
+def run_concurrently(workers, target):
+    """Start ``workers`` threads on ``target`` together; re-raise the first error."""
+    barrier = threading.Barrier(workers)
+    errors = []
+
+    def run():
+        try:
+            barrier.wait()
+            target()
+        except Exception as e:  # collected and re-raised in the main thread
+            errors.append(e)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=run) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+
+
+class FakeRazorpay:
+    """Minimal local stand-in for the Razorpay orders API.
+
+    ``fail_next`` answers the next N calls with a 500; ``lose_next`` performs
+    the next N order creations but answers 500, as if the response was lost;
+    ``reject_next`` answers the next N calls with a 400 BAD_REQUEST_ERROR;
+    ``throttle_next`` answers the next N calls with a 429; ``delay`` holds
+    every response back that many seconds. ``payments`` maps an order id to
+    its payment attempts.
+    """
+
+    def __init__(self):
+        self.orders = {}
+        self.payments = {}
+        self.requests = []
+        self.fail_next = self.lose_next = self.reject_next = self.throttle_next = 0
+        self.delay = 0
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code, body):
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                if code == 429:
+                    self.send_header('Retry-After', '0.01')
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                time.sleep(fake.delay)
+                self._send(*fake.handle('GET', self.path, None))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                self._send(*fake.handle('POST', self.path, json.loads(self.rfile.read(length) or b'{}')))
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.handle_error = lambda request, address: None  # clients that timed out and left
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, method, path, body):
+        url = urlparse(path)
+        with self.lock:
+            self.requests.append((method, url.path))
+            if self.throttle_next:
+                self.throttle_next -= 1
+                return 429, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Too many requests'}}
+            if self.reject_next:
+                self.reject_next -= 1
+                return 400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'rejected'}}
+            if self.fail_next:
+                self.fail_next -= 1
+                return 500, {'error': {'code': 'SERVER_ERROR', 'description': 'unavailable'}}
+            if method == 'POST' and url.path == '/v1/orders':
+                order = dict(body, id=f'order_fake{len(self.orders) + 1}', status='created', entity='order')
+                self.orders[order['id']] = order
+                if self.lose_next:
+                    self.lose_next -= 1
+                    return 500, {'error': {'code': 'SERVER_ERROR', 'description': 'lost'}}
+                return 200, order
+            if method == 'GET' and url.path == '/v1/orders':
+                receipt = parse_qs(url.query).get('receipt', [None])[0]
+                items = [o for o in self.orders.values() if receipt is None or o.get('receipt') == receipt]
+                return 200, {'entity': 'collection', 'count': len(items), 'items': items}
+            if method == 'GET' and url.path.startswith('/v1/orders/') and url.path.endswith('/payments'):
+                items = self.payments.get(url.path.split('/')[3], [])
+                return 200, {'entity': 'collection', 'count': len(items), 'items': items}
+            if method == 'GET' and url.path.startswith('/v1/orders/'):
+                order = self.orders.get(url.path.rsplit('/', 1)[1])
+                return (200, order) if order else (400, {'error': {'code': 'BAD_REQUEST_ERROR'}})
+            return 404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'not found'}}
+
+
+class UnmanagedTablesMixin:
+    """Creates the tables of ``unmanaged_models`` (managed = False, so migrations
+    skip them) for the test class and drops them afterwards."""
+    unmanaged_models = ()
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        existing = set(connection.introspection.table_names())
+        cls._created_models = [m for m in cls.unmanaged_models if m._meta.db_table not in existing]
+        with connection.schema_editor() as editor:
+            for model in cls._created_models:
+                editor.create_model(model)
+
+    @classmethod
+    def tearDownClass(cls):
+        with connection.schema_editor() as editor:
+            for model in reversed(cls._created_models):
+                editor.delete_model(model)
+        super().tearDownClass()
+
+    def tearDown(self):
+        # flush() leaves unmanaged tables alone. Plain DELETEs: the ORM's
+        # cascade would also visit related unmanaged tables we did not create.
+        with connection.cursor() as cursor:
+            for model in reversed(self.unmanaged_models):
+                cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+        super().tearDown()
+
+
+class CartUpsertConcurrencyTests(TransactionTestCase):
+    WORKERS = 16
+    ADDS_PER_WORKER = 20
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise unittest.SkipTest('needs a file-backed or server database for concurrent connections')
+        self.user = User.objects.create(
+            first_name='Test', last_name='User', email='cart@example.com', mobile_number='9000000001', password='x',
+        )
+        category = Category.objects.create(category_name='Toys')
+        self.item = Item.objects.create(category=category, item_name='Wooden train', actual_price='10.00')
+
+    def test_concurrent_adds_to_same_line(self):
+        def hammer():
+            for _ in range(self.ADDS_PER_WORKER):
+                add_to_cart(self.user.user_id, self.item.item_id, 1)
+
+        run_concurrently(self.WORKERS, hammer)
+
+        lines = Cart.objects.filter(user=self.user, item=self.item)
+        self.assertEqual(lines.count(), 1)
+        self.assertEqual(lines.get().quantity, self.WORKERS * self.ADDS_PER_WORKER)
+
+    def test_add_reports_created_only_for_first_insert(self):
+        line, created = add_to_cart(self.user.user_id, self.item.item_id, 2)
+        self.assertTrue(created)
+        self.assertEqual(line.quantity, 2)
+        line, created = add_to_cart(self.user.user_id, self.item.item_id, 3)
+        self.assertFalse(created)
+        self.assertEqual(line.quantity, 5)
+
+
+def bearer(user_id):
+    """Request headers authenticating as ``user_id``."""
+    return {'HTTP_AUTHORIZATION': f"Bearer {issue_tokens(user_id)['access']}"}
+
+
+class ApiClientMixin:
+    """``self.api``: an APIClient with the test host allowed."""
+
+    def setUp(self):
+        super().setUp()
+        self.api = APIClient()
+        settings_override = self.settings(ALLOWED_HOSTS=['testserver'])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class CartBatchTests(ApiClientMixin, TransactionTestCase):
+    # Transactional: foreign keys are checked at commit
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            first_name='Test', last_name='User', email='batch@example.com', mobile_number='9000000008', password='x',
+        )
+        category = Category.objects.create(category_name='Toys')
+        self.kite = Item.objects.create(category=category, item_name='Kite', actual_price='200.00', stock_quantity=5)
+        self.yoyo = Item.objects.create(category=category, item_name='Yo-yo', actual_price='80.00', stock_quantity=5)
+
+    def batch(self, operations, user_id=None):
+        return self.api.post('/EcoMall/cart/batch/', {
+            'user_id': user_id or self.user.user_id, 'operations': operations,
+        }, format='json')
+
+    def test_operations_apply_in_order(self):
+        response = self.batch([
+            {'op': 'add', 'item_id': self.kite.item_id, 'quantity': 2},
+            {'op': 'set', 'item_id': self.kite.item_id, 'quantity': 5},
+            {'op': 'add', 'item_id': self.yoyo.item_id},
+            {'op': 'remove', 'item_id': self.yoyo.item_id},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['quantity'] for r in response.json()['results']], [2, 5, 1, 0])
+        self.assertEqual([r['created'] for r in response.json()['results']], [True, False, True, False])
+        self.assertEqual(dict(Cart.objects.values_list('item_id', 'quantity')), {self.kite.item_id: 5})
+
+    def test_invalid_operation_rejects_the_whole_batch(self):
+        response = self.batch([
+            {'op': 'add', 'item_id': self.kite.item_id},
+            {'op': 'add', 'item_id': 999999},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([r['status'] for r in response.json()['results']], ['ok', 'error'])
+        self.assertFalse(Cart.objects.exists())
+
+    def test_unknown_user_is_a_bad_request(self):
+        response = self.batch([{'op': 'add', 'item_id': self.kite.item_id}], user_id=999999)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Unknown user_id')
+
+
+class GuestCartTests(ApiClientMixin, TransactionTestCase):
+    # Transactional: a merge for an unknown user only fails at commit
+    def setUp(self):
+        super().setUp()
+        self.store = InMemoryGuestCartStore()
+        patcher = mock.patch('api.guest_cart._store', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create(
+            first_name='Test', last_name='User', email='guest@example.com', mobile_number='9000000015', password='x',
+        )
+        category = Category.objects.create(category_name='Toys')
+        self.kite = Item.objects.create(category=category, item_name='Kite', actual_price='200.00')
+        self.yoyo = Item.objects.create(category=category, item_name='Yo-yo', actual_price='80.00')
+
+    def post(self, operations, token=None):
+        headers = {GUEST_CART_HEADER: token} if token else {}
+        return self.api.post('/EcoMall/cart/guest/', {'operations': operations}, format='json', **headers)
+
+    def quantities(self, response):
+        return {row['item_id']: row['quantity'] for row in response.json()['items']}
+
+    def test_operations_start_and_update_a_cart(self):
+        response = self.post([{'op': 'add', 'item_id': self.kite.item_id, 'quantity': 2}])
+        self.assertEqual(response.status_code, 200)
+        token = response.json()['token']
+        self.assertTrue(valid_token(token))
+        response = self.post([
+            {'op': 'add', 'item_id': self.kite.item_id},
+            {'op': 'set', 'item_id': self.yoyo.item_id, 'quantity': 4},
+        ], token)
+        self.assertEqual(response.json()['token'], token)
+        self.assertEqual(self.quantities(response), {self.kite.item_id: 3, self.yoyo.item_id: 4})
+        self.post([{'op': 'remove', 'item_id': self.kite.item_id}], token)
+        response = self.api.get('/EcoMall/cart/guest/', **{GUEST_CART_HEADER: token})
+        self.assertEqual(self.quantities(response), {self.yoyo.item_id: 4})
+        self.assertFalse(Cart.objects.exists())   # nothing written until the merge
+
+    def test_bad_requests(self):
+        self.assertEqual(self.api.get('/EcoMall/cart/guest/').status_code, 400)
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post([{'op': 'add', 'item_id': 999999}]).status_code, 400)
+        self.store.max_lines = 1
+        response = self.post([
+            {'op': 'add', 'item_id': self.kite.item_id},
+            {'op': 'add', 'item_id': self.yoyo.item_id},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.store), 0)
+
+    def test_store_caps_quantity_expires_and_drops_least_recent(self):
+        store = InMemoryGuestCartStore(max_carts=2, ttl=60)
+        lines = store.apply('a', [('add', 1, GUEST_CART_MAX_QUANTITY), ('add', 1, 5)])
+        self.assertEqual(lines, {1: GUEST_CART_MAX_QUANTITY})
+        store.apply('b', [('add', 2, 1)])
+        store.apply('a', [('add', 3, 1)])   # a is now the most recent
+        store.apply('c', [('add', 4, 1)])
+        self.assertEqual((store.get('b'), len(store)), ({}, 2))
+        expired = InMemoryGuestCartStore(ttl=-1)
+        expired.apply('a', [('add', 1, 1)])
+        self.assertEqual(expired.pop('a'), {})
+
+    def test_merge_adds_to_existing_lines(self):
+        add_to_cart(self.user.user_id, self.kite.item_id, 1)
+        token = self.post([
+            {'op': 'add', 'item_id': self.kite.item_id, 'quantity': 2},
+            {'op': 'add', 'item_id': self.yoyo.item_id, 'quantity': 3},
+        ]).json()['token']
+        with connection.cursor() as cursor:   # an ORM delete would cascade into the unmanaged order_items
+            cursor.execute(f"DELETE FROM {connection.ops.quote_name('items')} WHERE item_id = %s", [self.yoyo.item_id])
+        response = self.api.post('/EcoMall/cart/guest/merge/', {
+            'user_id': self.user.user_id, 'guest_cart_token': token,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['merged'], [{'item_id': self.kite.item_id, 'quantity': 2}])
+        self.assertEqual(dict(Cart.objects.values_list('item_id', 'quantity')), {self.kite.item_id: 3})
+        self.assertEqual(self.store.get(token), {})
+
+    def test_failed_merge_keeps_the_guest_cart(self):
+        token = self.post([{'op': 'add', 'item_id': self.kite.item_id, 'quantity': 2}]).json()['token']
+        response = self.api.post('/EcoMall/cart/guest/merge/', {
+            'user_id': 999999, 'guest_cart_token': token,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.store.get(token), {self.kite.item_id: 2})
+        self.assertFalse(Cart.objects.exists())
+
+    def test_login_merges_the_guest_cart(self):
+        token = self.post([{'op': 'add', 'item_id': self.kite.item_id, 'quantity': 2}]).json()['token']
+        response = self.api.post('/EcoMall/login/', {
+            'email': self.user.email, 'password': 'x',
+        }, format='json', **{GUEST_CART_HEADER: token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['guest_cart_merged'], 1)
+        self.assertEqual(dict(Cart.objects.values_list('item_id', 'quantity')), {self.kite.item_id: 2})
+
+
+class OrderPlacementTests(UnmanagedTablesMixin, TransactionTestCase):
+    unmanaged_models = (Order, OrderItem)
+    WORKERS = 12
+    STOCK = 5
+
+    def setUp(self):
+        self.user = User.objects.create(
+            first_name='Test', last_name='User', email='order@example.com', mobile_number='9000000002', password='x',
+        )
+        category = Category.objects.create(category_name='Toys')
+        self.kite = Item.objects.create(
+            category=category, item_name='Kite', actual_price='200.00', discount_percentage='10.00',
+            stock_quantity=self.STOCK,
+        )
+        self.yoyo = Item.objects.create(
+            category=category, item_name='Yo-yo', actual_price='80.00', selling_price='75.00',
+            stock_quantity=self.STOCK,
+        )
+
+    def test_prices_and_total_come_from_the_database(self):
+        order, charges = place_order(self.user.user_id, [
+            {'item_id': self.kite.item_id, 'quantity': 2, 'price': '1.00'},
+            {'item_id': self.yoyo.item_id, 'quantity': 1},
+        ])
+        prices = dict(OrderItem.objects.filter(order=order).values_list('item_id', 'price'))
+        self.assertEqual(prices, {self.kite.item_id: Decimal('180.00'), self.yoyo.item_id: Decimal('75.00')})
+        self.assertEqual(order.total_price, order_charges(Decimal('435.00'))['total'])
+        self.assertEqual(charges['subtotal'], Decimal('435.00'))
+        self.kite.refresh_from_db()
+        self.assertEqual(self.kite.stock_quantity, self.STOCK - 2)
+
+    def test_rejected_order_writes_nothing(self):
+        with self.assertRaises(OutOfStock) as ctx:
+            place_order(self.user.user_id, [
+                {'item_id': self.kite.item_id, 'quantity': 1},
+                {'item_id': self.yoyo.item_id, 'quantity': self.STOCK + 1},
+            ])
+        self.assertEqual([i['item_id'] for i in ctx.exception.items], [self.yoyo.item_id])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Item.objects.get(pk=self.kite.pk).stock_quantity, self.STOCK)
+
+    def test_concurrent_checkouts_never_oversell(self):
+        if not concurrent_writes_supported():
+            self.skipTest('needs row locks, or SQLite with IMMEDIATE transactions on a file database')
+        placed, sold_out = [], []
+        counter = iter(range(self.WORKERS))
+        lock = threading.Lock()
+
+        def checkout():
+            with lock:
+                n = next(counter)
+            # Half the workers list the items in the opposite order
+            lines = [{'item_id': self.kite.item_id}, {'item_id': self.yoyo.item_id}]
+            try:
+                placed.append(place_order(self.user.user_id, lines if n % 2 else lines[::-1]))
+            except OutOfStock:
+                sold_out.append(n)
+
+        run_concurrently(self.WORKERS, checkout)
+
+        self.assertEqual(len(placed), self.STOCK)
+        self.assertEqual(len(sold_out), self.WORKERS - self.STOCK)
+        self.assertEqual(Order.objects.count(), self.STOCK)
+        self.assertEqual(OrderItem.objects.count(), 2 * self.STOCK)
+        self.assertEqual(
+            sorted(Item.objects.values_list('stock_quantity', flat=True)), [0, 0],
+        )
+
+
+class PaymentOutboxTests(UnmanagedTablesMixin, TransactionTestCase):
+    unmanaged_models = (Order, OrderItem, Payment)
+
+    def setUp(self):
+        self.fake = FakeRazorpay()
+        self.addCleanup(self.fake.close)
+        # Outbox-level retries only; the client's own retries are tested below
+        self.client_ = build_razorpay_client(self.fake.url, max_retries=0)
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(self.executor.shutdown)
+        self.user = User.objects.create(
+            first_name='Test', last_name='User', email='pay@example.com', mobile_number='9000000003', password='x',
+        )
+        category = Category.objects.create(category_name='Toys')
+        self.item = Item.objects.create(category=category, item_name='Drum', actual_price='600.00', stock_quantity=10)
+
+    def pending_payment(self):
+        order, charges = place_order(self.user.user_id, [{'item_id': self.item.item_id}])
+        return create_pending_payment(order, charges['total'])
+
+    def drain(self):
+        OutboxWorker(self.client_, self.executor).run(drain=True)
+
+    def make_due(self):
+        PaymentOutbox.objects.filter(status='pending').update(next_attempt_at=timezone.now())
+
+    def test_create_order_returns_before_the_provider_call(self):
+        with self.settings(ALLOWED_HOSTS=['testserver']):
+            response = APIClient().post(
+                '/EcoMall/create-order/', {'items': [{'item_id': self.item.item_id}]},
+                format='json', **bearer(self.user.user_id),
+            )
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.json()['status'], 'pending')
+            self.assertIsNone(response.json()['razorpay_order_id'])
+            self.assertEqual(self.fake.requests, [])
+
+            self.drain()
+            poll = APIClient().get(f"/EcoMall/payments/{response.json()['payment_id']}/").json()
+        self.assertEqual(poll['status'], 'ready')
+        order = self.fake.orders[poll['razorpay_order_id']]
+        self.assertEqual(order['amount'], int(Payment.objects.get().amount * 100))
+
+    def test_transient_failures_are_retried(self):
+        payment = self.pending_payment()
+        self.fake.fail_next = 2
+        self.drain()
+        entry = PaymentOutbox.objects.get()
+        self.assertEqual((entry.status, entry.attempts), ('pending', 1))
+        self.assertGreater(entry.next_attempt_at, timezone.now())
+        for _ in range(2):
+            self.make_due()
+            self.drain()
+        entry.refresh_from_db()
+        payment.refresh_from_db()
+        self.assertEqual(entry.status, 'done')
+        self.assertEqual(entry.attempts, 3)
+        self.assertIn(payment.provider_order_id, self.fake.orders)
+
+    def test_retry_after_lost_response_reuses_the_provider_order(self):
+        payment = self.pending_payment()
+        self.fake.lose_next = 1
+        self.drain()
+        self.make_due()
+        self.drain()
+        payment.refresh_from_db()
+        self.assertEqual(len(self.fake.orders), 1)
+        self.assertEqual(payment.provider_order_id, next(iter(self.fake.orders)))
+
+    def test_rejected_request_fails_the_payment(self):
+        payment = self.pending_payment()
+        self.fake.reject_next = 1
+        self.drain()
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'failed')
+        self.assertEqual(payment.error_code, 'PROVIDER_ORDER_FAILED')
+        self.assertIsNone(payment.provider_order_id)
+        self.assertEqual(PaymentOutbox.objects.get().status, 'failed')
+        self.assertEqual(Order.objects.get().order_status, 'failed')
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stock_quantity, 10)   # reservation released
+
+
+class IdempotencyKeyTests(UnmanagedTablesMixin, TransactionTestCase):
+    unmanaged_models = (Order, OrderItem, Payment)
+
+    def setUp(self):
+        idempotent_responses.clear()
+        self.addCleanup(idempotent_responses.clear)
+        self.user = User.objects.create(
+            first_name='Test', last_name='User', email='idem@example.com', mobile_number='9000000004', password='x',
+        )
+        category = Category.objects.create(category_name='Toys')
+        self.item = Item.objects.create(category=category, item_name='Top', actual_price='150.00', stock_quantity=10)
+        self.body = {'items': [{'item_id': self.item.item_id, 'quantity': 2}]}
+
+    def post(self, key, body=None):
+        with self.settings(ALLOWED_HOSTS=['testserver']):
+            return APIClient().post('/EcoMall/create-order/', body or self.body, format='json',
+                                    HTTP_IDEMPOTENCY_KEY=key, **bearer(self.user.user_id))
+
+    def test_retry_replays_the_first_response_without_writes(self):
+        first = self.post('checkout-1')
+        self.assertEqual(first.status_code, 202)
+        for clear_lru in (False, True):   # from this worker's LRU, then from the table
+            if clear_lru:
+                idempotent_responses.clear()
+            with CaptureQueriesContext(connection) as queries:
+                retry = self.post('checkout-1')
+            self.assertEqual((retry.status_code, retry.json()), (202, first.json()))
+            self.assertEqual(retry['Idempotent-Replayed'], 'true')
+            writes = [q['sql'] for q in queries if not q['sql'].lstrip().upper().startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))]
+            self.assertEqual(writes, [])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(PaymentOutbox.objects.count(), 1)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stock_quantity, 8)
+
+    def test_key_reused_for_a_different_request(self):
+        self.post('checkout-2')
+        other = self.post('checkout-2', dict(self.body, items=[{'item_id': self.item.item_id, 'quantity': 3}]))
+        self.assertEqual(other.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_client_errors_are_stored_too(self):
+        self.item.stock_quantity = 1
+        self.item.save()
+        self.assertEqual(self.post('checkout-3').status_code, 409)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 409)
+
+    @unittest.skipUnless(concurrent_writes_supported(), 'needs a database that serializes concurrent writers')
+    def test_concurrent_duplicates_run_once(self):
+        results = []
+        run_concurrently(6, lambda: results.append(self.post('checkout-4')))
+        self.assertEqual({r.status_code for r in results}, {202})
+        self.assertEqual(len({r.json()['payment_id'] for r in results}), 1)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(sum(r.has_header('Idempotent-Replayed') for r in results), 5)
+
+
+class ProviderClientTests(unittest.TestCase):
+    def setUp(self):
+        self.fake = FakeRazorpay()
+        self.addCleanup(self.fake.close)
+        self.fake.orders['order_1'] = {'id': 'order_1', 'receipt': 'payment-1', 'entity': 'order'}
+
+    def client(self, **options):
+        options.setdefault('backoff_base', 0.01)
+        return build_razorpay_client(self.fake.url, **options)
+
+    def test_idempotent_calls_are_retried(self):
+        client = self.client(max_retries=2)
+        self.fake.fail_next = 2
+        self.assertEqual(client.fetch_order('order_1')['id'], 'order_1')
+        self.assertEqual(len(self.fake.requests), 3)
+        latency = client.stats()['latency']['order.fetch']
+        self.assertEqual((latency['count'], latency['errors']), (3, 2))
+
+    def test_order_creation_is_not_retried(self):
+        client = self.client(max_retries=2)
+        self.fake.fail_next = 1
+        with self.assertRaises(razorpay.errors.ServerError):
+            client.create_order({'amount': 100, 'currency': 'INR', 'receipt': 'payment-2'})
+        self.assertEqual(len(self.fake.requests), 1)
+
+    def test_read_timeout(self):
+        client = self.client(max_retries=0, timeout=(1, 0.1))
+        self.fake.delay = 0.5
+        with self.assertRaises(requests.exceptions.Timeout):
+            client.fetch_order('order_1')
+
+    def test_breaker_opens_and_recovers(self):
+        client = self.client(max_retries=0, breaker=CircuitBreaker(threshold=2, reset_timeout=0.2))
+        self.fake.fail_next = 2
+        for _ in range(2):
+            with self.assertRaises(razorpay.errors.ServerError):
+                client.fetch_order('order_1')
+        self.assertEqual(client.stats()['breaker']['state'], 'open')
+        with self.assertRaises(CircuitOpen):
+            client.fetch_order('order_1')
+        self.assertEqual(len(self.fake.requests), 2)   # failed fast
+
+        time.sleep(0.25)
+        self.assertEqual(client.stats()['breaker']['state'], 'half_open')
+        self.assertEqual(client.orders_by_receipt('payment-1')[0]['id'], 'order_1')
+        self.assertEqual(client.stats()['breaker']['state'], 'closed')
+
+    def test_client_errors_do_not_trip_the_breaker(self):
+        client = self.client(max_retries=2, breaker=CircuitBreaker(threshold=1, reset_timeout=60))
+        with self.assertRaises(razorpay.errors.BadRequestError):
+            client.fetch_order('order_missing')
+        self.assertEqual(len(self.fake.requests), 1)
+        self.assertEqual(client.stats()['breaker']['state'], 'closed')
+
+
+class RazorpayWebhookTests(UnmanagedTablesMixin, TransactionTestCase):
+    unmanaged_models = (Order, OrderItem, Payment, RazorpayWebhookLog)
+    SECRET = 'whsec-test'
+
+    def setUp(self):
+        self.user = User.objects.create(
+            first_name='Test', last_name='User', email='hook@example.com', mobile_number='9000000005', password='x',
+        )
+        self.order = Order.objects.create(user=self.user, total_price='500.00', order_status='pending')
+        self.payment = Payment.objects.create(
+            order=self.order, amount='500.00', status='created', provider_order_id='order_hook1',
+        )
+
+    def deliver(self, event_type, event_id, signature=None, **payment):
+        body = json.dumps({
+            'event': event_type,
+            'payload': {'payment': {'entity': dict({'id': 'pay_1', 'order_id': 'order_hook1'}, **payment)}},
+        }).encode()
+        signature = signature or hmac.new(self.SECRET.encode(), body, hashlib.sha256).hexdigest()
+        with self.settings(ALLOWED_HOSTS=['testserver'], RAZORPAY_WEBHOOK_SECRET=self.SECRET):
+            return APIClient().post(
+                '/EcoMall/razorpay/webhook/', body, content_type='application/json',
+                HTTP_X_RAZORPAY_SIGNATURE=signature, HTTP_X_RAZORPAY_EVENT_ID=event_id,
+            )
+
+    def state(self):
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        return self.payment.status, self.order.order_status
+
+    def test_delivery_is_logged_and_applied_later(self):
+        self.assertEqual(self.deliver('payment.captured', 'evt_1', method='card',
+                                      card={'last4': '4242', 'network': 'Visa'}).status_code, 200)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'created')   # acknowledged before any processing
+
+        self.deliver('payment.captured', 'evt_1')           # redelivery
+        stats = WebhookWorker().run_once()
+        self.assertEqual((stats['applied'], stats['duplicates']), (1, 1))
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.captured), ('captured', True))
+        self.assertEqual((self.payment.card_last4, self.payment.card_network), ('4242', 'Visa'))
+        self.assertEqual(self.order.order_status, 'confirmed')
+        self.assertFalse(RazorpayWebhookLog.objects.filter(processed=False).exists())
+
+        self.deliver('payment.captured', 'evt_1')           # already applied in an earlier batch
+        self.assertEqual(WebhookWorker().run_once()['duplicates'], 1)
+
+    def test_bad_signature_is_rejected(self):
+        self.assertEqual(self.deliver('payment.captured', 'evt_2', signature='0' * 64).status_code, 400)
+        self.assertFalse(RazorpayWebhookLog.objects.exists())
+
+    def test_late_failure_does_not_downgrade_a_capture(self):
+        self.deliver('payment.captured', 'evt_3')
+        self.deliver('payment.failed', 'evt_4', error_code='BAD_REQUEST_ERROR')
+        stats = WebhookWorker().run_once()
+        self.assertEqual((stats['applied'], stats['stale']), (1, 1))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'captured')
+        self.assertIsNone(self.payment.error_code)
+
+    def test_capture_and_refund_in_one_batch(self):
+        self.deliver('payment.captured', 'evt_6')
+        self.deliver('refund.processed', 'evt_7')
+        stats = WebhookWorker().run_once()
+        self.assertEqual((stats['applied'], stats['stale']), (2, 0))
+        self.assertEqual(self.state(), ('refunded', 'confirmed'))
+
+    def test_replay_reapplies_a_time_range(self):
+        self.deliver('payment.captured', 'evt_5')
+        WebhookWorker().run_once()
+        Payment.objects.update(status='created', captured=False)   # e.g. restored from a backup
+        now = timezone.now()
+        totals = replay(now - timedelta(hours=1), now + timedelta(seconds=1))
+        self.assertEqual((totals['events'], totals['applied']), (1, 1))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'captured')
+        self.assertEqual(RazorpayWebhookEvent.objects.count(), 1)
+
+    def test_replay_command_rejects_impossible_dates(self):
+        for since in ('last week', '2024-02-30T00:00:00'):
+            with self.assertRaises(CommandError):
+                call_command('replay_webhooks', since=since)
+
+
+class ReconcilePaymentsTests(UnmanagedTablesMixin, TransactionTestCase):
+    unmanaged_models = (Order, OrderItem, Payment)
+
+    def setUp(self):
+        self.fake = FakeRazorpay()
+        self.addCleanup(self.fake.close)
+        self.client_ = build_razorpay_client(self.fake.url, max_retries=0)
+        self.user = User.objects.create(
+            first_name='Test', last_name='User', email='recon@example.com', mobile_number='9000000006', password='x',
+        )
+        self.payments = {}
+        for name in ('paid', 'declined', 'abandoned', 'refunded', 'recent'):
+            order = Order.objects.create(user=self.user, total_price='100.00', order_status='pending')
+            self.payments[name] = Payment.objects.create(
+                order=order, amount='100.00', status='created', provider_order_id=f'order_{name}',
+            )
+        Payment.objects.exclude(provider_order_id='order_recent').update(created_at=timezone.now() - timedelta(hours=2))
+        self.fake.payments = {
+            'order_paid': [
+                {'id': 'pay_a', 'status': 'failed', 'created_at': 1, 'error_code': 'BAD_REQUEST_ERROR'},
+                {'id': 'pay_b', 'status': 'captured', 'created_at': 2, 'method': 'card',
+                 'card': {'last4': '1111', 'network': 'Visa'}},
+            ],
+            'order_declined': [{'id': 'pay_c', 'status': 'failed', 'created_at': 1, 'error_code': 'GATEWAY_ERROR',
+                                'error_description': 'declined'}],
+            'order_refunded': [{'id': 'pay_d', 'status': 'refunded', 'created_at': 1, 'method': 'upi'}],
+            'order_recent': [{'id': 'pay_e', 'status': 'captured', 'created_at': 1}],
+        }
+
+    def run_reconcile(self, **options):
+        return reconcile(self.client_, workers=4, rate=1000, chunk_size=2, **options)
+
+    def status(self, name):
+        payment = Payment.objects.select_related('order').get(id=self.payments[name].id)
+        return payment.status, payment.order.order_status
+
+    def test_dry_run_writes_nothing(self):
+        stats = self.run_reconcile(dry_run=True)
+        self.assertEqual((stats['checked'], stats['captured'], stats['failed'], stats['unchanged']), (4, 2, 1, 1))
+        self.assertEqual(set(Payment.objects.values_list('status', flat=True)), {'created'})
+
+    def test_payments_without_attempts_expire(self):
+        stats = self.run_reconcile(expire_after=60 * 60)
+        self.assertEqual(stats['failed'], 2)
+        self.assertEqual(self.status('abandoned'), ('failed', 'failed'))
+        self.assertEqual(Payment.objects.get(id=self.payments['abandoned'].id).error_code, 'EXPIRED')
+        self.assertEqual(self.status('recent'), ('created', 'pending'))
+
+    def test_stale_payments_are_settled(self):
+        self.fake.throttle_next = 2
+        stats = self.run_reconcile()
+        self.assertEqual(stats['throttled'], 2)
+        self.assertEqual(stats['errors'], 0)
+        self.assertEqual(self.status('paid'), ('captured', 'confirmed'))
+        self.assertEqual(self.status('declined'), ('failed', 'failed'))
+        self.assertEqual(self.status('abandoned'), ('created', 'pending'))
+        self.assertEqual(self.status('refunded')[0], 'refunded')
+        self.assertEqual(self.status('recent'), ('created', 'pending'))   # not stale yet
+        paid = Payment.objects.get(id=self.payments['paid'].id)
+        self.assertEqual((paid.provider_payment_id, paid.method, paid.card_last4, paid.captured), ('pay_b', 'card', '1111', True))
+        self.assertIsNone(paid.error_code)
+        declined = Payment.objects.get(id=self.payments['declined'].id)
+        self.assertEqual((declined.error_code, declined.error_description), ('GATEWAY_ERROR', 'declined'))
+
+
+class PaymentTransitionTests(UnmanagedTablesMixin, TransactionTestCase):
+    unmanaged_models = (Order, OrderItem, Payment)
+
+    def setUp(self):
+        self.user = User.objects.create(
+            first_name='Test', last_name='User', email='state@example.com', mobile_number='9000000007', password='x',
+        )
+        self.order = Order.objects.create(user=self.user, total_price='250.00', order_status='pending')
+        self.payment = Payment.objects.create(
+            order=self.order, amount='250.00', status='created', provider_order_id='order_state1',
+            error_code='BAD_REQUEST_ERROR',
+        )
+
+    def post(self, path, body):
+        with self.settings(ALLOWED_HOSTS=['testserver']):
+            return APIClient().post(path, body, format='json')
+
+    def verify(self, payment_id='pay_state1'):
+        signature = hmac.new(
+            settings.RAZORPAY_KEY_SECRET.encode(), f'order_state1|{payment_id}'.encode(), hashlib.sha256,
+        ).hexdigest()
+        return self.post('/EcoMall/verify-payment/', {
+            'razorpay_order_id': 'order_state1', 'razorpay_payment_id': payment_id, 'razorpay_signature': signature,
+        })
+
+    def state(self):
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        return self.payment.status, self.order.order_status
+
+    def test_verify_captures_with_one_conditional_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.verify()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['order_id'], self.order.order_id)
+        self.assertEqual(self.state(), ('captured', 'confirmed'))
+        self.assertTrue(self.payment.captured)
+        self.assertIsNone(self.payment.error_code)
+        quote = connection.ops.quote_name
+        updates = [q['sql'] for q in queries if q['sql'].startswith(f"UPDATE {quote('payments')}")]
+        self.assertEqual(len(updates), 1)
+        self.assertIn(f"{quote('status')} IN", updates[0])   # guarded by the source statuses
+        self.assertNotIn(quote('amount'), updates[0])         # only the changed columns
+        self.assertEqual(self.verify().status_code, 200)  # a repeat is fine
+
+    def test_captured_payment_is_not_downgraded(self):
+        self.verify()
+        for path in ('/EcoMall/payment-failed/', '/EcoMall/payment-pending/'):
+            response = self.post(path, {'order_id': self.order.order_id})
+            self.assertEqual((response.status_code, response.json()['status']), (409, 'captured'))
+        self.assertEqual(self.state(), ('captured', 'confirmed'))
+
+    def test_failure_then_late_capture(self):
+        self.assertEqual(self.post('/EcoMall/payment-failed/', {'order_id': self.order.order_id}).status_code, 200)
+        self.assertEqual(self.state(), ('failed', 'failed'))
+        self.assertEqual(self.verify().status_code, 200)
+        self.assertEqual(self.state(), ('captured', 'confirmed'))
+
+    def test_failed_order_releases_its_stock(self):
+        category = Category.objects.create(category_name='Toys')
+        item = Item.objects.create(category=category, item_name='Ball', actual_price='50.00', stock_quantity=5)
+        order, charges = place_order(self.user.user_id, [{'item_id': item.item_id, 'quantity': 3}])
+        payment = Payment.objects.create(order=order, amount=charges['total'], status='created')
+
+        def stock():
+            item.refresh_from_db()
+            return item.stock_quantity
+
+        self.assertEqual(stock(), 2)
+        self.assertEqual(transition('failed', value=payment.id).moved, 1)
+        self.assertEqual(stock(), 5)
+        self.assertEqual(transition('failed', value=payment.id).moved, 0)   # a repeat releases nothing
+        self.assertEqual(stock(), 5)
+        transition('captured', value=payment.id)                            # late capture after all
+        self.assertEqual(stock(), 2)
+        order.refresh_from_db()
+        self.assertEqual(order.order_status, 'confirmed')
+
+    def test_refunded_payment_is_reported(self):
+        Payment.objects.update(status='refunded')
+        response = self.verify()
+        self.assertEqual((response.status_code, response.json()['status']), (409, 'refunded'))
+        self.assertEqual(self.post('/EcoMall/payment-pending/', {'order_id': 0}).status_code, 404)
+
+
+@unittest.skipUnless(Image, 'needs Pillow')
+class ImageDerivativeTests(ApiClientMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        source = tempfile.TemporaryDirectory()
+        cache = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.addCleanup(cache.cleanup)
+        self.source = source.name
+        self.cache = DerivativeCache(cache.name, max_bytes=1 << 20)
+        for patcher in (mock.patch('api.images.IMAGE_SOURCE_ROOT', self.source),
+                        mock.patch('api.views.derivative_cache', self.cache)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        Image.new('RGB', (800, 600), 'green').save(os.path.join(self.source, 'train.png'))
+
+    def test_variant_is_generated_then_revalidated(self):
+        response = self.api.get('/EcoMall/images/thumb/train.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as img:
+            self.assertEqual(img.size, (200, 150))
+        response = self.api.get('/EcoMall/images/thumb/train.png', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_or_outside_source_is_not_found(self):
+        self.assertEqual(self.api.get('/EcoMall/images/thumb/nope.png').status_code, 404)
+        self.assertEqual(self.api.get('/EcoMall/images/thumb/../tests.py').status_code, 404)
+        self.assertEqual(self.api.get('/EcoMall/images/huge/train.png').status_code, 404)
+
+    def test_corrupt_source_is_not_found(self):
+        with open(os.path.join(self.source, 'broken.png'), 'wb') as fh:
+            fh.write(b'not an image')
+        self.assertEqual(self.api.get('/EcoMall/images/thumb/broken.png').status_code, 404)
+
+    def test_truncated_source_is_not_found(self):
+        data = BytesIO()
+        Image.effect_noise((800, 600), 64).convert('RGB').save(data, format='JPEG')
+        with open(os.path.join(self.source, 'cut.jpg'), 'wb') as fh:
+            fh.write(data.getvalue()[:len(data.getvalue()) // 2])
+        self.assertEqual(self.api.get('/EcoMall/images/thumb/cut.jpg').status_code, 404)
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+    def test_decompression_bomb_is_not_found(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            self.assertEqual(self.api.get('/EcoMall/images/thumb/train.png').status_code, 404)
+
+    def test_variant_evicted_before_it_is_read(self):
+        target, digest, content_type = self.cache.get('train.png', 'thumb')
+        os.remove(target)
+        with mock.patch.object(self.cache, 'get', return_value=(target, digest, content_type)):
+            self.assertEqual(self.api.get('/EcoMall/images/thumb/train.png').status_code, 404)
+
+
+class CatalogExportTests(ApiClientMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(category_name='Toys')
+        self.items = [
+            Item.objects.create(category=category, item_name=name, actual_price='10.00')
+            for name in ('Wooden train', 'Kite', 'Yo-yo')
+        ]
+        self.since = timezone.now() + timedelta(days=1)
+        Item.objects.filter(item_id=self.items[1].item_id).update(updated_at=self.since + timedelta(hours=1))
+
+    def exported(self, **params):
+        response = self.api.get('/EcoMall/catalog/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_full_and_delta_export(self):
+        self.assertEqual([row['item_id'] for row in self.exported()], [item.item_id for item in self.items])
+        delta = self.exported(updated_since=self.since.isoformat())
+        self.assertEqual([row['item_name'] for row in delta], ['Kite'])
+
+    def test_malformed_or_impossible_updated_since_is_a_bad_request(self):
+        for value in ('yesterday', '2024-02-30T00:00:00', '2024-13-01T00:00:00'):
+            response = self.api.get('/EcoMall/catalog/export/', {'updated_since': value})
+            self.assertEqual(response.status_code, 400, value)
+
+    def test_command_rejects_impossible_updated_since(self):
+        for value in ('yesterday', '2024-02-30T00:00:00'):
+            with self.assertRaises(CommandError):
+                call_command('export_catalog', updated_since=value)
+
+    def test_command_writes_the_delta(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'catalog.csv')
+            call_command('export_catalog', format='csv', output=output, updated_since=self.since.isoformat(),
+                         stderr=StringIO())
+            with open(output, encoding='utf-8') as fh:
+                lines = fh.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Kite', lines[1])
+
+
+class RelatedItemsMathTests(unittest.TestCase):
+    def test_cooccurrence_counts_an_item_once_per_order(self):
+        # order 1: items 0, 1, 1 (two lines of item 1); order 2: items 1, 2
+        counts = cooccurrence(np.array([1, 1, 1, 2, 2]), np.array([0, 1, 1, 1, 2]), 4).toarray()
+        self.assertEqual(counts[1, 1], 2)
+        self.assertEqual((counts[0, 1], counts[1, 2], counts[0, 2]), (1, 1, 0))
+        self.assertTrue((counts == counts.T).all())
+        self.assertFalse(counts[3].any())
+
+    def test_top_related_ranks_by_cosine(self):
+        # 1 is always bought with 0; 2 once with 0, and three times alone
+        orders = [1, 1, 2, 2, 3, 3, 4, 5, 6]
+        items = [0, 1, 0, 1, 0, 2, 2, 2, 2]
+        counts = cooccurrence(np.array(orders), np.array(items), 3)
+        related = top_related(counts, [0, 1, 2], top_k=5)
+        self.assertEqual([rel for rel, _, _ in related[0]], [1, 2])
+        self.assertAlmostEqual(related[0][0][1], 2 / np.sqrt(3 * 2))
+        self.assertAlmostEqual(related[0][1][1], 1 / np.sqrt(3 * 4))
+        self.assertEqual(related[1], [(0, related[0][0][1], 2)])
+        self.assertEqual(len(top_related(counts, [0], top_k=1)[0]), 1)
+        self.assertEqual(top_related(counts, [0], top_k=5, min_count=2)[0], [(1, related[0][0][1], 2)])
+
+
+class BuildRelatedItemsTests(UnmanagedTablesMixin, TransactionTestCase):
+    unmanaged_models = (Order, OrderItem)
+
+    def setUp(self):
+        self.user = User.objects.create(
+            first_name='Test', last_name='User', email='related@example.com', mobile_number='9000000011', password='x',
+        )
+        category = Category.objects.create(category_name='Toys')
+        self.train, self.track, self.kite, self.string = (
+            Item.objects.create(category=category, item_name=name, actual_price='10.00')
+            for name in ('Train', 'Track', 'Kite', 'String')
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'related.npz')
+
+    def order(self, items, age, order_id=None):
+        order = Order.objects.create(order_id=order_id, user=self.user, total_price='10.00')
+        Order.objects.filter(order_id=order.order_id).update(created_at=timezone.now() - age)
+        for item in items:
+            OrderItem.objects.create(order=order, item=item, quantity=1, price='10.00')
+
+    def related(self, item):
+        return list(RelatedItem.objects.filter(item=item).order_by('rank').values_list('related_item_id', 'co_orders'))
+
+    def test_incremental_runs_fold_orders_once(self):
+        self.order([self.train, self.track], timedelta(hours=2))
+        with mock.patch('api.recommendations.RELATED_ITEMS_SETTLE_AFTER', 90 * 60):
+            stats = build_related_items(path=self.path)
+        self.assertEqual((stats['orders'], stats['order_lines']), (1, 2))
+        self.assertEqual(self.related(self.train), [(self.track.item_id, 1)])
+
+        self.order([self.train, self.track], timedelta(hours=1))
+        self.order([self.kite, self.string], timedelta(hours=1))
+        stats = build_related_items(path=self.path)
+        self.assertEqual(stats['orders'], 2)
+        self.assertEqual(self.related(self.train), [(self.track.item_id, 2)])
+        self.assertEqual(self.related(self.kite), [(self.string.item_id, 1)])
+
+        stats = build_related_items(path=self.path)   # nothing new: nothing counted twice
+        self.assertEqual(stats['order_lines'], 0)
+        self.assertEqual(self.related(self.train), [(self.track.item_id, 2)])
+
+        stats = build_related_items(full=True, path=self.path)
+        self.assertEqual(stats['orders'], 3)
+        self.assertEqual(self.related(self.train), [(self.track.item_id, 2)])
+        out = StringIO()
+        call_command('build_related_items', path=self.path, stdout=out)
+        self.assertIn('orders placed before', out.getvalue())
+
+    def test_order_committed_after_a_run_is_not_skipped(self):
+        # A higher order id is visible first; a lower one commits after the run
+        self.order([self.train, self.track], timedelta(hours=1))
+        self.order([self.train, self.kite], timedelta(seconds=30), order_id=100)
+        stats = build_related_items(path=self.path)
+        self.assertEqual(stats['orders'], 1)   # the recent order waits for the settle window
+        self.order([self.train, self.string], timedelta(seconds=60), order_id=50)
+
+        with mock.patch('api.recommendations.RELATED_ITEMS_SETTLE_AFTER', 0):
+            stats = build_related_items(path=self.path)
+        self.assertEqual(stats['orders'], 2)
+        self.assertEqual(
+            sorted(self.related(self.train)),
+            sorted([(self.track.item_id, 1), (self.kite.item_id, 1), (self.string.item_id, 1)]),
+        )
+
+
+class UserImportTests(TransactionTestCase):
+    HASHED = 'pbkdf2_sha256$1000$salt$already-hashed'   # passed through, not re-hashed
+
+    def setUp(self):
+        User.objects.create(
+            first_name='Old', last_name='User', email='Taken@example.com', mobile_number='9000000100', password='x',
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def row(self, n, **overrides):
+        row = {'first_name': 'User', 'last_name': str(n), 'email': f'user{n}@example.com',
+               'mobile_number': f'91000{n:05d}', 'password': self.HASHED}
+        row.update(overrides)
+        return row
+
+    def test_split_conflicts_against_the_table_and_the_chunk(self):
+        rows = [
+            self.row(1),
+            self.row(2, email='Taken@example.com'),
+            self.row(3, mobile_number='9000000100'),
+            self.row(4, email='USER1@example.com'),          # repeats row 1 (case-insensitively)
+            self.row(5),
+        ]
+        keep, conflicts = split_conflicts(rows)
+        self.assertEqual([row['last_name'] for row in keep], ['1', '5'])
+        self.assertEqual([reason for _, reason in conflicts], [
+            'email already exists', 'mobile_number already exists', 'email already exists',
+        ])
+
+    def test_insert_skips_rows_taken_after_the_check(self):
+        rows = [self.row(1), self.row(2, mobile_number='9000000100'), self.row(3)]
+        inserted, conflicts = insert_users(rows)
+        self.assertEqual(inserted, 2)
+        self.assertEqual([row['last_name'] for row, _ in conflicts], ['2'])
+        self.assertEqual(User.objects.count(), 3)
+
+    def write_csv(self, rows):
+        path = os.path.join(self.directory, 'users.csv')
+        with open(path, 'w', newline='', encoding='utf-8') as fh:
+            fh.write('first_name,last_name,email,mobile_number,password\n')
+            for row in rows:
+                fh.write(','.join(row[name] for name in
+                                  ('first_name', 'last_name', 'email', 'mobile_number', 'password')) + '\n')
+        return path
+
+    def import_users(self, path, **options):
+        call_command('import_users', path, chunk_size=2, workers=1, stderr=StringIO(), **options)
+
+    def test_interrupted_import_resumes_from_the_checkpoint(self):
+        rows = [self.row(n) for n in range(1, 6)]
+        rows[2]['email'] = 'Taken@example.com'
+        rows[4]['password'] = 'plaintext'
+        path = self.write_csv(rows)
+        rejects = os.path.join(self.directory, 'rejects.csv')
+
+        calls = []
+
+        def crash_on_second_chunk(chunk, batch_size):
+            calls.append(chunk)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return insert_users(chunk, batch_size)
+
+        with mock.patch('api.management.commands.import_users.insert_users', crash_on_second_chunk):
+            with self.assertRaises(KeyboardInterrupt):
+                self.import_users(path, reject_file=rejects)
+        self.assertEqual(User.objects.count(), 3)   # the first chunk
+        with open(path + '.checkpoint.json') as fh:
+            checkpoint = json.load(fh)
+        self.assertEqual((checkpoint['records'], checkpoint['complete']), (2, False))
+
+        self.import_users(path, reject_file=rejects)
+        self.assertEqual(User.objects.filter(first_name='User').count(), 4)
+        self.assertTrue(User.objects.get(email='user5@example.com').password.startswith('pbkdf2_sha256$'))
+        self.assertEqual(User.objects.get(email='user1@example.com').password, self.HASHED)
+        with open(rejects, encoding='utf-8') as fh:
+            self.assertEqual([line.split(',')[-1] for line in fh.read().splitlines()],
+                             ['reason', 'email already exists'])
+        with open(path + '.checkpoint.json') as fh:
+            checkpoint = json.load(fh)
+        self.assertEqual((checkpoint['records'], checkpoint['inserted'], checkpoint['complete']), (5, 4, True))
+
+        self.import_users(path)   # complete: nothing happens
+        self.assertEqual(User.objects.count(), 5)
+
+
+class MembershipFlagsTests(ApiClientMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create(
+            first_name='Test', last_name='User', email='flags@example.com', mobile_number='9000000012', password='x',
+        )
+        category = Category.objects.create(category_name='Toys')
+        self.train, self.kite = (
+            Item.objects.create(category=category, item_name=name, actual_price='10.00', is_new=True)
+            for name in ('Train', 'Kite')
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            add_to_cart(self.user.user_id, self.train.item_id, 1)
+            Wishlist.objects.create(user=self.user, item=self.kite)
+
+    def flags(self):
+        response = self.api.get('/EcoMall/items/new-arrivals/', {'user_id': self.user.user_id})
+        self.assertEqual(response.status_code, 200)
+        rows = response.json()
+        rows = rows['results'] if isinstance(rows, dict) else rows
+        return {row['item_id']: (row['in_cart'], row['in_wishlist']) for row in rows}
+
+    def test_flags_before_and_after_the_sets_are_cached(self):
+        expected = {self.train.item_id: (True, False), self.kite.item_id: (False, True)}
+        self.assertEqual(self.flags(), expected)   # EXISTS subqueries
+        self.api.get('/EcoMall/cart/', **bearer(self.user.user_id))
+        self.api.get('/EcoMall/wishlist/', **bearer(self.user.user_id))
+        self.assertEqual(get_membership('cart', self.user.user_id), {self.train.item_id})
+        self.assertEqual(get_membership('wishlist', self.user.user_id), {self.kite.item_id})
+        self.assertEqual(self.flags(), expected)   # from the cached sets
+
+    def test_change_invalidates_the_cached_set(self):
+        self.api.get('/EcoMall/cart/', **bearer(self.user.user_id))
+        with self.captureOnCommitCallbacks(execute=True):
+            add_to_cart(self.user.user_id, self.kite.item_id, 1)
+        self.assertIsNone(get_membership('cart', self.user.user_id))
+        self.assertEqual(self.flags()[self.kite.item_id], (True, True))
+
+    def test_read_racing_a_change_is_not_cached(self):
+        # The cart changes (and is invalidated) while a GET is reading the old rows
+        def read_then_change(queryset):
+            rows = cart_rows(queryset)
+            invalidate_membership('cart', self.user.user_id)
+            return rows
+
+        with mock.patch('api.views.cart_rows', read_then_change):
+            self.api.get('/EcoMall/cart/', **bearer(self.user.user_id))
+        self.assertIsNone(get_membership('cart', self.user.user_id))
+
+
+class CartSummaryCacheTests(ApiClientMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create(
+            first_name='Test', last_name='User', email='summary@example.com', mobile_number='9000000013', password='x',
+        )
+        category = Category.objects.create(category_name='Toys')
+        self.item = Item.objects.create(category=category, item_name='Train', actual_price='100.00', stock_quantity=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            add_to_cart(self.user.user_id, self.item.item_id, 2)
+
+    def summary(self):
+        response = self.api.get('/EcoMall/cart/summary/', {'user_id': self.user.user_id})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_summary_is_cached_until_the_cart_changes(self):
+        self.assertEqual((self.summary()['item_count'], self.summary()['subtotal']), (2, '200.00'))
+        with self.assertNumQueries(0):
+            self.summary()
+        with self.captureOnCommitCallbacks(execute=True):
+            add_to_cart(self.user.user_id, self.item.item_id, 1)
+        self.assertEqual(self.summary()['item_count'], 3)
+
+    def test_item_change_invalidates_the_summary(self):
+        self.assertFalse(self.summary()['has_out_of_stock'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.actual_price = Decimal('50.00')
+            self.item.stock_quantity = 1
+            self.item.save()
+        summary = self.summary()
+        self.assertEqual((summary['subtotal'], summary['has_out_of_stock']), ('100.00', True))
+
+    def test_summary_racing_a_change_is_not_cached(self):
+        def compute_then_change(user_id):
+            summary = cart_summary(user_id)
+            invalidate_cart_summary(user_id)   # the cart changed while we computed
+            return summary
+
+        with mock.patch('api.cache.cart_summary', compute_then_change):
+            get_cart_summary(self.user.user_id)
+        with mock.patch('api.cache.cart_summary', wraps=cart_summary) as recomputed:
+            get_cart_summary(self.user.user_id)
+        recomputed.assert_called_once()
+
+    def test_bad_user_id(self):
+        response = self.api.get('/EcoMall/cart/summary/', {'user_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.api.get('/EcoMall/cart/summary/').status_code, 400)
+
+
+def search_row(item_id, name, description='', category='Furniture', sub_category=None):
+    return {
+        'item_id': item_id, 'item_name': name, 'description': description, 'category__category_name': category,
+        'sub_category__sub_category_name': sub_category, 'updated_at': timezone.now(),
+    }
+
+
+class MenuTreeTests(ApiClientMixin, TestCase):
+    url = '/EcoMall/menu/tree/'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        main = MainCategory.objects.create(main_category_name='Eco Products')
+        self.category = Category.objects.create(main_category=main, category_name='Toys')
+        self.sub_category = SubCategory.objects.create(category=self.category, sub_category_name='Trains')
+
+    def etag_after(self, change):
+        before = self.api.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.api.get(self.url)
+        self.assertNotEqual(response['ETag'], before)
+        return response.json()
+
+    def test_tree_is_served_from_the_cache(self):
+        response = self.api.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['categories'][0]['sub_categories'][0]['sub_category_name'], 'Trains')
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(0):
+            again = self.api.get(self.url)
+        self.assertEqual((again.content, again['ETag']), (response.content, response['ETag']))
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.api.get(self.url)['ETag']
+        response = self.api.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual((response.content, response['ETag']), (b'', etag))
+        self.assertEqual(self.api.get(self.url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_category_changes_start_a_new_version(self):
+        def rename_category():
+            self.category.category_name = 'Toys & Games'
+            self.category.save()
+
+        def rename_sub_category():
+            self.sub_category.sub_category_name = 'Model trains'
+            self.sub_category.save()
+
+        self.etag_after(lambda: Category.objects.create(main_category=self.category.main_category,
+                                                        category_name='Garden'))
+        tree = self.etag_after(rename_category)
+        self.assertIn('Toys & Games', [c['category_name'] for c in tree[0]['categories']])
+        self.etag_after(lambda: SubCategory.objects.create(category=self.category, sub_category_name='Kites'))
+        tree = self.etag_after(rename_sub_category)
+        names = [s['sub_category_name'] for c in tree[0]['categories'] for s in c['sub_categories']]
+        self.assertIn('Model trains', names)
+
+
+class KeysetPaginationTests(ApiClientMixin, TestCase):
+    NAMES = ('Kite', 'Ball', 'Car', 'Ball', 'Car', 'Drum', 'Car')
+
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(category_name='Toys')
+        self.sub_category = SubCategory.objects.create(category=category, sub_category_name='Outdoor')
+        now = timezone.now()
+        for i, name in enumerate(self.NAMES):
+            item = Item.objects.create(category=category, sub_category=self.sub_category, item_name=name,
+                                       actual_price='10.00', best_sales=1, is_new=1)
+            # ties on created_at too: three items per timestamp
+            Item.objects.filter(pk=item.pk).update(created_at=now - timedelta(hours=i // 3))
+        self.items = list(Item.objects.values('item_id', 'item_name', 'created_at'))
+
+    def walk(self, url, page_size):
+        ids, url, params = [], url, {'page_size': page_size}
+        while url:
+            response = self.api.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertLessEqual(len(body['results']), page_size)
+            ids += [row['item_id'] for row in body['results']]
+            url, params = body['next'], None
+        return ids
+
+    def test_walks_visit_every_item_once_in_order(self):
+        by_name = [r['item_id'] for r in sorted(self.items, key=lambda r: (r['item_name'], r['item_id']))]
+        newest = [r['item_id'] for r in sorted(self.items, key=lambda r: (r['created_at'], r['item_id']), reverse=True)]
+        subcategory_url = f'/EcoMall/menu/subcategories/{self.sub_category.sub_category_id}/items/'
+        for page_size in (1, 2, 3, 7, 50):
+            self.assertEqual(self.walk('/EcoMall/items/best-sale/', page_size), by_name, page_size)
+            self.assertEqual(self.walk('/EcoMall/items/new-arrivals/', page_size), newest, page_size)
+            self.assertEqual(self.walk(subcategory_url, page_size), by_name, page_size)
+
+    def test_invalid_cursor_is_not_found(self):
+        cursor = self.api.get('/EcoMall/items/new-arrivals/', {'page_size': 2}).json()['next'].split('cursor=')[1]
+
+        def encode(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+        for bad in ('!!!', cursor[:-4], encode({'key': 1}), encode(['yesterday', 1]), encode([None, 1]),
+                    encode(['2024-01-01T00:00:00', 'x'])):
+            response = self.api.get('/EcoMall/items/new-arrivals/', {'cursor': bad})
+            self.assertEqual(response.status_code, 404, bad)
+            self.assertEqual(response.json()['detail'], 'Invalid cursor')
+
+    def test_unpaginated_response_is_unchanged(self):
+        response = self.api.get('/EcoMall/items/best-sale/')
+        items = Item.objects.order_by('item_id')
+        self.assertEqual(sorted(response.json(), key=lambda row: row['item_id']),
+                         json.loads(JSONRenderer().render(ItemMinimalSerializer(items, many=True).data)))
+        response = self.api.get(f'/EcoMall/menu/subcategories/{self.sub_category.sub_category_id}/items/')
+        self.assertIsInstance(response.json(), list)
+        self.assertEqual(set(response.json()[0]), {'item_id', 'item_name', 'selling_price', 'image'})
+
+
+class HomeFeedTests(ApiClientMixin, TestCase):
+    url = '/EcoMall/items/home-feed/'
+    SHELVES = (('best_sale', 'best-sale'), ('new_arrivals', 'new-arrivals'), ('trending', 'trending'))
+
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(category_name='Toys')
+        for i in range(15):
+            Item.objects.create(category=category, item_name=f'Toy {i % 5}', actual_price='10.00',
+                                best_sales=int(i % 2 == 0), is_new=int(i % 3 != 0), is_trending=int(i < 4))
+
+    def test_shelves_match_the_shelf_endpoints(self):
+        with self.assertNumQueries(1 if connection.features.supports_slicing_ordering_in_compound else 3):
+            feed = self.api.get(self.url).json()
+        for key, path in self.SHELVES:
+            shelf = self.api.get(f'/EcoMall/items/{path}/', {'page_size': HOME_FEED_DEFAULT_LIMIT}).json()
+            self.assertEqual(feed[key], shelf['results'], key)
+        self.assertEqual([len(feed[key]) for key, _ in self.SHELVES], [8, 10, 4])
+
+    def test_per_shelf_limits(self):
+        feed = self.api.get(self.url, {'best_sale_limit': 2, 'new_arrivals_limit': 0}).json()
+        self.assertEqual([len(feed[key]) for key, _ in self.SHELVES], [2, 0, 4])
+        best_sale = self.api.get('/EcoMall/items/best-sale/', {'page_size': 2}).json()['results']
+        self.assertEqual(feed['best_sale'], best_sale)
+
+    def test_invalid_limits(self):
+        for value in ('x', '', '-1', str(HOME_FEED_MAX_LIMIT + 1)):
+            response = self.api.get(self.url, {'trending_limit': value})
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn('trending_limit', response.json()['error'])
+        self.assertEqual(self.api.get(self.url, {'trending_limit': HOME_FEED_MAX_LIMIT}).status_code, 200)
+
+
+class SearchIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.index_rows([
+            search_row(1, 'Oak dining chair', 'Solid wood'),
+            search_row(2, 'Dining table', 'Seats six; pairs with our oak chair'),
+            search_row(3, 'Garden bench', 'Weatherproof teak'),
+            search_row(4, 'Chairside lamp', 'Warm light', category='Lighting'),
+        ])
+
+    def ids(self, query, **kwargs):
+        return [item_id for item_id, _ in self.index.search(query, **kwargs)]
+
+    def test_name_hits_outrank_description_hits(self):
+        self.assertEqual(self.ids('oak chair')[:2], [1, 2])
+        self.assertEqual(self.ids('oak'), [1, 2])   # in 1's name, in 2's description
+        self.assertEqual(self.ids('table'), [2])
+
+    def test_prefix_and_typo_matches(self):
+        self.assertEqual(self.ids('benc'), [3])              # prefix
+        self.assertEqual(self.ids('bnech'), [3])             # transposition
+        self.assertEqual(self.ids('gardn'), [3])             # deletion
+        self.assertEqual(self.ids('teek'), [3])              # substitution
+        self.assertEqual(self.ids('chair')[0], 1)            # exact beats the prefix hit on "chairside"
+        self.assertIn(4, self.ids('chair'))
+        self.assertEqual(self.ids('xyzzy'), [])
+        self.assertEqual(self.ids('   '), [])
+
+    def test_exact_hit_scores_above_a_typo(self):
+        exact = dict(self.index.search('bench'))[3]
+        typo = dict(self.index.search('bnech'))[3]
+        self.assertGreater(exact, typo)
+
+    def test_reindex_remove_and_snapshot(self):
+        self.index.index_rows([search_row(3, 'Garden swing', 'Weatherproof teak')])
+        self.assertEqual(self.ids('bench'), [])
+        self.assertEqual(self.ids('swing'), [3])
+        self.index.remove([3])
+        self.assertEqual(self.ids('teak'), [])
+        copy = SearchIndex.from_bytes(self.index.to_bytes())
+        self.assertEqual(len(copy), 3)
+        self.assertEqual(copy.watermark, self.index.watermark)
+        self.assertEqual(copy.search('oak chair'), self.index.search('oak chair'))
+        self.assertEqual(self.ids('oak', limit=1), [1])
+
+
+class ItemSearchViewTests(ApiClientMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(category_name='Furniture')
+        self.chair = Item.objects.create(category=category, item_name='Oak chair', actual_price='10.00')
+        self.table = Item.objects.create(category=category, item_name='Oak table', actual_price='20.00')
+        self.index = build_index()
+        patcher = mock.patch('api.views.get_search_index', return_value=self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_results_are_ranked_items(self):
+        response = self.api.get('/EcoMall/items/search/', {'q': 'chiar'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([row['item_id'] for row in results], [self.chair.item_id])
+        self.assertEqual(results[0]['item_name'], 'Oak chair')
+        self.assertGreater(results[0]['score'], 0)
+
+    def test_deleted_items_drop_out_of_the_index(self):
+        with connection.cursor() as cursor:   # behind the index's back: no signals
+            cursor.execute(f"DELETE FROM {connection.ops.quote_name('items')} WHERE item_id = %s", [self.table.item_id])
+        response = self.api.get('/EcoMall/items/search/', {'q': 'oak'})
+        self.assertEqual([row['item_id'] for row in response.json()['results']], [self.chair.item_id])
+        self.assertEqual(len(self.index), 1)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.api.get('/EcoMall/items/search/').status_code, 400)
+        self.assertEqual(self.api.get('/EcoMall/items/search/', {'q': 'oak', 'limit': 'x'}).status_code, 400)
+
+    def test_corrupt_snapshot_falls_back_to_a_rebuild(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'search_index.snapshot')
+            for data in (b'not zlib at all', zlib.compress(b'[1, 2]'), zlib.compress(b'{"format": 1}'),
+                         self.index.to_bytes()[:-8]):
+                with open(path, 'wb') as fh:
+                    fh.write(data)
+                with mock.patch('api.search.SEARCH_INDEX_PATH', path), mock.patch('api.search._index', None), \
+                        self.assertLogs('api.search', 'WARNING'):
+                    index = get_search_index()
+                self.assertEqual({item_id for item_id, _ in index.search('oak')},
+                                 {self.chair.item_id, self.table.item_id})
+
+
+class SubcategoryFacetsTests(ApiClientMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        category = Category.objects.create(category_name='Furniture')
+        self.chairs = SubCategory.objects.create(category=category, sub_category_name='Chairs')
+        other = SubCategory.objects.create(category=category, sub_category_name='Tables')
+
+        def item(name, price, sub_category=self.chairs, **fields):
+            fields.setdefault('stock_quantity', 5)
+            return Item.objects.create(category=category, sub_category=sub_category, item_name=name,
+                                       actual_price=price, selling_price=price, **fields)
+
+        self.stool = item('Stool', '100.00', discount_percentage='10.00')
+        self.rocker = item('Rocker', '300.00', is_new=1)
+        self.armchair = item('Armchair', '600.00', stock_quantity=0)
+        self.recliner = item('Recliner', '3000.00', is_trending=1)
+        item('Dining table', '900.00', sub_category=other)
+
+    def get(self, **params):
+        return self.api.get(f'/EcoMall/menu/subcategories/{self.chairs.sub_category_id}/items/', params)
+
+    def names(self, **params):
+        response = self.get(**params)
+        self.assertEqual(response.status_code, 200)
+        return [row['item_name'] for row in response.json()]
+
+    def test_facet_counts_cover_the_subcategory(self):
+        body = self.get(facets='1').json()
+        self.assertEqual(len(body['results']), 4)
+        facets = body['facets']
+        self.assertEqual(
+            {name: facets[name] for name in ('total', 'in_stock', 'discounted', 'new', 'trending')},
+            {'total': 4, 'in_stock': 3, 'discounted': 1, 'new': 1, 'trending': 1},
+        )
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [1, 1, 1, 0, 1])
+        self.assertEqual((facets['price'][0]['min'], facets['price'][-1]['max']), (0, None))
+
+    def test_filters(self):
+        self.assertEqual(self.names(min_price='200', max_price='1000'), ['Armchair', 'Rocker'])
+        self.assertEqual(self.names(min_price='200', max_price='1000', in_stock='1'), ['Rocker'])
+        self.assertEqual(self.names(discounted='true'), ['Stool'])
+        self.assertEqual(self.names(min_discount='5'), ['Stool'])
+        self.assertEqual(self.names(trending='1', new='1'), [])
+        # facet counts stay those of the whole subcategory
+        self.assertEqual(self.get(facets='1', in_stock='1').json()['facets']['total'], 4)
+
+    def test_invalid_filters(self):
+        for params in ({'min_price': 'abc'}, {'max_price': 'NaN'}, {'min_discount': 'Infinity'}):
+            response = self.get(**params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('must be a number', response.json()['error'])
+
+    def test_item_change_refreshes_the_cached_counts(self):
+        self.assertEqual(self.get(facets='1').json()['facets']['in_stock'], 3)
+        with self.assertNumQueries(1):   # the listing; the facets come from the cache
+            self.get(facets='1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.armchair.stock_quantity = 2
+            self.armchair.save()
+        self.assertEqual(self.get(facets='1').json()['facets']['in_stock'], 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recliner.sub_category = None   # moved out: the old subcategory is refreshed too
+            self.recliner.save()
+        self.assertEqual(self.get(facets='1').json()['facets']['total'], 3)
+
+
+class ItemBatchTests(ApiClientMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(category_name='Toys')
+        self.items = [
+            Item.objects.create(category=category, item_name=name, actual_price='10.00', description='Wooden')
+            for name in ('Train', 'Kite', 'Yo-yo')
+        ]
+
+    def batch(self, ids, **params):
+        return self.api.get('/EcoMall/items/batch/', {'ids': ids, **params})
+
+    def test_results_follow_the_requested_order_in_one_query(self):
+        train, kite, yoyo = (item.item_id for item in self.items)
+        with self.assertNumQueries(1):
+            response = self.batch(f'{yoyo},{train},999999,{yoyo}, {kite}')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([row['item_id'] for row in body['results']], [yoyo, train, kite])
+        self.assertEqual(body['missing'], [999999])
+        self.assertNotIn('description', body['results'][0])
+
+    def test_detail_fields(self):
+        body = self.batch(str(self.items[0].item_id), fields='detail').json()
+        self.assertEqual(body['results'][0]['description'], 'Wooden')
+
+    def test_bad_requests(self):
+        self.assertEqual(self.api.get('/EcoMall/items/batch/').status_code, 400)
+        self.assertEqual(self.batch('1,two').status_code, 400)
+        self.assertEqual(self.batch(','.join(str(n) for n in range(1, 102))).status_code, 400)
+        self.assertEqual(self.batch('1', fields='everything').status_code, 400)
+
+
+class ItemDetailCacheTests(ApiClientMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        item_detail_cache.clear()
+        self.addCleanup(item_detail_cache.clear)
+        category = Category.objects.create(category_name='Toys')
+        self.item = Item.objects.create(category=category, item_name='Train', actual_price='10.00')
+        self.url = f'/EcoMall/items/{self.item.item_id}/'
+
+    def test_conditional_get_answers_304_without_a_query(self):
+        response = self.api.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['item_name'], 'Train')
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertTrue(response['Last-Modified'])
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.api.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.api.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_change_invalidates_the_cached_entry(self):
+        etag = self.api.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.item_name = 'Steam train'
+            self.item.save()
+        response = self.api.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['item_name'], 'Steam train')
+
+    def test_unknown_item_and_stats_access(self):
+        self.assertEqual(self.api.get('/EcoMall/items/999999/').status_code, 404)
+        hits = item_detail_cache.stats()['hits']   # counters are process-wide
+        self.api.get(self.url)
+        self.api.get(self.url)
+        stats = item_detail_cache.stats()
+        self.assertEqual((stats['entries'], stats['hits'] - hits), (1, 1))
+        self.assertIn(self.api.get('/EcoMall/items/cache-stats/').status_code, (401, 403))
+
+
+class FastSerializationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(
+            first_name='Test', last_name='User', email='fast@example.com', mobile_number='9000000014', password='x',
+        )
+        category = Category.objects.create(category_name='Toys')
+        sub_category = SubCategory.objects.create(category=category, sub_category_name='Trains')
+        Item.objects.create(category=category, sub_category=sub_category, item_name='Train', actual_price='10.00',
+                            selling_price='9.5', image='toys/train.png')
+        Item.objects.create(category=category, item_name='Kite \u2028', actual_price='10.00')   # no price, no sub
+        for item in Item.objects.all():
+            Cart.objects.create(user=user, item=item, quantity=2)
+            Wishlist.objects.create(user=user, item=item)
+
+    def assertSameJSON(self, fast, serialized):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast), renderer.render(serialized))
+
+    def test_row_builders_match_the_serializers(self):
+        items = Item.objects.order_by('item_id')
+        self.assertSameJSON(item_minimal_rows(items), ItemMinimalSerializer(items, many=True).data)
+        carts = Cart.objects.order_by('cart_id')
+        self.assertSameJSON(cart_rows(carts), CartSerializer(carts, many=True).data)
+        wishlists = Wishlist.objects.order_by('wishlist_id')
+        self.assertSameJSON(wishlist_rows(wishlists), WishlistSerializer(wishlists, many=True).data)
+
+    def test_fast_renderer_matches_json_renderer(self):
+        rows = cart_rows(Cart.objects.order_by('cart_id'))
+        self.assertEqual(FastJSONRenderer().render(rows), JSONRenderer().render(rows))
+        # Types orjson would encode differently go through JSONRenderer
+        payload = {'price': Decimal('9.50'), 'at': timezone.now()}
+        self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload))
+
+
+class SignedTokenAuthTests(ApiClientMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create(
+            first_name='Test', last_name='User', email='token@example.com', mobile_number='9000000016', password='x',
+        )
+        self.other = User.objects.create(
+            first_name='Other', last_name='User', email='other@example.com', mobile_number='9000000017', password='x',
+        )
+        category = Category.objects.create(category_name='Toys')
+        item = Item.objects.create(category=category, item_name='Kite', actual_price='200.00')
+        add_to_cart(self.user.user_id, item.item_id, 2)
+
+    def login(self):
+        response = self.api.post('/EcoMall/login/', {'email': self.user.email, 'password': 'x'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def cart(self, token, **params):
+        return self.api.get('/EcoMall/cart/', params, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_login_issues_tokens_for_the_user(self):
+        tokens = self.login()
+        self.assertEqual((tokens['token_type'], tokens['expires_in']), ('Bearer', ACCESS_TOKEN_TTL))
+        self.assertEqual(verify_token(tokens['access']), self.user.user_id)
+        self.assertEqual(verify_token(tokens['refresh'], REFRESH), self.user.user_id)
+
+    def test_token_identifies_the_user(self):
+        access = self.login()['access']
+        response = self.cart(access)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['quantity'] for row in response.json()], [2])
+        self.assertEqual(self.cart(access, user_id=self.user.user_id).status_code, 200)
+        # A token cannot be used to act as someone else
+        self.assertEqual(self.cart(access, user_id=self.other.user_id).status_code, 403)
+
+    def test_bad_tokens_are_unauthorized(self):
+        tokens = self.login()
+        for token in ('not-a-token', tokens['access'][:-2] + 'xx', tokens['refresh']):
+            response = self.cart(token)
+            self.assertEqual(response.status_code, 401, token)
+            self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+        self.assertEqual(self.api.get('/EcoMall/cart/', HTTP_AUTHORIZATION='Bearer a b').status_code, 401)
+        with mock.patch('api.authentication.ACCESS_TOKEN_TTL', -1):
+            response = self.cart(tokens['access'])
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['detail'], 'Token expired')
+
+    def test_bare_user_id_is_refused_unless_tokens_are_optional(self):
+        for method, path, data in (
+            ('get', '/EcoMall/cart/', {'user_id': self.user.user_id}),
+            ('post', '/EcoMall/cart/', {'user_id': self.user.user_id, 'item_id': 1}),
+            ('get', '/EcoMall/wishlist/', {'user_id': self.user.user_id}),
+            ('post', '/EcoMall/create-order/', {'user_id': self.user.user_id, 'items': []}),
+        ):
+            response = getattr(self.api, method)(path, data, format='json')
+            self.assertEqual(response.status_code, 401, path)
+        with mock.patch('api.authentication.TOKEN_REQUIRED', False):
+            response = self.api.get('/EcoMall/cart/', {'user_id': self.user.user_id})
+        self.assertEqual(response.status_code, 200)
+
+    def test_register_issues_tokens(self):
+        response = self.api.post('/EcoMall/register/', {
+            'first_name': 'New', 'last_name': 'User', 'email': 'new@example.com',
+            'mobile_number': '9000000018', 'password': 'a-long-password',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(verify_token(response.json()['access']), response.json()['user']['user_id'])
+
+    def test_refresh(self):
+        tokens = self.login()
+        response = self.api.post('/EcoMall/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart(response.json()['access']).status_code, 200)
+        self.assertEqual(self.api.post('/EcoMall/token/refresh/', {}, format='json').status_code, 400)
+        # Access tokens cannot be traded in, nor can expired refresh tokens
+        response = self.api.post('/EcoMall/token/refresh/', {'refresh': tokens['access']}, format='json')
+        self.assertEqual(response.status_code, 401)
+        with mock.patch('api.authentication.REFRESH_TOKEN_TTL', -1):
+            response = self.api.post('/EcoMall/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.json(), {'error': 'Token expired'})
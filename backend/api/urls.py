@@ -3,17 +3,30 @@ from . import views
 from .views import (
     BestSaleItemList, NewArrivalItemList, TrendingItemList, ItemDetailView,
     CartListCreateView, CartItemView, WishlistListCreateView, WishlistItemView,
-    MainCategoryTree, ItemsBySubCategory
+    MainCategoryTree, ItemsBySubCategory, HomeFeedView, ItemSearchView,
+    ItemBatchView, ItemCacheStatsView, CartBatchView,
+    CartSummaryView, GuestCartView, GuestCartMergeView, RelatedItemsView,
+    ProviderStatsView
 )
 urlpatterns = [
     path('register/', views.register_user),
     path('login/', views.login_user),
+    path('token/refresh/', views.refresh_token, name='token-refresh'),
     path('items/best-sale/', BestSaleItemList.as_view(), name='best-sale-items'),
     path('items/new-arrivals/', NewArrivalItemList.as_view(), name='new-arrival-items'),
     path('items/trending/', TrendingItemList.as_view(), name='trending-items'),
+    path('items/home-feed/', HomeFeedView.as_view(), name='home-feed'),
+    path('items/search/', ItemSearchView.as_view(), name='item-search'),
+    path('items/batch/', ItemBatchView.as_view(), name='item-batch'),
     path('items/<int:item_id>/', ItemDetailView.as_view(), name='item-detail'),
+    path('items/<int:item_id>/related/', RelatedItemsView.as_view(), name='item-related'),
+    path('items/cache-stats/', ItemCacheStatsView.as_view(), name='item-cache-stats'),
     # cart
     path('cart/', CartListCreateView.as_view(), name='cart-list-create'),
+    path('cart/batch/', CartBatchView.as_view(), name='cart-batch'),
+    path('cart/summary/', CartSummaryView.as_view(), name='cart-summary'),
+    path('cart/guest/', GuestCartView.as_view(), name='guest-cart'),
+    path('cart/guest/merge/', GuestCartMergeView.as_view(), name='guest-cart-merge'),
     path('cart/<int:cart_id>/', CartItemView.as_view(), name='cart-item'),
     # wishlist
     path('wishlist/', WishlistListCreateView.as_view(), name='wishlist-list-create'),
@@ -24,9 +37,16 @@ urlpatterns = [
     # orders
     path("create-order/", views.create_order, name="create-order"),
     path('create-razorpay-order/', views.create_razorpay_order, name='create_razorpay_order'),
+    path('payments/<int:payment_id>/', views.payment_status, name='payment-status'),
+    path('payments/provider-stats/', ProviderStatsView.as_view(), name='provider-stats'),
     path('verify-payment/', views.verify_payment, name='verify_payment'),
     path('payment-pending/', views.payment_pending, name='payment_pending'),
     path('payment-failed/', views.payment_failed, name='payment_failed'),
+    path('razorpay/webhook/', views.razorpay_webhook, name='razorpay-webhook'),
     path('invoice/<int:order_id>/pdf/', views.invoice_pdf, name='invoice-pdf'),
+    # catalog feed
+    path('catalog/export/', views.catalog_export, name='catalog-export'),
+    # image derivatives
+    path('images/<str:variant>/<path:path>', views.image_derivative, name='image-derivative'),
   
 ]
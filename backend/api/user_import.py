@@ -0,0 +1,196 @@
+"""Bulk user import from CSV / NDJSON (see ``manage.py import_users``).
+
+Records are read as a stream and tagged with the byte offset just past
+them, so an interrupted import can resume from a checkpoint without
+re-reading the file. Password hashing - the expensive part - runs in a
+process pool; rows are written with ``bulk_create``, one chunk per
+transaction.
+"""
+import csv
+import io
+import json
+
+import django
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .models import User
+
+
+IMPORT_FIELDS = ('first_name', 'last_name', 'email', 'mobile_number', 'password')
+FORMATS = ('csv', 'ndjson')
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def detect_format(path):
+    return 'ndjson' if path.endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+
+
+def _lines(fh, offset, position):
+    """Decoded lines from a binary file, keeping ``position[0]`` at the byte
+    offset just past the last line handed out."""
+    position[0] = offset
+    for raw in fh:
+        line = raw.decode('utf-8')
+        if position[0] == 0:
+            line = line.lstrip('\ufeff')
+        position[0] += len(raw)
+        yield line
+
+
+def read_records(path, fmt, offset=0):
+    """Yield ``(record, end_offset)`` from ``offset`` on. ``record`` is a dict,
+    or a string describing why the line could not be parsed."""
+    with open(path, 'rb') as fh:
+        position = [0]
+        if fmt == 'csv':
+            header = next(csv.reader(_lines(fh, 0, position)), None)
+            if header is None:
+                return
+            offset = max(offset, position[0])
+            fh.seek(offset)
+            for row in csv.reader(_lines(fh, offset, position)):
+                if not row:
+                    continue
+                if len(row) != len(header):
+                    yield f'expected {len(header)} columns, got {len(row)}', position[0]
+                else:
+                    yield dict(zip(header, row)), position[0]
+        else:
+            fh.seek(offset)
+            for line in _lines(fh, offset, position):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield f'invalid JSON: {e}', position[0]
+                    continue
+                yield (record if isinstance(record, dict) else 'expected a JSON object'), position[0]
+
+
+def clean_record(record):
+    """Return ``(row dict, None)`` or ``(None, reason)``."""
+    if not isinstance(record, dict):
+        return None, record
+    row = {}
+    for name in IMPORT_FIELDS:
+        value = record.get(name)
+        value = '' if value is None else str(value).strip()
+        if not value:
+            return None, f'{name} is required'
+        max_length = User._meta.get_field(name).max_length
+        if name != 'password' and len(value) > max_length:
+            return None, f'{name} is longer than {max_length} characters'
+        row[name] = value
+    if '@' not in row['email']:
+        return None, 'email is not valid'
+    return row, None
+
+
+def init_worker():
+    """Process-pool initializer (needed where workers are spawned, not forked)."""
+    django.setup()
+
+
+def hash_passwords(passwords, hasher='default'):
+    """Hash plaintext passwords; values that already are Django hashes pass through."""
+    hashed = []
+    for password in passwords:
+        try:
+            identify_hasher(password)
+        except ValueError:
+            password = make_password(password, hasher=hasher)
+        hashed.append(password)
+    return hashed
+
+
+def _key(value):
+    return value.casefold()
+
+
+def existing_conflicts(rows):
+    """(emails, mobile numbers) among ``rows`` that are already taken, in one query."""
+    emails = [row['email'] for row in rows]
+    mobiles = [row['mobile_number'] for row in rows]
+    taken_emails, taken_mobiles = set(), set()
+    for email, mobile in User.objects.filter(Q(email__in=emails) | Q(mobile_number__in=mobiles)).values_list(
+        'email', 'mobile_number'
+    ):
+        taken_emails.add(_key(email))
+        taken_mobiles.add(mobile)
+    return taken_emails, taken_mobiles
+
+
+def split_conflicts(rows):
+    """Drop rows whose email / mobile number is taken, or repeats an earlier row
+    of the same chunk. Returns ``(rows to insert, [(row, reason), ...])``."""
+    taken_emails, taken_mobiles = existing_conflicts(rows)
+    keep, conflicts = [], []
+    for row in rows:
+        email = _key(row['email'])
+        if email in taken_emails:
+            conflicts.append((row, 'email already exists'))
+        elif row['mobile_number'] in taken_mobiles:
+            conflicts.append((row, 'mobile_number already exists'))
+        else:
+            taken_emails.add(email)
+            taken_mobiles.add(row['mobile_number'])
+            keep.append(row)
+    return keep, conflicts
+
+
+def insert_users(rows, batch_size=500):
+    """bulk_create ``rows`` in one transaction. If a concurrent writer took
+    one of the keys after the conflict check, the chunk is retried row by
+    row (each in a savepoint) so only the clashing rows are skipped.
+    Returns ``(inserted count, [(row, reason), ...])``.
+    """
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create([User(**row) for row in rows], batch_size=batch_size)
+        return len(rows), []
+    except IntegrityError:
+        pass
+    inserted, conflicts = 0, []
+    with transaction.atomic():
+        for row in rows:
+            try:
+                with transaction.atomic():
+                    User.objects.create(**row)
+                inserted += 1
+            except IntegrityError:
+                conflicts.append((row, 'email or mobile_number already exists'))
+    return inserted, conflicts
+
+
+class RejectWriter:
+    """CSV report of skipped records: offset, email, mobile_number, reason."""
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.writer = csv.writer(fh) if fh is not None else None
+
+    def write(self, offset, record, reason):
+        if self.writer is None:
+            return
+        record = record if isinstance(record, dict) else {}
+        self.writer.writerow([offset, record.get('email', ''), record.get('mobile_number', ''), reason])
+
+    @classmethod
+    def open(cls, path, append):
+        if not path:
+            return cls(None)
+        fh = io.open(path, 'a' if append else 'w', newline='', encoding='utf-8')
+        if fh.tell() == 0:
+            csv.writer(fh).writerow(['offset', 'email', 'mobile_number', 'reason'])
+        return cls(fh)
+
+    def flush(self):
+        if self.fh is not None:
+            self.fh.flush()
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
@@ -2,15 +2,36 @@ from django.shortcuts import render
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import generics, status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.views import APIView
-from .models import User, Item, Cart, Wishlist, MainCategory, Category, SubCategory, Order, OrderItem, Payment
+from .models import User, Item, Cart, Wishlist, Category, SubCategory, Order, Payment
 from .serializers import (
-    ItemMinimalSerializer, ItemDetailSerializer,
+    UserSerializer, ItemMinimalSerializer, ItemDetailSerializer,
     WishlistSerializer, CartSerializer,
-    MainCategoryNestedSerializer, CategoryWithSubsSerializer
+    CategoryWithSubsSerializer,
+    ITEM_MINIMAL_COLUMNS, item_minimal_from_values, item_minimal_rows,
+    cart_rows, wishlist_rows
 )
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Value
 from django.db import utils as db_utils
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from .cache import (
+    get_cart_summary, get_item_detail, get_membership, get_menu_tree, get_subcategory_facets, item_detail_cache,
+    membership_version, set_membership,
+)
+from .facets import InvalidFilter, item_filters
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+from .cart import CART_BATCH_MAX_OPERATIONS, CartOperationError, add_to_cart, apply_cart_operations, validate_cart_operations
+from .guest_cart import GuestCartFull, flush_guest_cart, get_guest_cart_store, new_token, token_from_request
+from .images import IMAGE_VARIANTS, derivative_url
+from .search import get_search_index
+from .recommendations import RELATED_ITEMS_TOP_K
+from .authentication import InvalidToken, SignedTokenAuthentication, issue_tokens, refresh_tokens, request_user_id
 
 
 
@@ -26,7 +47,10 @@ def register_user(request):
             "email": user.email,
             "mobile_number": user.mobile_number,
         }
-        return Response({"message": "User registered successfully", "user": user_data}, status=status.HTTP_201_CREATED)
+        return Response(
+            {"message": "User registered successfully", "user": user_data, **issue_tokens(user.user_id)},
+            status=status.HTTP_201_CREATED,
+        )
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 from django.contrib.auth.hashers import check_password
@@ -71,7 +95,12 @@ def login_user(request):
                 "email": user.email,
                 "mobile_number": user.mobile_number,
             }
-            return Response({"message": "Login successful", "user": user_data}, status=status.HTTP_200_OK)
+            response = {"message": "Login successful", "user": user_data, **issue_tokens(user.user_id)}
+            guest_token = token_from_request(request)
+            if guest_token:
+                # The guest cart is written to the Cart table only now
+                response["guest_cart_merged"] = len(flush_guest_cart(guest_token, user.user_id))
+            return Response(response, status=status.HTTP_200_OK)
         else:
             return Response({"error": "Invalid email or password"}, status=status.HTTP_401_UNAUTHORIZED)
     except Exception as e:
@@ -80,66 +109,471 @@ def login_user(request):
         return Response({"error": "Internal server error", "detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-# Best Sale Products
-class BestSaleItemList(generics.ListAPIView):
+@api_view(['POST'])
+def refresh_token(request):
+    """Trade a refresh token for a new access / refresh pair (no DB access).
+    Body: { refresh }
+    Returns: { access, refresh, token_type, expires_in }
+    """
+    token = request.data.get('refresh')
+    if not token:
+        return Response({"error": "refresh is required"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        return Response(refresh_tokens(token))
+    except InvalidToken as e:
+        return Response({"error": str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+
+
+def with_image_variant(request, rows):
+    """Swap each row's ``image`` for a derivative URL when ``?image=<variant>`` is given
+    (e.g. ``image=thumb`` for 200px cards)."""
+    variant = request.query_params.get('image')
+    if variant in IMAGE_VARIANTS:
+        for row in rows:
+            row['image'] = derivative_url(row['image'], variant)
+    return rows
+
+
+# flag -> (membership cache kind, model)
+MEMBERSHIP_FLAGS = {'in_cart': ('cart', Cart), 'in_wishlist': ('wishlist', Wishlist)}
+
+
+def listing_user_id(request):
+    """Optional ``?user_id=`` for per-user flags on listings; ValueError if malformed."""
+    user_id = request.query_params.get('user_id')
+    return int(user_id) if user_id else None
+
+
+def annotate_membership(queryset, user_id):
+    """Prepare ``in_cart`` / ``in_wishlist`` for a listing.
+
+    Flags whose membership set is cached are answered from the set; the
+    others are annotated as EXISTS subqueries on the listing query itself,
+    so they cost no extra round-trip. Returns ``(queryset, cached sets)``.
+    """
+    cached = {}
+    for flag, (kind, model) in MEMBERSHIP_FLAGS.items():
+        item_ids = get_membership(kind, user_id)
+        if item_ids is None:
+            queryset = queryset.annotate(**{
+                flag: Exists(model.objects.filter(user_id=user_id, item_id=OuterRef('item_id')))
+            })
+        else:
+            cached[flag] = item_ids
+    return queryset, cached
+
+
+def membership_flags(item_id, annotated, cached):
+    """``{'in_cart': bool, 'in_wishlist': bool}`` for one row; ``annotated`` maps the
+    EXISTS annotations (row dict or model instance via getattr)."""
+    return {
+        flag: item_id in cached[flag] if flag in cached else bool(annotated(flag))
+        for flag in MEMBERSHIP_FLAGS
+    }
+
+
+class ItemMinimalListView(generics.ListAPIView):
+    """Base for item listings. Produces ItemMinimalSerializer-shaped output straight
+    from values() rows instead of model instances + serializer fields.
+    With ``?user_id=`` each item also carries ``in_cart`` / ``in_wishlist``."""
     serializer_class = ItemMinimalSerializer
+    pagination_class = KeysetPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    keyset_ordering = 'item_id'
+
+    def list(self, request, *args, **kwargs):
+        try:
+            user_id = listing_user_id(request)
+        except ValueError:
+            return Response({"error": "user_id must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.filter_queryset(self.get_queryset())
+        key = self.keyset_ordering.lstrip('-')
+        columns = ITEM_MINIMAL_COLUMNS if key in ITEM_MINIMAL_COLUMNS else ITEM_MINIMAL_COLUMNS + (key,)
+        cached = {}
+        if user_id is not None:
+            queryset, cached = annotate_membership(queryset, user_id)
+            columns += tuple(flag for flag in MEMBERSHIP_FLAGS if flag not in cached)
+        page = self.paginate_queryset(queryset.values(*columns))
+        if page is None and user_id is None:
+            return Response(with_image_variant(request, item_minimal_rows(queryset)))
+        rows = queryset.values(*columns) if page is None else page
+        data = [item_minimal_from_values(row) for row in rows]
+        if user_id is not None:
+            for item, row in zip(data, rows):
+                item.update(membership_flags(row['item_id'], row.get, cached))
+        with_image_variant(request, data)
+        return Response(data) if page is None else self.get_paginated_response(data)
+
+
+# Best Sale Products
+class BestSaleItemList(ItemMinimalListView):
+    keyset_ordering = 'item_name'
 
     def get_queryset(self):
         return Item.objects.filter(best_sales=1)
 
 
 # New Arrivals
-class NewArrivalItemList(generics.ListAPIView):
-    serializer_class = ItemMinimalSerializer
+class NewArrivalItemList(ItemMinimalListView):
+    keyset_ordering = '-created_at'
 
     def get_queryset(self):
         return Item.objects.filter(is_new=1)
 
 
 # Popular Combos / Trending
-class TrendingItemList(generics.ListAPIView):
-    serializer_class = ItemMinimalSerializer
+class TrendingItemList(ItemMinimalListView):
+    keyset_ordering = 'item_name'
 
     def get_queryset(self):
         return Item.objects.filter(is_trending=1)
 
+# Home page shelves in one round-trip
+HOME_FEED_SHELVES = (
+    # (response key, filter, ordering) - same filters/orderings as the shelf views above
+    ('best_sale', {'best_sales': 1}, 'item_name'),
+    ('new_arrivals', {'is_new': 1}, '-created_at'),
+    ('trending', {'is_trending': 1}, 'item_name'),
+)
+HOME_FEED_DEFAULT_LIMIT = 12
+HOME_FEED_MAX_LIMIT = 50
+
+
+class HomeFeedView(APIView):
+    """Returns the best-sale, new-arrival and trending shelves together.
+    Query params: ``<shelf>_limit`` (0-50, default 12) per shelf, ``image=<variant>``;
+    a limit outside that range is a 400.
+    Response shape: { "best_sale": [...], "new_arrivals": [...], "trending": [...] }
+    with items in the ItemMinimalSerializer shape.
+    """
+    def get(self, request):
+        parts = []
+        for key, filters, ordering in HOME_FEED_SHELVES:
+            try:
+                limit = int(request.query_params.get(f'{key}_limit', HOME_FEED_DEFAULT_LIMIT))
+            except (TypeError, ValueError):
+                limit = -1
+            if not 0 <= limit <= HOME_FEED_MAX_LIMIT:
+                return Response(
+                    {"error": f"{key}_limit must be an integer from 0 to {HOME_FEED_MAX_LIMIT}"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            parts.append(
+                Item.objects.filter(**filters)
+                .order_by(ordering, 'item_id')
+                .annotate(shelf=Value(key))
+                .values(*ITEM_MINIMAL_COLUMNS, 'shelf')[:limit]
+            )
+
+        if connection.features.supports_slicing_ordering_in_compound:
+            # One UNION ALL statement; each branch is an index range scan
+            rows = list(parts[0].union(*parts[1:], all=True))
+        else:
+            rows = [row for part in parts for row in part]
+
+        data = {key: [] for key, _, _ in HOME_FEED_SHELVES}
+        for row in rows:
+            data[row['shelf']].append(item_minimal_from_values(row))
+        for shelf in data.values():
+            with_image_variant(request, shelf)
+        return Response(data)
+
+
+# Full-text search
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+
+class ItemSearchView(APIView):
+    """Ranked product search over names, descriptions and category names.
+    Query params: ``q`` (required), ``limit`` (default 20, max 100).
+    Matches by prefix and tolerates one typo per word.
+    Response shape: { "query": "...", "results": [ {...ItemMinimal, "score": 4.21}, ... ] }
+    """
+    def get(self, request):
+        query = (request.query_params.get('q') or '').strip()
+        if not query:
+            return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', SEARCH_DEFAULT_LIMIT))
+        except (TypeError, ValueError):
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+
+        index = get_search_index()
+        hits = index.search(query, limit=limit)
+        rows = {
+            row['item_id']: row
+            for row in Item.objects.filter(item_id__in=[item_id for item_id, _ in hits]).values(*ITEM_MINIMAL_COLUMNS)
+        }
+        # Items deleted behind the index's back (bulk deletes) heal here
+        stale = [item_id for item_id, _ in hits if item_id not in rows]
+        if stale:
+            index.remove(stale)
+
+        results = []
+        for item_id, score in hits:
+            if item_id in rows:
+                result = item_minimal_from_values(rows[item_id])
+                result['score'] = round(score, 4)
+                results.append(result)
+        return Response({"query": query, "results": results})
+
+
+# Many items in one request (cart / wishlist / recently-viewed rehydration)
+ITEM_BATCH_MAX = 100
+ITEM_BATCH_FIELD_SETS = {
+    # fields param -> (serializer, columns to load)
+    'minimal': (ItemMinimalSerializer, ITEM_MINIMAL_COLUMNS),
+    'detail': (ItemDetailSerializer, None),
+}
+
+
+class ItemBatchView(APIView):
+    """Returns many items with a single IN query.
+    Query params: ``ids`` (comma-separated, max 100), ``fields`` (minimal|detail, default minimal).
+    Response shape: { "results": [ ... in requested order ... ], "missing": [ids not found] }
+    """
+    def get(self, request):
+        raw_ids = request.query_params.get('ids') or ''
+        try:
+            ids = list(dict.fromkeys(int(part) for part in raw_ids.split(',') if part.strip()))
+        except ValueError:
+            return Response({"error": "ids must be a comma-separated list of integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if not ids:
+            return Response({"error": "ids is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > ITEM_BATCH_MAX:
+            return Response({"error": f"At most {ITEM_BATCH_MAX} ids per request"}, status=status.HTTP_400_BAD_REQUEST)
+
+        field_set = request.query_params.get('fields') or 'minimal'
+        if field_set not in ITEM_BATCH_FIELD_SETS:
+            return Response({"error": "fields must be one of: " + ", ".join(ITEM_BATCH_FIELD_SETS)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer_class, columns = ITEM_BATCH_FIELD_SETS[field_set]
+
+        queryset = Item.objects.all()
+        if columns:
+            queryset = queryset.only(*columns)
+        found = queryset.in_bulk(ids)
+        ordered = [found[item_id] for item_id in ids if item_id in found]
+        return Response({
+            "results": serializer_class(ordered, many=True).data,
+            "missing": [item_id for item_id in ids if item_id not in found],
+        })
+
+
 # Product detail by item_id
 class ItemDetailView(generics.RetrieveAPIView):
+    """Served from the per-process item cache in ``api.cache``. Responses carry an
+    ETag derived from ``updated_at``; a matching If-None-Match on a cached item
+    returns 304 without a query.
+    """
     queryset = Item.objects.all()
     serializer_class = ItemDetailSerializer
     lookup_field = 'item_id'
 
+    def retrieve(self, request, item_id):
+        entry = get_item_detail(item_id)
+        if entry is None:
+            return Response({"detail": "No Item matches the given query."}, status=status.HTTP_404_NOT_FOUND)
+        response = get_conditional_response(
+            request, etag=entry['etag'], last_modified=entry['last_modified']
+        )
+        if response is None:
+            response = HttpResponse(entry['body'], content_type='application/json')
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+class ItemCacheStatsView(APIView):
+    """Hit/miss counters of this worker's item detail cache (admin only)."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(item_detail_cache.stats())
+
+
+class ProviderStatsView(APIView):
+    """Payment provider circuit breaker state and per-call latency histograms
+    of this worker (admin only)."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(razorpay_client.stats())
+
+
+class RelatedItemsView(APIView):
+    """"Frequently bought together" for an item, precomputed offline by
+    ``manage.py build_related_items`` - a single indexed join per request.
+    Query params: ``limit`` (default 10), ``image=<variant>``.
+    Response: ItemMinimal-shaped items, best match first.
+    """
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    default_limit = 10
+
+    def get(self, request, item_id: int):
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, RELATED_ITEMS_TOP_K))
+        related = Item.objects.filter(related_to__item_id=item_id).order_by('related_to__rank')[:limit]
+        try:
+            return Response(with_image_variant(request, item_minimal_rows(related)))
+        except db_utils.OperationalError as e:
+            return Response({"error": "Database unavailable", "detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
 
 # -------------------- CART APIS --------------------
 class CartListCreateView(APIView):
+    """The user's cart. Authenticate with ``Authorization: Bearer <access token>``;
+    a bare ``user_id`` is still accepted from clients that do not send one."""
+    authentication_classes = [SignedTokenAuthentication]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
     def get(self, request):
-        user_id = request.query_params.get('user_id')
+        user_id = request_user_id(request, request.query_params.get('user_id'))
         if not user_id:
             return Response({"error": "user_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        version = membership_version('cart', user_id)   # before the read: see set_membership
         try:
-            items = Cart.objects.filter(user_id=user_id).select_related('item')
-            ser = CartSerializer(items, many=True)
-            return Response(ser.data)
+            rows = cart_rows(Cart.objects.filter(user_id=user_id))
         except db_utils.OperationalError as e:
             return Response({"error": "Database unavailable", "detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        # We have the whole cart anyway; remember it for the listing flags
+        set_membership('cart', user_id, (row['item'] for row in rows), version)
+        return Response(rows)
 
     def post(self, request):
-        user_id = request.data.get('user_id')
+        user_id = request_user_id(request, request.data.get('user_id'))
         item_id = request.data.get('item_id')
         quantity = int(request.data.get('quantity') or 1)
         if not user_id or not item_id:
             return Response({"error": "user_id and item_id are required"}, status=status.HTTP_400_BAD_REQUEST)
-        # Upsert on duplicate
+        # Upsert on duplicate: a single statement, safe under concurrent adds
         try:
-            obj, created = Cart.objects.get_or_create(user_id=user_id, item_id=item_id, defaults={'quantity': quantity})
-            if not created:
-                # Increment existing quantity
-                obj.quantity = int(obj.quantity or 0) + quantity
-                obj.save()
+            obj, created = add_to_cart(user_id, item_id, quantity)
             ser = CartSerializer(obj)
             return Response(ser.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+        except db_utils.IntegrityError:
+            return Response({"error": "Unknown user_id or item_id"}, status=status.HTTP_400_BAD_REQUEST)
+        except db_utils.OperationalError as e:
+            return Response({"error": "Database unavailable", "detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class CartSummaryView(APIView):
+    """Server-computed cart totals: line totals, subtotal, discount savings,
+    GST / fees, grand total and out-of-stock flags (one annotated query,
+    cached per user until the cart or one of its items changes).
+    Query params: ``user_id``.
+    """
+    def get(self, request):
+        user_id = request.query_params.get('user_id')
+        if not user_id:
+            return Response({"error": "user_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response(get_cart_summary(int(user_id)))
+        except ValueError:
+            return Response({"error": "user_id must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        except db_utils.OperationalError as e:
+            return Response({"error": "Database unavailable", "detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class CartBatchView(APIView):
+    """Applies many cart changes in one transaction.
+    Body: { user_id, operations: [ {op: "add"|"set"|"remove", item_id, quantity?}, ... ] }
+    Returns: { results: [per-operation outcome], cart: [...] }
+    If any operation is invalid nothing is applied and the results say which (400).
+    """
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def post(self, request):
+        user_id = request.data.get('user_id')
+        operations = request.data.get('operations')
+        if not user_id or not isinstance(operations, list) or not operations:
+            return Response({"error": "user_id and a non-empty operations list are required"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(operations) > CART_BATCH_MAX_OPERATIONS:
+            return Response({"error": f"At most {CART_BATCH_MAX_OPERATIONS} operations per request"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            results = apply_cart_operations(user_id, operations)
+            cart = cart_rows(Cart.objects.filter(user_id=user_id).order_by('cart_id'))
+        except CartOperationError as e:
+            return Response({"error": str(e), "results": e.results}, status=status.HTTP_400_BAD_REQUEST)
+        except db_utils.IntegrityError:
+            return Response({"error": "Unknown user_id"}, status=status.HTTP_400_BAD_REQUEST)
         except db_utils.OperationalError as e:
             return Response({"error": "Database unavailable", "detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({"results": results, "cart": cart})
+
+
+class GuestCartView(APIView):
+    """Cart for shoppers who are not logged in, held outside the database.
+    Token: ``X-Guest-Cart`` header (or ``guest_cart_token`` param); POST
+    without one starts a new cart and returns its token.
+    GET returns: { token, items: [{item_id, quantity, item_name, selling_price, image, ...}] }
+    POST body: { operations: [ {op: "add"|"set"|"remove", item_id, quantity?}, ... ] }
+    """
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def _payload(self, token, lines):
+        items = {row['item_id']: row for row in item_minimal_rows(Item.objects.filter(item_id__in=lines))}
+        return {
+            "token": token,
+            "items": [dict(items[item_id], quantity=qty) for item_id, qty in lines.items() if item_id in items],
+        }
+
+    def get(self, request):
+        token = token_from_request(request)
+        if not token:
+            return Response({"error": "guest cart token is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response(self._payload(token, get_guest_cart_store().get(token)))
+        except db_utils.OperationalError as e:
+            return Response({"error": "Database unavailable", "detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def post(self, request):
+        operations = request.data.get('operations')
+        if not isinstance(operations, list) or not operations:
+            return Response({"error": "a non-empty operations list is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(operations) > CART_BATCH_MAX_OPERATIONS:
+            return Response({"error": f"At most {CART_BATCH_MAX_OPERATIONS} operations per request"}, status=status.HTTP_400_BAD_REQUEST)
+        token = token_from_request(request) or new_token()
+        try:
+            parsed = validate_cart_operations(operations)
+            lines = get_guest_cart_store().apply(token, [(op, item_id, qty) for _, op, item_id, qty in parsed])
+            return Response(self._payload(token, lines))
+        except CartOperationError as e:
+            return Response({"error": str(e), "results": e.results}, status=status.HTTP_400_BAD_REQUEST)
+        except GuestCartFull as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except db_utils.OperationalError as e:
+            return Response({"error": "Database unavailable", "detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class GuestCartMergeView(APIView):
+    """Writes a guest cart into a user's cart (called at checkout; login does it too).
+    Body: { user_id, guest_cart_token }  (or the ``X-Guest-Cart`` header)
+    Returns: { merged: [{item_id, quantity}], cart: [...] }
+    """
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def post(self, request):
+        user_id = request.data.get('user_id')
+        token = token_from_request(request)
+        if not user_id or not token:
+            return Response({"error": "user_id and guest cart token are required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            merged = flush_guest_cart(token, user_id)
+            cart = cart_rows(Cart.objects.filter(user_id=user_id).order_by('cart_id'))
+        except db_utils.IntegrityError:
+            return Response({"error": "Unknown user_id"}, status=status.HTTP_400_BAD_REQUEST)
+        except db_utils.OperationalError as e:
+            return Response({"error": "Database unavailable", "detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({
+            "merged": [{"item_id": item_id, "quantity": qty} for item_id, qty in merged.items()],
+            "cart": cart,
+        })
 
 
 class CartItemView(APIView):
@@ -180,44 +614,91 @@ class MainCategoryTree(APIView):
       },
       ...
     ]
+
+    The tree is served pre-rendered from ``api.cache`` and revalidated with
+    ETag / Last-Modified, so most hits touch neither the DB nor a serializer.
     """
     def get(self, request):
-        mains = MainCategory.objects.prefetch_related(
-            'categories__sub_categories'
-        ).all().order_by('main_category_name')
-        data = MainCategoryNestedSerializer(mains, many=True).data
-        return Response(data)
+        tree = get_menu_tree()
+        response = get_conditional_response(
+            request, etag=tree['etag'], last_modified=tree['last_modified']
+        )
+        if response is None:
+            response = HttpResponse(tree['body'], content_type='application/json')
+        response['ETag'] = tree['etag']
+        response['Last-Modified'] = http_date(tree['last_modified'])
+        patch_cache_control(response, no_cache=True)
+        return response
 
 class ItemsBySubCategory(APIView):
-    """Returns all items under a specific subcategory"""
+    """Returns all items under a specific subcategory.
+    Pass ``page_size`` and/or ``cursor`` for keyset pagination, ``image=thumb``
+    for thumbnail URLs.
+
+    Filters: ``min_price``, ``max_price``, ``min_discount`` and the flags
+    ``in_stock``, ``discounted``, ``new``, ``trending`` (=1).
+    With ``user_id`` each item also carries ``in_cart`` / ``in_wishlist``.
+    With ``facets=1`` the response becomes ``{"facets": {...}, "results": [...]}``;
+    facet counts cover the whole subcategory and are served from ``api.cache``.
+    """
+    keyset_ordering = 'item_name'
+
     def get(self, request, sub_category_id: int):
-        items = Item.objects.filter(sub_category_id=sub_category_id).order_by('item_name')
-        data = [
-            {
+        try:
+            filters = item_filters(request.query_params)
+            user_id = listing_user_id(request)
+        except InvalidFilter as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({"error": "user_id must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        items = Item.objects.filter(filters, sub_category_id=sub_category_id).order_by('item_name')
+        cached = {}
+        if user_id is not None:
+            items, cached = annotate_membership(items, user_id)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(items, request, view=self)
+        data = []
+        for i in (items if page is None else page):
+            row = {
                 "item_id": i.item_id,
                 "item_name": i.item_name,
                 "selling_price": i.selling_price,
                 "image": i.image,
             }
-            for i in items
-        ]
-        return Response(data)
+            if user_id is not None:
+                row.update(membership_flags(i.item_id, lambda flag: getattr(i, flag), cached))
+            data.append(row)
+        with_image_variant(request, data)
+        if page is not None:
+            response = paginator.get_paginated_response(data)
+        elif request.query_params.get('facets') == '1':
+            response = Response({"results": data})
+        else:
+            return Response(data)
+        if request.query_params.get('facets') == '1':
+            response.data["facets"] = get_subcategory_facets(sub_category_id)
+        return response
 
 # -------------------- WISHLIST APIS --------------------
 class WishlistListCreateView(APIView):
+    """The user's wishlist; authentication as for CartListCreateView."""
+    authentication_classes = [SignedTokenAuthentication]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
     def get(self, request):
-        user_id = request.query_params.get('user_id')
+        user_id = request_user_id(request, request.query_params.get('user_id'))
         if not user_id:
             return Response({"error": "user_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        version = membership_version('wishlist', user_id)
         try:
-            items = Wishlist.objects.filter(user_id=user_id).select_related('item')
-            ser = WishlistSerializer(items, many=True)
-            return Response(ser.data)
+            rows = wishlist_rows(Wishlist.objects.filter(user_id=user_id))
         except db_utils.OperationalError as e:
             return Response({"error": "Database unavailable", "detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        set_membership('wishlist', user_id, (row['item'] for row in rows), version)
+        return Response(rows)
 
     def post(self, request):
-        user_id = request.data.get('user_id')
+        user_id = request_user_id(request, request.data.get('user_id'))
         item_id = request.data.get('item_id')
         if not user_id or not item_id:
             return Response({"error": "user_id and item_id are required"}, status=status.HTTP_400_BAD_REQUEST)
@@ -242,83 +723,77 @@ import hashlib
 import razorpay
 from decimal import Decimal
 from django.template.loader import render_to_string
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_datetime
+from django.utils.http import quote_etag
+from .export import FORMATS as EXPORT_FORMATS, export_stream
+from .idempotency import idempotent
+from .orders import OrderError, OutOfStock, place_order
+from .outbox import create_pending_payment, payment_state
+from .payments import transition
+from . import webhooks
+from .images import ImageNotFound, derivative_cache
 from xhtml2pdf import pisa
 from io import BytesIO
 from datetime import datetime
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_GET
-from rest_framework.decorators import api_view
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.decorators import api_view, authentication_classes
 from rest_framework.response import Response
 from rest_framework import status
 
 # Razorpay Client
-razorpay_client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+from .provider import razorpay_client
 
 
 @api_view(['POST'])
+@authentication_classes([SignedTokenAuthentication])
+@idempotent('create_order')
 def create_order(request):
-    """Creates a DB order with items and a corresponding Razorpay order.
-    Body: { user_id, items:[{item_id,quantity,price}], total_amount }
-    Returns: { order_id, razorpay_order_id, amount, currency }
+    """Creates a DB order with items and a pending payment; the Razorpay order
+    is created in the background (see ``api.outbox``).
+    Body: { user_id, items:[{item_id,quantity}] }
+    (``user_id`` comes from the bearer token when one is sent; item prices
+    and the total are computed server-side, client ``price`` / ``total_amount``
+    are ignored)
+    Returns (202): { order_id, payment_id, razorpay_order_id: null, amount, currency, status: "pending" }
+    then poll ``payments/<payment_id>/`` for ``razorpay_order_id``.
+    Errors: 400 invalid items, 409 not enough stock (``items`` says which).
+    Retries sent with the same ``Idempotency-Key`` header get the first
+    response back (see ``api.idempotency``).
     """
+    user_id = request_user_id(request, request.data.get("user_id"))
+    if not user_id:
+        return Response({"error": "user_id and items are required"}, status=status.HTTP_400_BAD_REQUEST)
     try:
-        user_id = request.data.get("user_id")
-        items = request.data.get("items") or []
-        total_amount = request.data.get("total_amount")
-
-        if not user_id or not items or total_amount is None:
-            return Response({"error": "user_id, items and total_amount are required"}, status=status.HTTP_400_BAD_REQUEST)
-
-        total_amount_dec = Decimal(str(total_amount))
-
-        # Create order (pending)
-        order = Order.objects.create(
-            user_id=user_id,
-            total_price=total_amount_dec,
-            order_status='pending'
-        )
-
-        # Create order items
-        for item in items:
-            OrderItem.objects.create(
-                order=order,
-                item_id=item.get("item_id"),
-                quantity=int(item.get("quantity") or 1),
-                price=Decimal(str(item.get("price") or 0))
-            )
-
-        # Create Razorpay Order (amount in paise)
-        razorpay_order = razorpay_client.order.create({
-            "amount": int(total_amount_dec * 100),
-            "currency": "INR",
-            "payment_capture": 1
-        })
-
-        # Save payment record
-        Payment.objects.create(
-            order=order,
-            provider_order_id=razorpay_order["id"],
-            amount=total_amount_dec,
-            status="created",
-            currency="INR"
-        )
-
-        return Response({
-            "order_id": order.order_id,
-            "razorpay_order_id": razorpay_order["id"],
-            "amount": float(total_amount_dec),
-            "currency": "INR",
-        }, status=status.HTTP_201_CREATED)
-    except Exception as e:
+        # One transaction: priced lines, order, bulk lines, stock, payment and outbox entry
+        with transaction.atomic():
+            order, charges = place_order(user_id, request.data.get("items"))
+            payment = create_pending_payment(order, charges['total'])
+    except OutOfStock as e:
+        return Response({"error": str(e), "items": e.items}, status=status.HTTP_409_CONFLICT)
+    except OrderError as e:
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except db_utils.IntegrityError:
+        return Response({"error": "Unknown user_id"}, status=status.HTTP_400_BAD_REQUEST)
+    except db_utils.OperationalError as e:
+        return Response({"error": "Database unavailable", "detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return Response(payment_state(payment), status=status.HTTP_202_ACCEPTED)
 
 
 # 1️⃣ Create Razorpay Order
 @csrf_exempt
 @api_view(['POST'])
+@idempotent('create_razorpay_order')
 def create_razorpay_order(request):
+    """Adds a payment to an existing order; the Razorpay order is created in
+    the background. Body: { order_id, amount }
+    Returns (202): { order_id, payment_id, razorpay_order_id: null, amount, currency, status: "pending" }
+    """
     try:
         data = request.data
         order_id = data.get('order_id')
@@ -328,34 +803,26 @@ def create_razorpay_order(request):
             return Response({'error': 'order_id and amount are required.'}, status=status.HTTP_400_BAD_REQUEST)
 
         order = get_object_or_404(Order, order_id=order_id)
-
-        razorpay_order = razorpay_client.order.create({
-            'amount': int(Decimal(str(amount)) * 100),
-            'currency': 'INR',
-            'receipt': str(order_id),
-            'payment_capture': 1
-        })
-
-        Payment.objects.create(
-            order=order,
-            provider_order_id=razorpay_order['id'],
-            amount=Decimal(str(amount)),
-            status="created",
-            currency='INR'
-        )
-
-        return Response({
-            'order_id': order_id,
-            'razorpay_order_id': razorpay_order['id'],
-            'amount': float(amount),
-            'currency': 'INR'
-        })
+        payment = create_pending_payment(order, Decimal(str(amount)))
+        return Response(payment_state(payment), status=status.HTTP_202_ACCEPTED)
+    except Http404:
+        raise
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+@api_view(['GET'])
+def payment_status(request, payment_id: int):
+    """Poll a payment created by create_order / create_razorpay_order.
+    Returns: { payment_id, order_id, status: "pending"|"ready"|"failed", razorpay_order_id, amount, currency }
+    """
+    payment = get_object_or_404(Payment, id=payment_id)
+    return Response(payment_state(payment))
+
 # 2️⃣ Verify & Capture Payment
 @csrf_exempt
 @api_view(['POST'])
+@idempotent('verify_payment')
 def verify_payment(request):
     try:
         data = request.data
@@ -373,35 +840,116 @@ def verify_payment(request):
             'razorpay_signature': razorpay_signature
         }
         try:
-            razorpay_client.utility.verify_payment_signature(params_dict)
+            razorpay_client.verify_payment_signature(params_dict)
         except razorpay.errors.SignatureVerificationError:
             return Response({'error': 'Payment verification failed'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # ✅ Update Payment
-        payment = Payment.objects.get(provider_order_id=razorpay_order_id)
-        payment.provider_payment_id = razorpay_payment_id
-        payment.status = "captured"
-        payment.captured = True
-        payment.save()
-
-        # ✅ Update Order
-        order = payment.order
-        order.order_status = "confirmed"
-        order.save()
+        # ✅ created/pending/authorized/failed -> captured, order -> confirmed; one conditional UPDATE each
+        result = transition('captured', key='provider_order_id', value=razorpay_order_id,
+                            provider_payment_id=razorpay_payment_id)
+        if result.status is None:
+            return Response({'error': 'Payment record not found'}, status=404)
+        if not result.moved and result.status != 'captured':
+            return Response({'error': f'Payment is already {result.status}', 'status': result.status},
+                            status=status.HTTP_409_CONFLICT)
 
         return Response({
             'success': True,
-            'order_id': order.order_id,
+            'order_id': result.order_id,
             'payment_id': razorpay_payment_id,
             'status': 'captured'
         })
 
-    except Payment.DoesNotExist:
-        return Response({'error': 'Payment record not found'}, status=404)
+    except db_utils.OperationalError as e:
+        return Response({'error': 'Database unavailable', 'detail': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
 
+@csrf_exempt
+@require_POST
+def razorpay_webhook(request):
+    """Razorpay webhook receiver: verify, log, acknowledge. The events are
+    applied by ``manage.py run_webhook_worker`` (see ``api.webhooks``)."""
+    secret = getattr(settings, 'RAZORPAY_WEBHOOK_SECRET', None)
+    if not secret:
+        return JsonResponse({"error": "Webhooks are not configured"}, status=503)
+    signature = request.headers.get('X-Razorpay-Signature')
+    if not webhooks.signature_valid(request.body, signature, secret):
+        return JsonResponse({"error": "Invalid signature"}, status=400)
+    try:
+        webhooks.log_event(request.body, signature, request.headers.get('X-Razorpay-Event-Id'))
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    except db_utils.OperationalError as e:
+        # Razorpay retries non-2xx deliveries
+        return JsonResponse({"error": "Database unavailable", "detail": str(e)}, status=503)
+    return JsonResponse({"status": "ok"})
+
+# -------- Image derivatives --------
+@require_GET
+def image_derivative(request, variant: str, path: str):
+    """Serve a resized/re-encoded variant of a stored image, generating it on first request."""
+    if variant not in IMAGE_VARIANTS:
+        raise Http404("Unknown image variant")
+    try:
+        target, digest, content_type = derivative_cache.get(path, variant)
+    except ImageNotFound:
+        raise Http404("Image not found")
+    etag = quote_etag(digest)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            fh = open(target, 'rb')
+        except FileNotFoundError:
+            # Evicted between get() and here
+            raise Http404("Image not found")
+        response = FileResponse(fh, content_type=content_type)
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=60 * 60 * 24)
+    return response
+
+
+# -------- Catalog export (feed partners) --------
+@require_GET
+def catalog_export(request):
+    """Stream the whole catalog, or the items changed since ``updated_since``.
+    Query params: ``format`` (ndjson|csv, default ndjson), ``updated_since`` (ISO-8601).
+    Gzipped on the fly when the client sends ``Accept-Encoding: gzip``.
+    If ``CATALOG_EXPORT_TOKEN`` is set, requests must send it as ``X-Export-Token``.
+    """
+    token = getattr(settings, 'CATALOG_EXPORT_TOKEN', None)
+    if token and not constant_time_compare(request.headers.get('X-Export-Token', ''), token):
+        return JsonResponse({"error": "Invalid export token"}, status=403)
+
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({"error": "format must be one of: " + ", ".join(EXPORT_FORMATS)}, status=400)
+    updated_since = None
+    if request.GET.get('updated_since'):
+        try:
+            # None when malformed; ValueError when well-formed but impossible (2024-02-30)
+            updated_since = parse_datetime(request.GET['updated_since'])
+        except ValueError:
+            updated_since = None
+        if updated_since is None:
+            return JsonResponse({"error": "updated_since must be an ISO-8601 datetime"}, status=400)
+        if timezone.is_naive(updated_since):
+            updated_since = timezone.make_aware(updated_since)
+
+    use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+    _, content_type, extension = EXPORT_FORMATS[fmt]
+    response = StreamingHttpResponse(
+        export_stream(fmt, updated_since=updated_since, gzip=use_gzip),
+        content_type=content_type,
+    )
+    if use_gzip:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Content-Disposition'] = f'attachment; filename="catalog.{extension}"'
+    return response
+
+
 # -------- Invoice PDF (xhtml2pdf) --------
 @require_GET
 def invoice_pdf(request, order_id: int):
@@ -557,22 +1105,28 @@ def invoice_pdf(request, order_id: int):
 @csrf_exempt
 @api_view(['POST'])
 def payment_pending(request):
+    """Marks the order's payment pending (only from a status that allows it; a
+    captured payment is never downgraded). Body: { order_id }
+    Returns 409 with the current ``status`` when the payment has moved on.
+    """
     try:
         order_id = request.data.get('order_id')
-        order = Order.objects.filter(order_id=order_id).first()
-        if not order:
-            return Response({'error': 'Order not found'}, status=404)
-
-        order.order_status = "pending"
-        order.save()
-
-        Payment.objects.filter(order=order).update(status="pending")
+        result = transition('pending', key='order_id', value=order_id)
+        if result.status is None:
+            if not Order.objects.filter(order_id=order_id).exists():
+                return Response({'error': 'Order not found'}, status=404)
+            return Response({'error': 'No payment for this order'}, status=404)
+        if not result.moved and result.status != 'pending':
+            return Response({'error': f'Payment is already {result.status}', 'status': result.status},
+                            status=status.HTTP_409_CONFLICT)
 
         return Response({
             'status': 'pending',
             'message': f'Payment for Order {order_id} is pending.'
         })
 
+    except db_utils.OperationalError as e:
+        return Response({'error': 'Database unavailable', 'detail': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
@@ -581,21 +1135,27 @@ def payment_pending(request):
 @csrf_exempt
 @api_view(['POST'])
 def payment_failed(request):
+    """Marks the order's payment failed (only from a status that allows it; a
+    captured payment is never downgraded). Body: { order_id }
+    Returns 409 with the current ``status`` when the payment has moved on.
+    """
     try:
         order_id = request.data.get('order_id')
-        order = Order.objects.filter(order_id=order_id).first()
-        if not order:
-            return Response({'error': 'Order not found'}, status=404)
-
-        order.order_status = "failed"
-        order.save()
-
-        Payment.objects.filter(order=order).update(status="failed")
+        result = transition('failed', key='order_id', value=order_id)
+        if result.status is None:
+            if not Order.objects.filter(order_id=order_id).exists():
+                return Response({'error': 'Order not found'}, status=404)
+            return Response({'error': 'No payment for this order'}, status=404)
+        if not result.moved and result.status != 'failed':
+            return Response({'error': f'Payment is already {result.status}', 'status': result.status},
+                            status=status.HTTP_409_CONFLICT)
 
         return Response({
             'status': 'failed',
             'message': f'Payment for Order {order_id} failed.'
         })
 
+    except db_utils.OperationalError as e:
+        return Response({'error': 'Database unavailable', 'detail': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
\ No newline at end of file
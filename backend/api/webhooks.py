@@ -0,0 +1,190 @@
+"""Razorpay webhooks: fast acknowledgement, batched processing.
+
+The endpoint only checks the ``X-Razorpay-Signature`` HMAC and appends the
+raw body to ``razorpay_webhook_logs`` - one INSERT - before answering, so
+Razorpay is acknowledged in milliseconds and never retries because we
+were slow. ``manage.py run_webhook_worker`` claims unprocessed rows in
+batches (``SKIP LOCKED``), drops events already applied (Razorpay delivers
+at least once; ``X-Razorpay-Event-Id`` identifies an event across
+deliveries), applies the payment transitions with one bulk UPDATE per
+target status (``payments.bulk_transition``) and marks the rows processed.
+
+``manage.py replay_webhooks`` runs the logged events of a time range
+through the same code again; the state machine makes that safe.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import RazorpayWebhookEvent, RazorpayWebhookLog
+from .payments import bulk_transition, provider_payment_columns
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_BATCH_SIZE = getattr(settings, 'WEBHOOK_BATCH_SIZE', 200)
+
+# event type: payment status it moves the payment to
+EVENT_TARGETS = {
+    'payment.authorized': 'authorized',
+    'payment.captured': 'captured',
+    'order.paid': 'captured',
+    'payment.failed': 'failed',
+    'refund.processed': 'refunded',
+}
+# Applied in this order within a batch: each step can only follow the ones before it
+TARGET_ORDER = ('authorized', 'failed', 'captured', 'refunded')
+
+
+def signature_valid(body, signature, secret):
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature or '')
+
+
+def log_event(body, signature, event_id):
+    """Append a verified delivery; the only work done before acknowledging."""
+    event = json.loads(body)
+    return RazorpayWebhookLog.objects.create(
+        event_type=str(event.get('event') or '')[:100],
+        payload_text=body.decode(),
+        headers=json.dumps({'X-Razorpay-Event-Id': event_id}),
+        signature=signature,
+        verified=True,
+        processed=False,
+    )
+
+
+def event_id_of(log):
+    try:
+        event_id = json.loads(log.headers or '{}').get('X-Razorpay-Event-Id')
+    except ValueError:
+        event_id = None
+    # Without the header, identical payloads are the same event
+    return event_id or 'sha256:' + hashlib.sha256(log.payload_text.encode()).hexdigest()
+
+
+def payment_change(event):
+    """``(target status, provider order id, {column: value})`` for an event, or None."""
+    target = EVENT_TARGETS.get(event.get('event'))
+    payload = event.get('payload') or {}
+    payment = (payload.get('payment') or {}).get('entity') or {}
+    order_id = payment.get('order_id') or ((payload.get('order') or {}).get('entity') or {}).get('id')
+    if not target or not order_id:
+        return None
+    return target, order_id, provider_payment_columns(payment, target)
+
+
+def apply_logs(logs, skip_seen=True):
+    """Apply a batch of log rows (in id order) and mark them processed.
+    Must run inside a transaction. Returns a stats dict."""
+    stats = {'events': len(logs), 'duplicates': 0, 'ignored': 0, 'applied': 0, 'stale': 0}
+    events, seen = [], set()
+    for log in logs:
+        event_id = event_id_of(log)
+        if event_id in seen:
+            stats['duplicates'] += 1
+            continue
+        seen.add(event_id)
+        events.append((event_id, log))
+    if skip_seen and events:
+        applied_before = set(
+            RazorpayWebhookEvent.objects.filter(event_id__in=[event_id for event_id, _ in events])
+            .values_list('event_id', flat=True)
+        )
+        stats['duplicates'] += len(applied_before)
+        events = [(event_id, log) for event_id, log in events if event_id not in applied_before]
+
+    # Every distinct status a payment reached in the batch, applied below in
+    # TARGET_ORDER so that e.g. a capture lands before the refund that needs it
+    by_target = {target: {} for target in TARGET_ORDER}
+    for event_id, log in events:
+        try:
+            change = payment_change(json.loads(log.payload_text))
+        except ValueError:
+            change = None
+        if change is None:
+            stats['ignored'] += 1
+            continue
+        target, order_id, columns = change
+        by_target[target].setdefault(order_id, {}).update(columns)   # later event wins
+    # A failure followed by a capture in the same batch: the capture stands
+    for order_id in set(by_target['failed']) & set(by_target['captured']):
+        del by_target['failed'][order_id]
+        stats['stale'] += 1
+
+    for target in TARGET_ORDER:
+        moved = bulk_transition(target, by_target[target])
+        stats['applied'] += len(moved)
+        stats['stale'] += len(by_target[target]) - len(moved)
+
+    RazorpayWebhookEvent.objects.bulk_create(
+        [RazorpayWebhookEvent(event_id=event_id, event_type=log.event_type, log_id=log.id) for event_id, log in events],
+        ignore_conflicts=True,
+    )
+    RazorpayWebhookLog.objects.filter(id__in=[log.id for log in logs]).update(processed=True)
+    return stats
+
+
+def process_batch(batch_size=WEBHOOK_BATCH_SIZE):
+    """Claim and apply up to ``batch_size`` unprocessed deliveries, oldest first."""
+    with transaction.atomic():
+        logs = list(
+            RazorpayWebhookLog.objects.select_for_update(skip_locked=True)
+            .filter(processed=False, verified=True).order_by('id')[:batch_size]
+        )
+        if not logs:
+            return None
+        return apply_logs(logs)
+
+
+def replay(since, until, batch_size=WEBHOOK_BATCH_SIZE):
+    """Re-apply every verified delivery logged in ``[since, until)``, in
+    keyset batches on id; events are not skipped for having been applied."""
+    totals = {}
+    after = 0
+    while True:
+        with transaction.atomic():
+            logs = list(
+                RazorpayWebhookLog.objects.select_for_update()
+                .filter(verified=True, created_at__gte=since, created_at__lt=until, id__gt=after)
+                .order_by('id')[:batch_size]
+            )
+            if not logs:
+                return totals
+            stats = apply_logs(logs, skip_seen=False)
+        after = logs[-1].id
+        for name, value in stats.items():
+            totals[name] = totals.get(name, 0) + value
+
+
+class WebhookWorker:
+    """Processes batches until stopped, sleeping when there is nothing to do."""
+
+    def __init__(self, batch_size=WEBHOOK_BATCH_SIZE, poll_interval=0.5):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+
+    def run_once(self):
+        try:
+            stats = process_batch(self.batch_size)
+        finally:
+            close_old_connections()
+        if stats:
+            logger.info('Webhooks: %s', stats)
+        return stats
+
+    def run(self, drain=False):
+        """Loop until ``stop()`` - or, with ``drain``, until nothing is left."""
+        while not self.stopping.is_set():
+            if not self.run_once():
+                if drain:
+                    return
+                self.stopping.wait(self.poll_interval)
+
+    def stop(self):
+        self.stopping.set()